@@ -0,0 +1,168 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+
+@dataclass
+class _PooledBrowser:
+    browser: Any  # browser_use.Browser
+    launched_at: float = field(default_factory=time.time)
+    uses: int = 0
+    active: int = 0
+    retired: bool = False
+
+
+class BrowserLease:
+    """
+    A browser borrowed from the pool for one task. Contexts opened through the
+    lease are private to the task and closed when the lease is returned.
+    """
+
+    def __init__(self, browser: Any):
+        self.browser = browser
+        self._agent_contexts: List[Any] = []
+        self._playwright_contexts: List[Any] = []
+
+    async def agent_context(self) -> Any:
+        """A fresh browser_use `BrowserContext` for an `Agent`."""
+        context = await self.browser.new_context()
+        self._agent_contexts.append(context)
+        return context
+
+    async def playwright_context(self, **kwargs) -> Any:
+        """A fresh Playwright `BrowserContext` on the same browser process."""
+        playwright_browser = await self.browser.get_playwright_browser()
+        context = await playwright_browser.new_context(**kwargs)
+        self._playwright_contexts.append(context)
+        return context
+
+    async def close(self) -> None:
+        for context in self._agent_contexts + self._playwright_contexts:
+            try:
+                await context.close()
+            except Exception as e:
+                print(f"關閉瀏覽器分頁環境失敗：{e}")
+        self._agent_contexts, self._playwright_contexts = [], []
+
+
+class BrowserPool:
+    """
+    Summary:
+        Pool of warm browser_use browsers shared by concurrent web tasks.
+
+        Each task leases a browser and opens its own contexts on it, so cookies
+        and storage never leak between tasks while the browser process stays
+        warm. A browser serves at most `contexts_per_browser` tasks at once and
+        is recycled after `max_uses` tasks or when it is found disconnected.
+        At most `max_browsers * contexts_per_browser` tasks run concurrently;
+        others wait for a free slot.
+
+    Args:
+        max_browsers (int): browser processes kept alive.
+        contexts_per_browser (int): tasks sharing one browser process at once.
+        max_uses (int): tasks served by a browser before it is restarted.
+        headless (bool): run browsers without a window.
+    """
+
+    def __init__(
+        self,
+        max_browsers: int = 2,
+        contexts_per_browser: int = 2,
+        max_uses: int = 20,
+        headless: bool = False,
+    ):
+        self._max_browsers: int = max_browsers
+        self._contexts_per_browser: int = contexts_per_browser
+        self._max_uses: int = max_uses
+        self._headless: bool = headless
+        self._browsers: List[_PooledBrowser] = []
+        self._changed: Optional[asyncio.Condition] = None
+        self._launches: int = 0
+        self._leases: int = 0
+
+    def _new_browser(self) -> Any:
+        from browser_use import Browser, BrowserConfig
+
+        return Browser(config=BrowserConfig(headless=self._headless))
+
+    async def _launch(self) -> _PooledBrowser:
+        browser = self._new_browser()
+        # start the process now so the task that leases it does not pay for it
+        await browser.get_playwright_browser()
+        self._launches += 1
+        return _PooledBrowser(browser=browser)
+
+    @staticmethod
+    def _is_healthy(pooled: _PooledBrowser) -> bool:
+        playwright_browser = getattr(pooled.browser, "playwright_browser", None)
+        return playwright_browser is not None and playwright_browser.is_connected()
+
+    async def _close(self, pooled: _PooledBrowser) -> None:
+        self._browsers.remove(pooled)
+        try:
+            await pooled.browser.close()
+        except Exception as e:
+            print(f"關閉瀏覽器失敗：{e}")
+
+    def _pick(self) -> Optional[_PooledBrowser]:
+        candidates = [
+            pooled
+            for pooled in self._browsers
+            if not pooled.retired and pooled.active < self._contexts_per_browser
+        ]
+        # fill busy browsers first so idle ones can be recycled
+        return max(candidates, key=lambda pooled: pooled.active, default=None)
+
+    async def _acquire(self) -> _PooledBrowser:
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        async with self._changed:
+            while True:
+                for pooled in list(self._browsers):
+                    if not pooled.retired and not self._is_healthy(pooled):
+                        pooled.retired = True
+                    if pooled.retired and pooled.active == 0:
+                        await self._close(pooled)
+                pooled = self._pick()
+                if pooled is None and len(self._browsers) < self._max_browsers:
+                    pooled = await self._launch()
+                    self._browsers.append(pooled)
+                if pooled is not None:
+                    pooled.active += 1
+                    pooled.uses += 1
+                    self._leases += 1
+                    return pooled
+                await self._changed.wait()
+
+    async def _release(self, pooled: _PooledBrowser) -> None:
+        async with self._changed:
+            pooled.active -= 1
+            if pooled.uses >= self._max_uses or not self._is_healthy(pooled):
+                pooled.retired = True
+            if pooled.retired and pooled.active == 0:
+                await self._close(pooled)
+            self._changed.notify_all()
+
+    @asynccontextmanager
+    async def lease(self) -> AsyncIterator[BrowserLease]:
+        pooled = await self._acquire()
+        lease = BrowserLease(pooled.browser)
+        try:
+            yield lease
+        finally:
+            await lease.close()
+            await self._release(pooled)
+
+    async def shutdown(self) -> None:
+        for pooled in list(self._browsers):
+            await self._close(pooled)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "browsers": len(self._browsers),
+            "active_tasks": sum(pooled.active for pooled in self._browsers),
+            "launches": self._launches,
+            "leases": self._leases,
+        }
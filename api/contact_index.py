@@ -0,0 +1,198 @@
+import base64
+import json
+import sqlite3
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_MAX_CHAR = "\U0010ffff"
+
+
+def name_key(name: str) -> str:
+    return unicodedata.normalize("NFKC", name).strip().casefold()
+
+
+def encode_cursor(sort_key: str, contact_id: str) -> str:
+    payload = json.dumps([sort_key, contact_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        sort_key, contact_id = json.loads(
+            base64.urlsafe_b64decode(cursor.encode("ascii"))
+        )
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    return sort_key, contact_id
+
+
+class ContactIndex:
+    """
+    Summary:
+        SQLite side table of the `email_contact` collection with secondary
+        indexes on the normalised name and email.
+
+        Chroma stays the store of embeddings; this table answers listing, prefix
+        search, lookups by name or email and the contact count without loading
+        every contact's metadata. Pages are keyset-paginated on (name, id), so
+        the cost of a page does not grow with the address book.
+
+    Args:
+        db_path (str): SQLite file of the index.
+    """
+
+    def __init__(self, db_path: str = "../data/contact_index.db"):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS contacts (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    name_key TEXT NOT NULL,
+                    email TEXT NOT NULL,
+                    email_key TEXT NOT NULL,
+                    description TEXT NOT NULL,
+                    content_hash TEXT
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS contacts_name ON contacts (name_key, id)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS contacts_email ON contacts (email_key)"
+            )
+        self._count: Optional[int] = None
+        # bumped on every write, lets in-memory views of the contacts know they are stale
+        self.version: int = 0
+
+    def count(self) -> int:
+        """Number of contacts, cached until the next write."""
+        with self._lock:
+            if self._count is None:
+                self._count = self._conn.execute(
+                    "SELECT COUNT(*) FROM contacts"
+                ).fetchone()[0]
+            return self._count
+
+    def upsert(self, contacts: Iterable[Tuple[str, Dict]]) -> None:
+        """Insert or replace (id, metadata) pairs."""
+        rows = [
+            (
+                contact_id,
+                metadata.get("name", ""),
+                name_key(metadata.get("name", "")),
+                metadata.get("email", ""),
+                name_key(metadata.get("email", "")),
+                metadata.get("description", ""),
+                metadata.get("content_hash"),
+            )
+            for contact_id, metadata in contacts
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO contacts "
+                "(id, name, name_key, email, email_key, description, content_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._count = None
+            self.version += 1
+
+    def delete(self, contact_ids: Iterable[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM contacts WHERE id = ?",
+                [(contact_id,) for contact_id in contact_ids],
+            )
+            self._count = None
+            self.version += 1
+
+    def replace_all(self, contacts: Iterable[Tuple[str, Dict]]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM contacts")
+            self._count = None
+            self.version += 1
+        self.upsert(contacts)
+
+    def hashes(self) -> Dict[str, Tuple[Optional[str], str]]:
+        """id -> (content_hash, email) of every contact, for diffing a full sync."""
+        with self._lock:
+            return {
+                contact_id: (content_hash, email)
+                for contact_id, content_hash, email in self._conn.execute(
+                    "SELECT id, content_hash, email FROM contacts"
+                )
+            }
+
+    def ids_by_name(self, name: str) -> List[str]:
+        """Ids of contacts named exactly `name`, found through the name index."""
+        with self._lock:
+            return [
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT id FROM contacts WHERE name_key = ? AND name = ?",
+                    (name_key(name), name),
+                )
+            ]
+
+    def ids_by_email(self, email: str) -> List[str]:
+        with self._lock:
+            return [
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT id FROM contacts WHERE email_key = ?", (name_key(email),)
+                )
+            ]
+
+    def page(
+        self,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        prefix: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """
+        Contacts ordered by name, optionally only those whose name or email starts
+        with `prefix`.
+
+        Returns:
+            Tuple: (contacts, cursor of the next page or None on the last page).
+        """
+        conditions: List[str] = []
+        params: List = []
+        if prefix:
+            key = name_key(prefix)
+            conditions.append(
+                "((name_key >= ? AND name_key < ?) OR (email_key >= ? AND email_key < ?))"
+            )
+            params += [key, key + _MAX_CHAR, key, key + _MAX_CHAR]
+        if cursor:
+            after_key, after_id = decode_cursor(cursor)
+            conditions.append("(name_key > ? OR (name_key = ? AND id > ?))")
+            params += [after_key, after_key, after_id]
+        sql = "SELECT id, name_key, name, description, email FROM contacts"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY name_key, id"
+        if limit is not None:
+            # one extra row tells whether there is a next page
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        next_cursor: Optional[str] = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+        contacts = [
+            {"name": name, "description": description, "email": email}
+            for _, _, name, description, email in rows
+        ]
+        return contacts, next_cursor
@@ -0,0 +1,136 @@
+import csv
+import hashlib
+import io
+import re
+import unicodedata
+import uuid
+from typing import Dict, List
+
+# CSV 欄位名稱對照，小寫比對
+CSV_COLUMNS: Dict[str, List[str]] = {
+    "name": ["name", "full name", "display name", "姓名", "名字", "名稱"],
+    "email": [
+        "email",
+        "e-mail",
+        "email address",
+        "e-mail address",
+        "電子郵件",
+        "信箱",
+        "郵件",
+    ],
+    "description": [
+        "description",
+        "note",
+        "notes",
+        "title",
+        "描述",
+        "說明",
+        "備註",
+        "職稱",
+    ],
+}
+
+
+def normalize_email(email: str) -> str:
+    return unicodedata.normalize("NFKC", email).strip().lower()
+
+
+def contact_id(email: str) -> str:
+    """Stable vector store id of a contact, derived from its normalised email."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"mailto:{normalize_email(email)}"))
+
+
+def contact_hash(name: str, description: str, email: str) -> str:
+    payload = "\x1f".join((name.strip(), description.strip(), normalize_email(email)))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def parse_csv_contacts(text: str) -> List[Dict[str, str]]:
+    """Contacts from a CSV file with a header row; rows without an email are skipped."""
+    reader = csv.DictReader(io.StringIO(text.lstrip("﻿")))
+    columns: Dict[str, str] = {}
+    for field in reader.fieldnames or []:
+        for key, aliases in CSV_COLUMNS.items():
+            if key not in columns and field.strip().lower() in aliases:
+                columns[key] = field
+    if "email" not in columns:
+        raise ValueError(f"CSV 缺少電子郵件欄位，可用欄位名稱：{CSV_COLUMNS['email']}")
+    contacts: List[Dict[str, str]] = []
+    for row in reader:
+        email = (row.get(columns["email"]) or "").strip()
+        if not email:
+            continue
+        contacts.append(
+            {
+                "name": (row.get(columns.get("name", "")) or "").strip() or email,
+                "description": (row.get(columns.get("description", "")) or "").strip(),
+                "email": email,
+            }
+        )
+    return contacts
+
+
+def _vcard_text(value: str) -> str:
+    # structured values (ORG) are joined by unescaped semicolons
+    parts = re.split(r"(?<!\\);", value)
+    unescaped = [
+        re.sub(
+            r"\\([,;\\nN])", lambda m: "\n" if m.group(1) in "nN" else m.group(1), part
+        )
+        for part in parts
+    ]
+    return " ".join(part.strip() for part in unescaped if part.strip())
+
+
+def parse_vcard_contacts(text: str) -> List[Dict[str, str]]:
+    """
+    Contacts from a vCard (2.1/3.0/4.0) file. FN is the name, the first EMAIL the
+    address, and NOTE, TITLE and ORG make up the description.
+    """
+    # folded lines continue with a leading space or tab
+    text = re.sub(r"\r?\n[ \t]", "", text.lstrip("﻿"))
+    contacts: List[Dict[str, str]] = []
+    card: Dict[str, List[str]] = {}
+    for line in text.splitlines():
+        if ":" not in line:
+            continue
+        key, value = line.split(":", 1)
+        # drop parameters (TYPE=...) and group prefixes (item1.EMAIL)
+        prop = key.split(";", 1)[0].split(".")[-1].upper()
+        if prop == "BEGIN" and value.strip().upper() == "VCARD":
+            card = {}
+        elif prop == "END" and value.strip().upper() == "VCARD":
+            emails = [_vcard_text(email) for email in card.get("EMAIL", [])]
+            if emails:
+                name = _vcard_text((card.get("FN") or [""])[0])
+                if not name and card.get("N"):
+                    # N is family;given;additional;prefix;suffix
+                    family, given = (card["N"][0].split(";") + [""])[:2]
+                    name = f"{_vcard_text(given)} {_vcard_text(family)}".strip()
+                description = "; ".join(
+                    _vcard_text(value)
+                    for prop in ("TITLE", "ORG", "NOTE")
+                    for value in card.get(prop, [])
+                    if value
+                )
+                contacts.append(
+                    {
+                        "name": name or emails[0],
+                        "description": description,
+                        "email": emails[0],
+                    }
+                )
+            card = {}
+        else:
+            card.setdefault(prop, []).append(value.strip())
+    return contacts
+
+
+def parse_contacts(text: str, file_name: str = "") -> List[Dict[str, str]]:
+    """Parse a contact export, vCard when it looks like one, CSV otherwise."""
+    if (
+        file_name.lower().endswith((".vcf", ".vcard"))
+        or "BEGIN:VCARD" in text[:1000].upper()
+    ):
+        return parse_vcard_contacts(text)
+    return parse_csv_contacts(text)
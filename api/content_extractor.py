@@ -0,0 +1,410 @@
+import asyncio
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import (
+    CancelledError,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    TimeoutError,
+)
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+TEXT_EXTENSIONS = [
+    ".txt",
+    ".csv",
+    ".tsv",
+    ".json",
+    ".jsonl",
+    ".xml",
+    ".md",
+    ".log",
+    ".yaml",
+    ".yml",
+]
+SPREADSHEET_EXTENSIONS = [".xlsx", ".xlsm"]
+TEXT_ENCODINGS = ["utf-8", "cp950", "big5"]
+# memory an extraction worker may allocate, beyond what it maps when it starts
+DEFAULT_MAX_MEMORY_BYTES = 1024 * 1024 * 1024
+
+
+def memory_limit_supported() -> bool:
+    """Whether worker processes can be capped with RLIMIT_AS (not on Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return False
+    return hasattr(resource, "RLIMIT_AS")
+
+
+def _mapped_bytes() -> int:
+    """Address space already mapped by this process, 0 where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+class ContentExtractor:
+    """
+    Summary:
+        Extracts the first `max_chars` characters of a file, reading only what is needed.
+
+        Text formats read the first bytes, PDFs the first pages and spreadsheets the
+        first rows of the first sheet. Other formats go through one shared MarkItDown
+        converter, but only if the file is smaller than `max_convert_bytes`.
+        Every extraction runs under `timeout` seconds, counted from the moment a
+        worker starts it; a file that exceeds its budget yields an empty string
+        instead of stalling the sync.
+
+        With `process_workers` > 0 the extraction runs on a process pool, so the
+        CPU-bound parsing uses all cores and never holds the caller's GIL or event
+        loop. The budget is enforced there: the worker that missed its deadline is
+        killed and the pool replaced, extractions caught in the broken pool are
+        resubmitted once. Each worker process may be capped at `max_memory_bytes`
+        through RLIMIT_AS, counted beyond what the forked worker already maps, and
+        a file that runs out of it yields an empty string. RLIMIT_AS only exists
+        on Unix; elsewhere, and on threads,
+        the cap cannot be enforced and whole-file conversion is instead limited
+        to files of at most an eighth of `max_memory_bytes`.
+
+        On threads the budget is best-effort, since a thread cannot be stopped:
+        the caller gets its empty string on time, but the thread keeps running.
+        Its pool is replaced so later files get fresh threads, and once
+        `max_abandoned_threads` threads are still stuck, extraction returns empty
+        strings right away until they finish.
+
+    Args:
+        max_chars (int): number of characters to extract.
+        max_pages (int): maximum number of PDF pages to read.
+        max_rows (int): maximum number of spreadsheet rows to read.
+        max_convert_bytes (int): size limit of files converted as a whole by MarkItDown.
+        timeout (float): time budget per file in seconds.
+        max_workers (int): threads available to run extractions.
+        process_workers (int): size of the process pool, 0 to run on threads.
+        max_memory_bytes (int, optional): memory each worker process may allocate, None for no cap.
+        max_abandoned_threads (int, optional): stuck threads tolerated, `max_workers` by default.
+    """
+
+    def __init__(
+        self,
+        max_chars: int = 200,
+        max_pages: int = 3,
+        max_rows: int = 50,
+        max_convert_bytes: int = 20 * 1024 * 1024,
+        timeout: float = 20.0,
+        max_workers: int = 4,
+        process_workers: int = 0,
+        max_memory_bytes: Optional[int] = None,
+        max_abandoned_threads: Optional[int] = None,
+    ):
+        self.max_chars: int = max_chars
+        self._max_pages: int = max_pages
+        self._max_rows: int = max_rows
+        self._max_convert_bytes: int = max_convert_bytes
+        self._timeout: float = timeout
+        self._max_workers: int = max_workers
+        self._process_workers: int = process_workers
+        self._max_memory_bytes: Optional[int] = max_memory_bytes
+        if max_memory_bytes and (process_workers <= 0 or not memory_limit_supported()):
+            # fail safe: without RLIMIT_AS only the input size can be bounded
+            print(
+                f"此環境無法限制擷取程序的記憶體（RLIMIT_AS），"
+                f"改為只轉換小於 {max_memory_bytes // 8} bytes 的檔案"
+            )
+            self._max_convert_bytes = min(max_convert_bytes, max_memory_bytes // 8)
+        self._max_abandoned_threads: int = (
+            max_workers if max_abandoned_threads is None else max_abandoned_threads
+        )
+        self._abandoned_threads: int = 0
+        self._executor: Optional[Executor] = None
+        self._executor_lock = threading.Lock()
+        # process pool workers report (task id, pid) here when they start a task
+        self._start_queue = None
+        self._started: Dict[int, int] = {}
+        self._task_ids = itertools.count()
+        self._markitdown = None
+        self._markitdown_lock = threading.Lock()
+        self._readers: Dict[str, Callable[[Path], str]] = {
+            **{suffix: self._read_text for suffix in TEXT_EXTENSIONS},
+            **{suffix: self._read_spreadsheet for suffix in SPREADSHEET_EXTENSIONS},
+            ".pdf": self._read_pdf,
+        }
+
+    def _worker_options(self) -> dict:
+        return {
+            "max_chars": self.max_chars,
+            "max_pages": self._max_pages,
+            "max_rows": self._max_rows,
+            "max_convert_bytes": self._max_convert_bytes,
+        }
+
+    def _get_executor(self) -> Executor:
+        with self._executor_lock:
+            if self._executor is None:
+                if self._process_workers > 0:
+                    if self._start_queue is None:
+                        self._start_queue = multiprocessing.Queue()
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self._process_workers,
+                        initializer=_init_worker,
+                        initargs=(
+                            self._worker_options(),
+                            self._max_memory_bytes,
+                            self._start_queue,
+                        ),
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self._max_workers,
+                        thread_name_prefix="ContentExtractor",
+                    )
+            return self._executor
+
+    def _submit(self, file_path: str) -> Tuple[Future, Executor, Optional[int]]:
+        executor = self._get_executor()
+        if self._process_workers > 0:
+            task_id = next(self._task_ids)
+            future = executor.submit(_extract_in_worker, task_id, file_path)
+            return future, executor, task_id
+        return executor.submit(self.extract_unbounded, file_path), executor, None
+
+    def _has_started(self, future: Future, task_id: Optional[int]) -> bool:
+        if task_id is None:
+            return future.running()
+        # a process pool future is "running" as soon as it is queued to a worker,
+        # only the worker's own report tells that it began
+        with self._executor_lock:
+            while True:
+                try:
+                    started_id, pid = self._start_queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._started[started_id] = pid
+            return task_id in self._started
+
+    def _forget(self, task_id: Optional[int]) -> None:
+        if task_id is not None:
+            with self._executor_lock:
+                self._started.pop(task_id, None)
+
+    def _too_many_abandoned(self) -> bool:
+        if self._process_workers > 0:
+            return False
+        with self._executor_lock:
+            return self._abandoned_threads >= self._max_abandoned_threads
+
+    def _release_abandoned(self, _: Future) -> None:
+        with self._executor_lock:
+            self._abandoned_threads -= 1
+
+    def _on_timeout(
+        self, future: Future, executor: Executor, task_id: Optional[int], file_path: str
+    ) -> None:
+        print(f"讀取檔案逾時 ({self._timeout}s)，略過內容：{file_path}")
+        with self._executor_lock:
+            replace = self._executor is executor
+            if replace:
+                self._executor = None
+            if task_id is None:
+                self._abandoned_threads += 1
+            pid = self._started.pop(task_id, None) if task_id is not None else None
+        if task_id is None:
+            # the thread cannot be stopped, it keeps its old pool and new work gets fresh threads
+            future.add_done_callback(self._release_abandoned)
+            if replace:
+                executor.shutdown(wait=False)
+            return
+        # the late result is of no use, retrieve it so it is not reported
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        if pid is not None:
+            try:
+                # TerminateProcess on Windows; the pool breaks and is replaced
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        if replace:
+            executor.shutdown(wait=False)
+
+    def _on_broken_pool(self, executor: Executor) -> None:
+        # a worker killed by the OS (e.g. out of memory) or by a missed deadline breaks the whole pool
+        with self._executor_lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def extract(self, file_path: str, retries: int = 1) -> str:
+        """
+        Extract the leading content of `file_path` within the time budget.
+        The budget starts when a worker picks the file up, not while it is queued.
+        """
+        if self._too_many_abandoned():
+            print(f"過多擷取執行緒逾時未結束，略過內容：{file_path}")
+            return ""
+        future, executor, task_id = self._submit(file_path)
+        deadline: Optional[float] = None
+        try:
+            while True:
+                if deadline is None and self._has_started(future, task_id):
+                    deadline = time.monotonic() + self._timeout
+                wait = (
+                    0.05 if deadline is None else max(0.0, deadline - time.monotonic())
+                )
+                try:
+                    return future.result(timeout=wait)
+                except TimeoutError:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        self._on_timeout(future, executor, task_id, file_path)
+                        return ""
+        except (BrokenProcessPool, CancelledError):
+            self._on_broken_pool(executor)
+            if retries <= 0:
+                raise
+            return self.extract(file_path, retries - 1)
+        finally:
+            self._forget(task_id)
+
+    async def aextract(self, file_path: str, retries: int = 1) -> str:
+        """Same as `extract`, awaiting the pool without blocking the event loop."""
+        if self._too_many_abandoned():
+            print(f"過多擷取執行緒逾時未結束，略過內容：{file_path}")
+            return ""
+        future, executor, task_id = self._submit(file_path)
+        wrapped = asyncio.wrap_future(future)
+        deadline: Optional[float] = None
+        try:
+            while not wrapped.done():
+                if deadline is None and self._has_started(future, task_id):
+                    deadline = time.monotonic() + self._timeout
+                if deadline is not None and time.monotonic() >= deadline:
+                    wrapped.add_done_callback(lambda f: f.cancelled() or f.exception())
+                    self._on_timeout(future, executor, task_id, file_path)
+                    return ""
+                wait = 0.05 if deadline is None else deadline - time.monotonic()
+                await asyncio.wait({wrapped}, timeout=max(0.0, wait))
+            if future.cancelled():
+                # cancelled by a pool reset, not by the caller
+                raise BrokenProcessPool("extraction cancelled by a pool reset")
+            return wrapped.result()
+        except BrokenProcessPool:
+            self._on_broken_pool(executor)
+            if retries <= 0:
+                raise
+            return await self.aextract(file_path, retries - 1)
+        finally:
+            self._forget(task_id)
+
+    def extract_unbounded(self, file_path: str) -> str:
+        """Extract without the time budget; the reading itself is still bounded."""
+        path = Path(file_path)
+        reader = self._readers.get(path.suffix.lower(), self._read_with_markitdown)
+        return reader(path)[: self.max_chars]
+
+    def _decode(self, data: bytes) -> str:
+        for encoding in TEXT_ENCODINGS:
+            # the cut may split a multi-byte character, allow trimming up to 3 bytes
+            for trim in range(4):
+                try:
+                    return data[: len(data) - trim].decode(encoding)
+                except UnicodeDecodeError:
+                    continue
+        return data.decode("utf-8", errors="replace")
+
+    def _read_text(self, path: Path) -> str:
+        # a character is at most 4 bytes in utf-8
+        with open(path, "rb") as f:
+            data = f.read(self.max_chars * 4)
+        return self._decode(data)
+
+    def _read_pdf(self, path: Path) -> str:
+        from pypdf import PdfReader
+
+        reader = PdfReader(path)
+        texts: list[str] = []
+        length = 0
+        for page in reader.pages[: self._max_pages]:
+            text = page.extract_text() or ""
+            texts.append(text)
+            length += len(text)
+            if length >= self.max_chars:
+                break
+        return "\n".join(texts)
+
+    def _read_spreadsheet(self, path: Path) -> str:
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            sheet = workbook.worksheets[0]
+            lines: list[str] = [f"## {sheet.title}"]
+            length = 0
+            for row in sheet.iter_rows(max_row=self._max_rows, values_only=True):
+                line = " | ".join("" if cell is None else str(cell) for cell in row)
+                lines.append(line)
+                length += len(line)
+                if length >= self.max_chars:
+                    break
+            return "\n".join(lines)
+        finally:
+            workbook.close()
+
+    def _get_markitdown(self):
+        with self._markitdown_lock:
+            if self._markitdown is None:
+                from markitdown import MarkItDown
+
+                self._markitdown = MarkItDown(enable_plugins=False)
+            return self._markitdown
+
+    def _read_with_markitdown(self, path: Path) -> str:
+        if path.stat().st_size > self._max_convert_bytes:
+            print(f"檔案過大，略過內容轉換：{path}")
+            return ""
+        result = self._get_markitdown().convert(str(path))
+        return result.text_content or ""
+
+
+# state of a process pool worker, created once per process by `_init_worker`
+_worker_extractor: Optional[ContentExtractor] = None
+
+
+_worker_start_queue = None
+
+
+def _init_worker(options: dict, max_memory_bytes: Optional[int], start_queue) -> None:
+    global _worker_extractor, _worker_start_queue
+    if max_memory_bytes and memory_limit_supported():
+        import resource
+
+        # a forked worker starts with the parent's mappings, only new ones are capped
+        limit = _mapped_bytes() + max_memory_bytes
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError) as e:
+            print(f"無法限制擷取程序的記憶體：{e}")
+    _worker_extractor = ContentExtractor(**options)
+    _worker_start_queue = start_queue
+
+
+def _extract_in_worker(task_id: int, file_path: str) -> str:
+    _worker_start_queue.put((task_id, os.getpid()))
+    try:
+        return _worker_extractor.extract_unbounded(file_path)
+    except MemoryError:
+        print(f"擷取超過記憶體上限，略過內容：{file_path}")
+        return ""
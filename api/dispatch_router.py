@@ -0,0 +1,318 @@
+import math
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+
+TASKS = ("web", "filesystem", "recorder")
+
+# 每類任務的關鍵字規則；同時符合多類時交給後面的層級判斷
+# 「搜尋」、「查詢」、search 也常指本機檔案，不足以判斷任務，不列入
+KEYWORD_RULES: Dict[str, List[str]] = {
+    "recorder": [
+        r"錄製",
+        r"示範",
+        r"教你",
+        r"學起來",
+        r"學習我的操作",
+        r"\brecord(ing)?\b",
+        r"\bdemonstrat",
+        r"\bwatch me\b",
+    ],
+    "filesystem": [
+        r"寄給",
+        r"寄送",
+        r"傳給",
+        r"電腦(裡|中|上)的",
+        r"本機",
+        r"資料夾",
+        r"\bsend\b.*\bto\b",
+        r"\battach",
+        r"\bemail\b.*\bto\b",
+        r"\blocal file",
+    ],
+    "web": [
+        r"下載",
+        r"網站",
+        r"網頁",
+        r"上網",
+        r"\bdownload\b",
+        r"\bwebsite\b",
+        r"\bbrowse",
+        r"https?://",
+    ],
+}
+
+
+def normalize_query(query: str) -> str:
+    query = unicodedata.normalize("NFKC", query).lower().strip()
+    query = re.sub(r"\s+", " ", query)
+    return query.rstrip("。.!！?？ ")
+
+
+@dataclass
+class RouteDecision:
+    task: str
+    source: str  # "cache" | "rules" | "centroid" | "llm"
+    # measured from the evidence of the tier, None when the tier gives none (LLM)
+    confidence: Optional[float]
+
+
+class DispatchRouter:
+    """
+    Summary:
+        Tiered router in front of the dispatcher LLM.
+
+        1. exact cache of normalised queries the LLM routed within `cache_ttl`
+        2. keyword rules, used only when exactly one task matches and the confidence,
+           which grows with the number of matching keywords, reaches `min_confidence`
+        3. nearest-centroid classifier over query embeddings, trained from past
+           LLM decisions, used only above `min_similarity` and `min_margin`; the
+           confidence is the cosine similarity
+        4. the LLM, whose decision is stored to train tiers 1 and 3
+
+        Only LLM decisions are stored, so a query misrouted by the rules or the
+        centroids reaches the LLM again next time; a wrong LLM decision expires
+        after `cache_ttl` or can be dropped with `forget`.
+
+    Args:
+        db_path (str): SQLite file that stores past decisions.
+        embeddings (Embeddings, optional): embeds queries for the centroid tier, None disables it.
+        min_similarity (float): cosine similarity to the best centroid required to skip the LLM.
+        min_margin (float): required lead of the best centroid over the second best.
+        min_samples (int): LLM decisions needed per task before its centroid is used.
+        cache_ttl (float): seconds an LLM decision is reused for the same query.
+        stats_every (int): print the hit rates every this many routed queries, 0 to disable.
+        min_confidence (float): keyword confidence required to skip the LLM; 0.75 takes two keywords.
+    """
+
+    def __init__(
+        self,
+        db_path: str = "../data/dispatch_router.db",
+        embeddings: Optional[Embeddings] = None,
+        min_similarity: float = 0.75,
+        min_margin: float = 0.05,
+        min_samples: int = 3,
+        cache_ttl: float = 30 * 24 * 3600,
+        stats_every: int = 50,
+        min_confidence: float = 0.75,
+    ):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._embeddings: Optional[Embeddings] = embeddings
+        self._min_similarity: float = min_similarity
+        self._min_margin: float = min_margin
+        self._min_samples: int = min_samples
+        self._cache_ttl: float = cache_ttl
+        self._stats_every: int = stats_every
+        self._min_confidence: float = min_confidence
+        self._rules: Dict[str, List[re.Pattern]] = {
+            task: [re.compile(pattern) for pattern in patterns]
+            for task, patterns in KEYWORD_RULES.items()
+        }
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS decisions (
+                    query TEXT PRIMARY KEY,
+                    task TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    vector BLOB,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            # older versions also stored the keyword and centroid guesses
+            self._conn.execute("DELETE FROM decisions WHERE source != 'llm'")
+        # query -> (task, decided at)
+        self._cache: Dict[str, Tuple[str, float]] = {
+            query: (task, updated_at)
+            for query, task, updated_at in self._conn.execute(
+                "SELECT query, task, updated_at FROM decisions"
+            )
+        }
+        self._centroids: Dict[str, Tuple[List[float], int]] = {}
+        self._load_centroids()
+        self._counts: Dict[str, int] = {
+            "cache": 0,
+            "rules": 0,
+            "centroid": 0,
+            "llm": 0,
+        }
+        self._confidence_sum: float = 0.0
+        self._confidence_count: int = 0
+
+    def _load_centroids(self) -> None:
+        sums: Dict[str, List[float]] = {}
+        counts: Dict[str, int] = {}
+        for task, blob in self._conn.execute(
+            "SELECT task, vector FROM decisions WHERE source = 'llm' AND vector IS NOT NULL"
+        ):
+            self._add_to_sums(sums, counts, task, array("f", blob).tolist())
+        self._centroids = {
+            task: ([value / counts[task] for value in total], counts[task])
+            for task, total in sums.items()
+        }
+
+    @staticmethod
+    def _unit(vector: List[float]) -> List[float]:
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def _add_to_sums(self, sums, counts, task: str, vector: List[float]) -> None:
+        unit = self._unit(vector)
+        if task not in sums:
+            sums[task] = [0.0] * len(unit)
+            counts[task] = 0
+        sums[task] = [a + b for a, b in zip(sums[task], unit)]
+        counts[task] += 1
+
+    def _match_rules(self, query: str) -> Optional[RouteDecision]:
+        hits: Dict[str, int] = {
+            task: sum(1 for pattern in patterns if pattern.search(query))
+            for task, patterns in self._rules.items()
+        }
+        matched = [task for task, count in hits.items() if count]
+        if len(matched) != 1:
+            return None
+        # every further independent keyword halves the remaining doubt
+        confidence = 1 - 0.5 ** hits[matched[0]]
+        return RouteDecision(task=matched[0], source="rules", confidence=confidence)
+
+    def _match_centroid(self, vector: List[float]) -> Optional[RouteDecision]:
+        unit = self._unit(vector)
+        scores = sorted(
+            (
+                (sum(a * b for a, b in zip(unit, self._unit(centroid))), task)
+                for task, (centroid, count) in self._centroids.items()
+                if count >= self._min_samples
+            ),
+            reverse=True,
+        )
+        if len(scores) < 2:
+            return None
+        (best, task), (second, _) = scores[0], scores[1]
+        if best < self._min_similarity or best - second < self._min_margin:
+            return None
+        return RouteDecision(task=task, source="centroid", confidence=best)
+
+    def _remember(
+        self, query: str, decision: RouteDecision, vector: Optional[List[float]]
+    ) -> None:
+        """Store an LLM decision; our own guesses are never stored or learnt from."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._cache[query] = (decision.task, now)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO decisions (query, task, source, vector, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    query,
+                    decision.task,
+                    decision.source,
+                    array("f", vector).tobytes() if vector else None,
+                    now,
+                ),
+            )
+            if vector:
+                centroid, count = self._centroids.get(
+                    decision.task, ([0.0] * len(vector), 0)
+                )
+                unit = self._unit(vector)
+                self._centroids[decision.task] = (
+                    [(c * count + u) / (count + 1) for c, u in zip(centroid, unit)],
+                    count + 1,
+                )
+
+    def forget(self, user_query: str) -> bool:
+        """Drop the stored decision of a misrouted query, also from the centroids."""
+        query = normalize_query(user_query)
+        with self._lock, self._conn:
+            found = self._cache.pop(query, None) is not None
+            self._conn.execute("DELETE FROM decisions WHERE query = ?", (query,))
+            self._load_centroids()
+        return found
+
+    def _cached(self, query: str) -> Optional[str]:
+        with self._lock:
+            entry = self._cache.get(query)
+            if entry is None:
+                return None
+            task, decided_at = entry
+            if time.time() - decided_at > self._cache_ttl:
+                # the row still trains the centroids until the LLM decides again
+                del self._cache[query]
+                return None
+            return task
+
+    def _count(self, decision: RouteDecision) -> RouteDecision:
+        with self._lock:
+            self._counts[decision.source] += 1
+            if decision.confidence is not None:
+                self._confidence_sum += decision.confidence
+                self._confidence_count += 1
+            total = sum(self._counts.values())
+        if self._stats_every and total % self._stats_every == 0:
+            stats = self.stats()
+            print(
+                f"Dispatcher 路由統計：共 {total} 筆，免 LLM 比例 {stats['fast_path_rate']:.0%}"
+                f"（cache {stats['cache']}、rules {stats['rules']}、"
+                f"centroid {stats['centroid']}、llm {stats['llm']}）"
+            )
+        return decision
+
+    async def aroute(
+        self, user_query: str, llm_fallback: Callable[[str], Awaitable[str]]
+    ) -> RouteDecision:
+        query = normalize_query(user_query)
+        cached: Optional[str] = self._cached(query)
+        if cached is not None:
+            # the LLM gave no confidence for the decision being reused
+            return self._count(
+                RouteDecision(task=cached, source="cache", confidence=None)
+            )
+
+        decision = self._match_rules(query)
+        if decision is not None and decision.confidence >= self._min_confidence:
+            return self._count(decision)
+
+        vector: Optional[List[float]] = None
+        if self._embeddings is not None:
+            try:
+                vector = await self._embeddings.aembed_query(query)
+            except Exception as e:
+                print(f"Dispatcher 向量分類失敗，改用 LLM: {e}")
+            if vector is not None:
+                decision = self._match_centroid(vector)
+                if decision is not None:
+                    return self._count(decision)
+
+        task: str = await llm_fallback(user_query)
+        decision = RouteDecision(task=task, source="llm", confidence=None)
+        if task in TASKS:
+            self._remember(query, decision, vector)
+        return self._count(decision)
+
+    def stats(self) -> Dict[str, float]:
+        """Decisions per tier, share routed without the LLM and mean measured confidence."""
+        with self._lock:
+            counts = dict(self._counts)
+            total = sum(counts.values())
+            return {
+                **counts,
+                "total": total,
+                "fast_path_rate": (total - counts["llm"]) / total if total else 0.0,
+                "mean_confidence": (
+                    self._confidence_sum / self._confidence_count
+                    if self._confidence_count
+                    else 0.0
+                ),
+                "cached_queries": len(self._cache),
+            }
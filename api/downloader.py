@@ -0,0 +1,250 @@
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import weakref
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Optional, Tuple
+from urllib.parse import unquote, urlparse
+from file_manifest import new_content_digest
+
+
+class DownloadError(Exception):
+    pass
+
+
+@dataclass
+class DownloadResult:
+    path: str
+    file_name: str
+    size: int
+    content_hash: str  # same digest as `file_manifest.hash_file`
+    resumed: bool
+
+
+_DRIVE_PREFIX = re.compile(r"^[A-Za-z]:")
+
+
+def safe_file_name(file_name: str) -> str:
+    """`file_name` if it names a plain file, otherwise DownloadError: no separators, `..` or drive."""
+    file_name = file_name.strip()
+    if (
+        file_name in ("", ".", "..")
+        or "/" in file_name
+        or "\\" in file_name
+        or _DRIVE_PREFIX.match(file_name)
+        or any(ord(char) < 32 for char in file_name)
+    ):
+        raise DownloadError(f"Unsafe file name: {file_name!r}")
+    return file_name
+
+
+def file_name_from_url(url: str) -> str:
+    # decoded before taking the last segment, so %2F or %5C cannot smuggle in a path
+    name = re.split(r"[/\\]", unquote(urlparse(url).path))[-1]
+    try:
+        return safe_file_name(name)
+    except DownloadError:
+        return "download"
+
+
+class StreamingDownloader:
+    """
+    Summary:
+        Async downloader that streams to disk in constant memory.
+
+        The body is written in chunks to a `.part` file outside the target
+        directory, so the filesystem watcher never sees half-written files, and
+        is moved into place with an atomic rename once complete. A transfer
+        interrupted by a network error resumes from the partial file with an
+        HTTP Range request. The content hash is computed while streaming.
+        One pooled HTTP client with keep-alive serves every download. Files
+        written by someone else, such as a browser download, are stored with
+        `save` through the same partial file, hash and rename. Concurrent
+        downloads of the same url to the same file take turns on its partial file.
+
+    Args:
+        directory (str): where finished files are stored.
+        partial_directory (str, optional): where `.part` files live, next to `directory` by default.
+        max_bytes (int): downloads larger than this are aborted.
+        timeout (float): connect and read timeout in seconds.
+        chunk_size (int): bytes read from the network per write.
+        max_retries (int): attempts after a network error before giving up.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        partial_directory: Optional[str] = None,
+        max_bytes: int = 500 * 1024 * 1024,
+        timeout: float = 30.0,
+        chunk_size: int = 256 * 1024,
+        max_retries: int = 3,
+    ):
+        self._directory = Path(directory)
+        self._partial_directory = (
+            Path(partial_directory)
+            if partial_directory
+            else self._directory.parent / ".partial_downloads"
+        )
+        self._max_bytes: int = max_bytes
+        self._timeout: float = timeout
+        self._chunk_size: int = chunk_size
+        self._max_retries: int = max_retries
+        self._client = None
+        # one lock per partial file, held from the first byte until the rename
+        self._locks: "weakref.WeakValueDictionary[Path, asyncio.Lock]" = (
+            weakref.WeakValueDictionary()
+        )
+
+    def _get_client(self):
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                follow_redirects=True,
+                timeout=httpx.Timeout(self._timeout),
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            )
+        return self._client
+
+    def _partial_path(self, key: str, target: Path) -> Path:
+        # keyed by source and target, so a retried download finds its own partial
+        # file and downloads of one url to different files never share one
+        name = hashlib.sha1(f"{key}\n{target}".encode("utf-8")).hexdigest()[:16]
+        return self._partial_directory / (name + ".part")
+
+    def _lock_for(self, partial: Path) -> asyncio.Lock:
+        # concurrent downloads of the same url to the same file take turns,
+        # a Range resume must never append to a part another download is writing
+        lock = self._locks.get(partial)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[partial] = lock
+        return lock
+
+    @staticmethod
+    def _digest_of(path: Path, size: int):
+        digest = new_content_digest()
+        with open(path, "rb") as f:
+            while size > 0 and (chunk := f.read(min(1 << 20, size))):
+                digest.update(chunk)
+                size -= len(chunk)
+        return digest
+
+    async def _transfer(self, url: str, partial: Path) -> Tuple[str, bool]:
+        """Stream `url` into `partial`; returns its content hash and whether a part was resumed."""
+        offset: int = partial.stat().st_size if partial.exists() else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        async with self._get_client().stream("GET", url, headers=headers) as response:
+            if response.status_code == 416:
+                # the server cannot serve the remaining range, start over
+                partial.unlink(missing_ok=True)
+                return await self._transfer(url, partial)
+            if response.status_code >= 400:
+                raise DownloadError(f"HTTP {response.status_code} for {url}")
+            resumed: bool = offset > 0 and response.status_code == 206
+            if not resumed:
+                offset = 0
+            length = response.headers.get("Content-Length")
+            if length is not None and offset + int(length) > self._max_bytes:
+                raise DownloadError(f"{url} exceeds {self._max_bytes} bytes")
+
+            digest = (
+                await asyncio.to_thread(self._digest_of, partial, offset)
+                if resumed
+                else new_content_digest()
+            )
+            written: int = offset
+            # chunks are small, local disk writes do not hold the loop noticeably
+            with open(partial, "ab" if resumed else "wb") as f:
+                async for chunk in response.aiter_bytes(self._chunk_size):
+                    written += len(chunk)
+                    if written > self._max_bytes:
+                        raise DownloadError(f"{url} exceeds {self._max_bytes} bytes")
+                    f.write(chunk)
+                    digest.update(chunk)
+        return digest.hexdigest(), resumed
+
+    def _target_path(self, file_name: str) -> Path:
+        directory = self._directory.resolve()
+        target = (directory / safe_file_name(file_name)).resolve()
+        if target.parent != directory:
+            raise DownloadError(f"{file_name!r} escapes {directory}")
+        return target
+
+    async def _move_into_place(self, partial: Path, target: Path) -> None:
+        try:
+            os.replace(partial, target)
+        except OSError:
+            # the partial directory is on another filesystem
+            await asyncio.to_thread(shutil.move, str(partial), str(target))
+
+    async def save(
+        self, write: Callable[[Path], Awaitable[None]], file_name: str, key: str
+    ) -> DownloadResult:
+        """
+        Store a file that `write` puts at the path it is given, e.g. a browser
+        download's `save_as`, as if it had been streamed; `key` names its partial file.
+        """
+        target: Path = self._target_path(file_name)
+        partial: Path = self._partial_path(key, target)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._partial_directory.mkdir(parents=True, exist_ok=True)
+        async with self._lock_for(partial):
+            partial.unlink(missing_ok=True)
+            await write(partial)
+            size: int = partial.stat().st_size
+            if size > self._max_bytes:
+                partial.unlink(missing_ok=True)
+                raise DownloadError(f"{file_name} exceeds {self._max_bytes} bytes")
+            digest = await asyncio.to_thread(self._digest_of, partial, size)
+            await self._move_into_place(partial, target)
+        return DownloadResult(
+            path=str(target),
+            file_name=target.name,
+            size=size,
+            content_hash=digest.hexdigest(),
+            resumed=False,
+        )
+
+    async def download(
+        self, url: str, file_name: Optional[str] = None
+    ) -> DownloadResult:
+        import httpx
+
+        target: Path = self._target_path(file_name or file_name_from_url(url))
+        partial: Path = self._partial_path(url, target)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._partial_directory.mkdir(parents=True, exist_ok=True)
+
+        async with self._lock_for(partial):
+            for attempt in range(self._max_retries + 1):
+                try:
+                    content_hash, resumed = await self._transfer(url, partial)
+                    break
+                except DownloadError:
+                    partial.unlink(missing_ok=True)
+                    raise
+                except httpx.TransportError as e:
+                    if attempt == self._max_retries:
+                        raise DownloadError(f"下載中斷：{url}: {e}") from e
+                    print(f"下載中斷，{2**attempt} 秒後從斷點續傳：{e}")
+                    await asyncio.sleep(2**attempt)
+
+            size: int = partial.stat().st_size
+            await self._move_into_place(partial, target)
+        return DownloadResult(
+            path=str(target),
+            file_name=target.name,
+            size=size,
+            content_hash=content_hash,
+            resumed=resumed,
+        )
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,229 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_GOOGLE_MODEL = "models/text-embedding-004"
+DEFAULT_LOCAL_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    Summary:
+        CPU embeddings from a local sentence-transformers model, no network needed.
+        `backend="onnx"` runs the model through ONNX Runtime when it is installed.
+
+    Args:
+        model_name (str): sentence-transformers model name or local path.
+        backend (str): "torch" or "onnx".
+        batch_size (int): texts encoded per forward pass.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_LOCAL_MODEL,
+        backend: str = "torch",
+        batch_size: int = 32,
+    ):
+        self.model: str = model_name
+        self._backend: str = backend
+        self._batch_size: int = batch_size
+        self._encoder = None
+        self._lock = threading.Lock()
+
+    def _get_encoder(self):
+        with self._lock:
+            if self._encoder is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                except ImportError as e:
+                    raise ImportError(
+                        "LocalEmbeddings requires sentence-transformers: "
+                        "uv add sentence-transformers"
+                    ) from e
+                self._encoder = SentenceTransformer(
+                    self.model, device="cpu", backend=self._backend
+                )
+            return self._encoder
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self._get_encoder().encode(
+            texts, batch_size=self._batch_size, normalize_embeddings=True
+        )
+        return [vector.tolist() for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Summary:
+        Wraps an `Embeddings` with a persistent SQLite store keyed by
+        (model, kind, sha256 of text), so identical texts are embedded once.
+        Query and document vectors are cached apart because some providers
+        (e.g. Gemini task types) embed them differently.
+
+    Args:
+        embeddings (Embeddings): the underlying embedding backend.
+        db_path (str): path of the SQLite database file.
+        model (str, optional): model name used in the key, read from `embeddings` if omitted.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        db_path: str = "../data/embedding_cache.db",
+        model: Optional[str] = None,
+    ):
+        self._embeddings: Embeddings = embeddings
+        self.model: str = model or str(
+            getattr(embeddings, "model", None) or type(embeddings).__name__
+        )
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (model, kind, text_hash)
+                )
+                """
+            )
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _load(self, kind: str, hashes: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            # stay below SQLite's limit of host parameters per statement
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start : start + 500]
+                rows = self._conn.execute(
+                    "SELECT text_hash, vector FROM embeddings WHERE model = ? AND kind = ? "
+                    f"AND text_hash IN ({','.join('?' * len(chunk))})",
+                    (self.model, kind, *chunk),
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = array("f", blob).tolist()
+        return found
+
+    def _store(self, kind: str, vectors: Dict[str, List[float]]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, kind, text_hash, vector) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (self.model, kind, text_hash, array("f", vector).tobytes())
+                    for text_hash, vector in vectors.items()
+                ],
+            )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [self._hash(text) for text in texts]
+        found = self._load("document", list(set(hashes)))
+        missing: Dict[str, str] = {
+            text_hash: text
+            for text_hash, text in zip(hashes, texts)
+            if text_hash not in found
+        }
+        self.hits += len(texts) - sum(1 for h in hashes if h in missing)
+        self.misses += sum(1 for h in hashes if h in missing)
+        if missing:
+            # one backend call for every distinct text that is not cached yet
+            computed = self._embeddings.embed_documents(list(missing.values()))
+            new_vectors = dict(zip(missing.keys(), computed))
+            self._store("document", new_vectors)
+            found.update(new_vectors)
+        return [found[text_hash] for text_hash in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        text_hash = self._hash(text)
+        found = self._load("query", [text_hash])
+        if text_hash in found:
+            self.hits += 1
+            return found[text_hash]
+        self.misses += 1
+        vector = self._embeddings.embed_query(text)
+        self._store("query", {text_hash: vector})
+        return vector
+
+
+def check_vector_dimension(
+    vectorstore, embeddings: Embeddings, persist_directory: str
+) -> None:
+    """
+    Summary:
+        Fail with a clear message when a persisted Chroma collection holds vectors of
+        another size than `embeddings` produces, e.g. after switching EMBEDDING_PROVIDER.
+        Chroma itself only fails on the first query or write, deep inside a request.
+
+    Args:
+        vectorstore (Chroma): the opened vector store.
+        embeddings (Embeddings): the embeddings the store is queried with.
+        persist_directory (str): directory of the store, named in the error.
+    """
+    stored = vectorstore._collection.get(limit=1, include=["embeddings"])
+    vectors = stored.get("embeddings")
+    if vectors is None or len(vectors) == 0:
+        return
+    # one probe per model, the cache keeps its vector
+    expected = len(embeddings.embed_query("dimension probe"))
+    if len(vectors[0]) != expected:
+        model = getattr(embeddings, "model", None) or type(embeddings).__name__
+        raise ValueError(
+            f"{persist_directory} holds {len(vectors[0])}-dimensional vectors, but "
+            f"{model} produces {expected}; rebuild the directory or restore the "
+            "EMBEDDING_PROVIDER / EMBEDDING_MODEL it was built with"
+        )
+
+
+def build_embeddings(
+    provider: Optional[str] = None,
+    model: Optional[str] = None,
+    cache_path: Optional[str] = "../data/embedding_cache.db",
+) -> Embeddings:
+    """
+    Summary:
+        Build the embedding backend selected by config, wrapped in the persistent cache.
+
+    Args:
+        provider (str, optional): "google" or "local", defaults to $EMBEDDING_PROVIDER or "google".
+        model (str, optional): model name, defaults to $EMBEDDING_MODEL or the provider default.
+        cache_path (str, optional): SQLite cache path, None disables the cache.
+
+    Returns:
+        Embeddings: the configured embeddings.
+    """
+    provider = (provider or os.getenv("EMBEDDING_PROVIDER") or "google").lower()
+    model = model or os.getenv("EMBEDDING_MODEL") or None
+    if provider == "google":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        embeddings: Embeddings = GoogleGenerativeAIEmbeddings(
+            model=model or DEFAULT_GOOGLE_MODEL
+        )
+    elif provider == "local":
+        embeddings = LocalEmbeddings(
+            model_name=model or DEFAULT_LOCAL_MODEL,
+            backend=os.getenv("EMBEDDING_BACKEND", "torch"),
+        )
+    else:
+        raise ValueError(f"Unknown embedding provider: {provider}")
+    if cache_path is None:
+        return embeddings
+    return CachedEmbeddings(embeddings, db_path=cache_path)
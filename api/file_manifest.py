@@ -0,0 +1,145 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+
+def new_content_digest():
+    """The hash object behind every `content_hash`, for callers hashing a stream."""
+    return hashlib.blake2b(digest_size=20)
+
+
+def hash_file(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """Streaming BLAKE2b digest of a file, read in `chunk_size` byte chunks."""
+    digest = new_content_digest()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@dataclass
+class FileRecord:
+    path: str
+    size: int
+    mtime_ns: int
+    inode: int
+    content_hash: str
+
+    @classmethod
+    def from_stat(
+        cls, path: str, stat: os.stat_result, content_hash: str
+    ) -> "FileRecord":
+        return cls(
+            path=path,
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            inode=stat.st_ino,
+            content_hash=content_hash,
+        )
+
+    @property
+    def last_modified_time(self) -> int:
+        return self.mtime_ns // 1_000_000_000
+
+    def matches_stat(self, stat: os.stat_result) -> bool:
+        """True if `stat` describes the same file version, so hashing can be skipped."""
+        return (self.size, self.mtime_ns, self.inode) == (
+            stat.st_size,
+            stat.st_mtime_ns,
+            stat.st_ino,
+        )
+
+
+class FileManifest:
+    """
+    Summary:
+        SQLite manifest of the files whose description is stored in the vector store,
+        keyed by path with size, mtime_ns, inode and content hash.
+
+    Args:
+        db_path (str): path of the SQLite database file.
+    """
+
+    def __init__(self, db_path: str = "../data/filesystem_manifest.db"):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    content_hash TEXT NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_files_hash ON files (content_hash)"
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def get(self, path: str) -> Optional[FileRecord]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path, size, mtime_ns, inode, content_hash FROM files WHERE path = ?",
+                (path,),
+            ).fetchone()
+        return FileRecord(*row) if row else None
+
+    def all(self) -> Dict[str, FileRecord]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, mtime_ns, inode, content_hash FROM files"
+            ).fetchall()
+        return {row[0]: FileRecord(*row) for row in rows}
+
+    def paths_with_hash(self, content_hash: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM files WHERE content_hash = ?", (content_hash,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def upsert(self, records: Iterable[FileRecord]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, content_hash) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (r.path, r.size, r.mtime_ns, r.inode, r.content_hash)
+                    for r in records
+                ],
+            )
+
+    def delete(self, paths: Iterable[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM files WHERE path = ?", [(path,) for path in paths]
+            )
+
+    def relink(self, old_path: str, record: FileRecord) -> None:
+        """Move the entry of `old_path` to `record.path` in one transaction."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files WHERE path = ?", (old_path,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, content_hash) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    record.path,
+                    record.size,
+                    record.mtime_ns,
+                    record.inode,
+                    record.content_hash,
+                ),
+            )
@@ -0,0 +1,237 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog is optional, fall back to polling
+    FileSystemEventHandler = object
+    Observer = None
+
+if TYPE_CHECKING:
+    from node import Synchronizer
+
+
+class _ChangeHandler(FileSystemEventHandler):
+    def __init__(self, watcher: "FilesystemWatcher"):
+        super().__init__()
+        self._watcher = watcher
+
+    def on_any_event(self, event) -> None:
+        if event.event_type in ("opened", "closed_no_write"):
+            return
+        self._watcher.notify(event.src_path)
+        dest_path = getattr(event, "dest_path", None)
+        if dest_path:
+            self._watcher.notify(dest_path)
+
+
+class FilesystemWatcher:
+    """
+    Summary:
+        Keeps the filesystem index up to date in the background.
+
+        Changes are reported by watchdog (inotify/FSEvents/ReadDirectoryChangesW) and
+        synced incrementally after `debounce_seconds` of quiet per path. Without
+        watchdog the observed directory is fully re-synced every `poll_interval`
+        seconds instead. Syncs run on a dedicated thread with its own event loop,
+        so the request path only pays for changes it actually waits on.
+
+    Args:
+        synchronizer (Synchronizer): the synchronizer that owns the index.
+        debounce_seconds (float): quiet time before a changed path is synced.
+        poll_interval (float): seconds between full syncs in polling mode.
+        use_watchdog (bool): set False to force polling.
+    """
+
+    def __init__(
+        self,
+        synchronizer: "Synchronizer",
+        debounce_seconds: float = 1.0,
+        poll_interval: float = 10.0,
+        use_watchdog: bool = True,
+    ):
+        self._synchronizer = synchronizer
+        self._debounce_seconds: float = debounce_seconds
+        self._poll_interval: float = poll_interval
+        self._use_watchdog: bool = use_watchdog and Observer is not None
+        self._lock = threading.Lock()
+        # path -> first unsynced change, what freshness is measured against
+        self._pending: Dict[str, float] = {}
+        # path -> latest change, what the debounce is measured against
+        self._last_change: Dict[str, float] = {}
+        self._in_flight: Dict[str, float] = {}
+        self._synced_at: float = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._observer = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._sync_lock: Optional[asyncio.Lock] = None
+        self._main_task: Optional[Future] = None
+        self._initial_sync = threading.Event()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def is_polling(self) -> bool:
+        return not self._use_watchdog
+
+    def start(self) -> "FilesystemWatcher":
+        if self.is_running:
+            return self
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="FilesystemWatcher", daemon=True
+        )
+        self._thread.start()
+        self._main_task = asyncio.run_coroutine_threadsafe(self._main(), self._loop)
+        return self
+
+    def stop(self) -> None:
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        if self._loop is not None and self.is_running:
+            if self._main_task is not None:
+                self._main_task.cancel()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+        self._thread = None
+
+    def notify(self, path: str) -> None:
+        """Record a change of `path`; safe to call from any thread."""
+        path = str(Path(path))
+        now = time.time()
+        with self._lock:
+            self._pending.setdefault(path, now)
+            self._last_change[path] = now
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def pending_paths(self) -> List[str]:
+        with self._lock:
+            return list(self._pending.keys() | self._in_flight.keys())
+
+    def fresh_as_of(self) -> float:
+        """
+        Returns:
+            float: epoch time T such that every change made before T is indexed,
+            0.0 until the initial sync has finished.
+        """
+        if not self._initial_sync.is_set():
+            return 0.0
+        with self._lock:
+            oldest = min(
+                [*self._pending.values(), *self._in_flight.values()], default=None
+            )
+        if self.is_polling:
+            return self._synced_at if oldest is None else min(oldest, self._synced_at)
+        return time.time() if oldest is None else oldest
+
+    def is_fresh(self, since: float) -> bool:
+        return self.fresh_as_of() >= since
+
+    async def wait_for(
+        self, paths: Optional[Iterable[str]] = None, timeout: Optional[float] = None
+    ) -> bool:
+        """
+        Summary:
+            Sync `paths` now, skipping their debounce, and wait until they are indexed.
+            With `paths` None, every pending change is synced. Can be awaited from
+            any event loop.
+
+        Returns:
+            bool: False if `timeout` expired first.
+        """
+        if not self.is_running:
+            return False
+        # Event.wait with a timeout returns on its own, no executor thread is left blocked
+        if not await asyncio.to_thread(self._initial_sync.wait, timeout):
+            return False
+        try:
+            paths = None if paths is None else list(paths)
+            if paths == []:
+                return True
+            future = asyncio.run_coroutine_threadsafe(self._sync(paths), self._loop)
+            await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def _start_observer(self) -> None:
+        if not self._use_watchdog:
+            return
+        root = Path(self._synchronizer.observed_directory)
+        root.mkdir(parents=True, exist_ok=True)
+        self._observer = Observer()
+        self._observer.schedule(_ChangeHandler(self), str(root), recursive=True)
+        self._observer.start()
+
+    async def _main(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._sync_lock = asyncio.Lock()
+        # start watching before the initial sync so no change in between is lost
+        self._start_observer()
+        await self._sync(None)
+        self._initial_sync.set()
+        while True:
+            timeout = self._poll_interval if self.is_polling else self._debounce_seconds
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self.is_polling:
+                await self._sync(None)
+                continue
+            deadline = time.time() - self._debounce_seconds
+            with self._lock:
+                ready = [
+                    path
+                    for path in self._pending
+                    if self._last_change.get(path, 0.0) <= deadline
+                ]
+            if ready:
+                await self._sync(ready)
+
+    async def _sync(self, paths: Optional[List[str]]) -> None:
+        async with self._sync_lock:
+            started = time.time()
+            with self._lock:
+                if paths is None:
+                    taken = dict(self._pending)
+                    self._pending.clear()
+                    self._last_change.clear()
+                else:
+                    taken = {
+                        path: self._pending.pop(path)
+                        for path in paths
+                        if path in self._pending
+                    }
+                    for path in taken:
+                        self._last_change.pop(path, None)
+                    if not taken:
+                        return
+                self._in_flight.update(taken)
+            try:
+                await self._synchronizer.sync(None if paths is None else list(taken))
+                if paths is None:
+                    self._synced_at = started
+            except Exception as e:
+                print(f"檔案索引同步失敗: {e}")
+                # keep the changes pending so the next round retries them
+                with self._lock:
+                    for path, at in taken.items():
+                        self._pending.setdefault(path, at)
+                        self._last_change.setdefault(path, at)
+            finally:
+                with self._lock:
+                    for path in taken:
+                        self._in_flight.pop(path, None)
@@ -1,13 +1,20 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, File, HTTPException, Query, Response, UploadFile
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import asyncio
 from uvicorn import Config, Server
 from fastapi.staticfiles import StaticFiles
 from schemas import State
-from main import run_agent, messenge_sender
+from main import get_graph, route_query, run_agent, store_result
+from jobs import JobManager
+from mail_queue import get_mail_queue, shutdown_mail_queue
+from services import get_registry
 from pathlib import Path
+from typing import Optional
 import traceback
+import json
+import os
 app = FastAPI()
 static_dir = Path(__file__).resolve().parent.parent / "data" / "mock_filesystem"
 print("mount dir：", static_dir)
@@ -21,6 +28,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_filesystem_watcher():
+    # 背景監看檔案系統，查詢時不需再全量掃描；在執行緒中建立服務，不阻塞 event loop
+    await asyncio.to_thread(lambda: get_registry().synchronizer.watch())
+
+
+@app.on_event("startup")
+async def start_mail_queue():
+    # 重新啟動後繼續寄出上次留在寄件匣的郵件，不必等到下一封信入列
+    await asyncio.to_thread(get_mail_queue)
+
+
+@app.on_event("shutdown")
+async def stop_filesystem_watcher():
+    registry = get_registry()
+    # 只關閉建立過的服務，不為了關閉而建立
+    if registry.is_built("synchronizer"):
+        registry.synchronizer.unwatch()
+    await job_manager.shutdown()
+    if registry.is_built("browser_pool"):
+        await registry.browser_pool.shutdown()
+    if registry.is_built("downloader"):
+        await registry.downloader.aclose()
+    await asyncio.to_thread(shutdown_mail_queue)
+
+
 class QueryRequest(BaseModel):
     user_query: str
 
@@ -31,55 +64,167 @@ class ContactEntry(BaseModel):
 
 class ContactUpdateRequest(BaseModel):
     contacts: list[ContactEntry]
-    
+
+
+def format_result(result: State) -> State:
+    file_name = result.get("file_name")
+    if file_name:
+        result["download_file_url"] = f"http://127.0.0.1:8000/files/{file_name}"
+    return result
+
+
+job_manager = JobManager(
+    graph_factory=get_graph,
+    max_workers=int(os.getenv("JOB_WORKERS", "4")),
+    result_formatter=format_result,
+    router=route_query,
+    result_handler=store_result,
+)
+
+
 @app.post("/run")
 async def run_query(request: QueryRequest):
     try:
         result: State = await run_agent(request.user_query)
         print("task finish")
-        file_name = result.get("file_name")
-        if file_name:
-            result["download_file_url"] = f"http://127.0.0.1:8000/files/{file_name}"
-        return {"output": result}
+        return {"output": format_result(result)}
     except Exception as e:
         print(str(e))
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
     
 
+@app.post("/jobs", status_code=202)
+async def create_job(request: QueryRequest):
+    """背景執行查詢：與 /run 相同，先經 Dispatcher 分類並查語意快取，命中時不執行 graph"""
+    job = await job_manager.submit(request.user_query)
+    return job.summary()
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.summary()
+
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """以 Server-Sent Events 串流任務的節點進度，任務結束後關閉連線"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        async for event in job_manager.subscribe(job):
+            data = json.dumps(event, ensure_ascii=False, default=str)
+            yield f"event: {event['event']}\ndata: {data}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    if job_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    cancelled = await job_manager.cancel(job_id)
+    return {"status": "cancelled" if cancelled else "finished", "id": job_id}
+
+
+# 聯絡人端點只做阻塞的 Chroma 操作，以 def 宣告交由 FastAPI 的執行緒池執行
 @app.post("/update_contacts")
-async def update_contacts(request: ContactUpdateRequest):
+def update_contacts(request: ContactUpdateRequest):
     try:
-        messenge_sender.update_contact(request.contacts)
-        return {"status": "success", "message": "聯絡人已更新"}
+        counts = get_registry().message_sender.update_contact(request.contacts)
+        return {"status": "success", "message": "聯絡人已更新", **counts}
+    except Exception as e:
+        print(str(e))
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/contacts/import")
+def import_contacts(file: UploadFile = File(...)):
+    """匯入 CSV 或 vCard 聯絡人檔，只新增或更新有變動的聯絡人"""
+    try:
+        text = file.file.read().decode("utf-8-sig", errors="replace")
+        counts = get_registry().message_sender.import_contacts(text, file.filename or "")
+        return {"status": "success", "message": "聯絡人已匯入", **counts}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(str(e))
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/contacts", response_model=list[ContactEntry])
-async def list_contacts():
+def list_contacts(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    prefix: Optional[str] = None,
+):
+    """
+    依姓名排序列出聯絡人；不帶 limit 時回傳全部（前端表單需要完整清單）。
+    下一頁的 cursor 與總數放在 X-Next-Cursor、X-Total-Count 標頭。
+    """
     try:
-        docs = messenge_sender._vectorstore.get(include=["metadatas"])
-        metadatas = docs.get("metadatas", [])
-        # 過濾出不是 None 且是 dict 的項目
-        contacts = [m for m in metadatas if isinstance(m, dict)]
+        message_sender = get_registry().message_sender
+        contacts, next_cursor = message_sender.list_contacts(
+            limit=limit, cursor=cursor, prefix=prefix
+        )
+        response.headers["X-Total-Count"] = str(message_sender.contact_index.count())
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
         return contacts
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(str(e))
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
     
+@app.get("/contacts/count")
+def count_contacts():
+    return {"count": get_registry().message_sender.contact_index.count()}
+
 @app.delete("/contacts/{name}")
-async def delete_contact(name: str):
+def delete_contact(name: str):
     try:
-        messenge_sender.delete_contact_by_name(name)
+        get_registry().message_sender.delete_contact_by_name(name)
         return {"status": "success", "message": f"聯絡人 {name} 已刪除（若存在）"}
     except Exception as e:
         print(str(e))
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
     
+@app.get("/dispatch/stats")
+def dispatch_stats():
+    router = get_registry().dispatcher.router
+    if router is None:
+        raise HTTPException(status_code=404, detail="未啟用 Dispatcher 路由快取")
+    return router.stats()
+
+@app.delete("/dispatch/cache")
+def forget_dispatch_decision(user_query: str = Query(...)):
+    router = get_registry().dispatcher.router
+    if router is None:
+        raise HTTPException(status_code=404, detail="未啟用 Dispatcher 路由快取")
+    try:
+        if not router.forget(user_query):
+            raise HTTPException(status_code=404, detail="此查詢沒有快取的路由結果")
+        return {"status": "success", "message": f"已移除查詢「{user_query}」的路由快取"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(str(e))
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
 class ProactorServer(Server):
     def run(self, sockets=None):
         loop = asyncio.ProactorEventLoop()
@@ -0,0 +1,240 @@
+import asyncio
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+)
+
+JobStatus = Literal["queued", "running", "succeeded", "failed", "cancelled"]
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+@dataclass
+class Job:
+    id: str
+    user_query: str
+    status: JobStatus = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    events: List[dict] = field(default_factory=list)
+    _task: Optional[asyncio.Task] = field(default=None, repr=False)
+    _changed: asyncio.Condition = field(default_factory=asyncio.Condition, repr=False)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "user_query": self.user_query,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    Summary:
+        Runs agent graphs as background jobs on a bounded pool of workers.
+
+        Submitting returns immediately with a queued `Job`. Workers first pass the
+        query to `router`, which may answer it outright (e.g. from a result cache),
+        then execute the graph with `astream_events` and record node-level progress
+        on the job, which subscribers can follow live. Jobs can be cancelled while
+        queued or running. Only the latest `max_history` finished jobs are kept.
+
+    Args:
+        graph_factory (Callable): returns the compiled graph to run.
+        max_workers (int): number of graphs executed concurrently.
+        max_history (int): finished jobs kept for status queries.
+        result_formatter (Callable, optional): post-processes the final graph state.
+        router (Callable, optional): async, maps a query to (graph input, ready result or None).
+        result_handler (Callable, optional): async, called with the query and the raw graph result.
+    """
+
+    def __init__(
+        self,
+        graph_factory: Callable[[], Any],
+        max_workers: int = 4,
+        max_history: int = 500,
+        result_formatter: Optional[Callable[[dict], dict]] = None,
+        router: Optional[
+            Callable[[str], Awaitable[Tuple[dict, Optional[dict]]]]
+        ] = None,
+        result_handler: Optional[Callable[[str, dict], Awaitable[None]]] = None,
+    ):
+        self._graph_factory = graph_factory
+        self._max_workers: int = max_workers
+        self._max_history: int = max_history
+        self._result_formatter = result_formatter
+        self._router = router
+        self._result_handler = result_handler
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    def _ensure_workers(self) -> None:
+        # workers are started on first use, inside the server's event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._workers = [worker for worker in self._workers if not worker.done()]
+        while len(self._workers) < self._max_workers:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def submit(self, user_query: str) -> Job:
+        self._ensure_workers()
+        job = Job(id=uuid.uuid4().hex, user_query=user_query)
+        self._jobs[job.id] = job
+        self._forget_old_jobs()
+        await self._record(job, {"event": "status", "status": job.status})
+        await self._queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    async def cancel(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job.is_finished:
+            return False
+        if job._task is not None:
+            job._task.cancel()
+        else:
+            # still queued, the worker skips it
+            await self._finish(job, "cancelled")
+        return True
+
+    async def shutdown(self) -> None:
+        for job in self._jobs.values():
+            if job._task is not None and not job.is_finished:
+                job._task.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def subscribe(self, job: Job) -> AsyncIterator[dict]:
+        """Yield every event of `job`, past ones first, until the job finishes."""
+        sent = 0
+        while True:
+            async with job._changed:
+                await job._changed.wait_for(
+                    lambda: len(job.events) > sent or job.is_finished
+                )
+                pending, finished = job.events[sent:], job.is_finished
+            for event in pending:
+                yield event
+            sent += len(pending)
+            if finished and sent == len(job.events):
+                return
+
+    def _forget_old_jobs(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.is_finished]
+        for job_id in finished[: max(0, len(finished) - self._max_history)]:
+            del self._jobs[job_id]
+
+    async def _record(self, job: Job, event: dict) -> None:
+        async with job._changed:
+            job.events.append({"time": time.time(), **event})
+            job._changed.notify_all()
+
+    async def _finish(self, job: Job, status: JobStatus, **fields) -> None:
+        job.status = status
+        job.finished_at = time.time()
+        for name, value in fields.items():
+            setattr(job, name, value)
+        await self._record(job, {"event": "status", "status": status, **fields})
+
+    async def _worker(self) -> None:
+        while True:
+            job: Job = await self._queue.get()
+            try:
+                if job.is_finished:
+                    continue
+                job._task = asyncio.create_task(self._execute(job))
+                try:
+                    await job._task
+                except asyncio.CancelledError:
+                    if not job._task.cancelled():
+                        # the worker itself is being cancelled
+                        job._task.cancel()
+                        raise
+                    await self._finish(job, "cancelled")
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, job: Job) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        await self._record(job, {"event": "status", "status": job.status})
+        try:
+            result: Optional[dict] = None
+            inputs: dict = {"user_query": job.user_query}
+            if self._router is not None:
+                inputs, ready = await self._router(job.user_query)
+                routing = {k: v for k, v in inputs.items() if k != "user_query"}
+                await self._record(
+                    job,
+                    {"event": "routed", "from_cache": ready is not None, **routing},
+                )
+                if ready is not None:
+                    if self._result_formatter:
+                        ready = self._result_formatter(ready)
+                    await self._finish(job, "succeeded", result=ready)
+                    return
+            graph = self._graph_factory()
+            async for event in graph.astream_events(inputs, version="v2"):
+                kind = event["event"]
+                node = event.get("metadata", {}).get("langgraph_node")
+                if not event.get("parent_ids") and kind == "on_chain_end":
+                    # the root run ends with the final graph state
+                    result = event["data"].get("output")
+                elif (
+                    node
+                    and event["name"] == node
+                    and kind
+                    in (
+                        "on_chain_start",
+                        "on_chain_end",
+                    )
+                ):
+                    is_start = kind == "on_chain_start"
+                    await self._record(
+                        job,
+                        {
+                            "event": "node_start" if is_start else "node_end",
+                            "node": node,
+                            "output": None if is_start else event["data"].get("output"),
+                        },
+                    )
+            if result is not None and self._result_handler:
+                await self._result_handler(job.user_query, result)
+            if result is not None and self._result_formatter:
+                result = self._result_formatter(result)
+            await self._finish(job, "succeeded", result=result)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            traceback.print_exc()
+            await self._finish(job, "failed", error=str(e))
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+
+
+def llm_identity(llm: BaseChatModel) -> Dict[str, Optional[str]]:
+    """Model name and temperature of a chat model, as part of a cache key."""
+    model = getattr(llm, "model", None) or getattr(llm, "model_name", None)
+    temperature = getattr(llm, "temperature", None)
+    return {
+        "model": str(model) if model is not None else type(llm).__name__,
+        "temperature": None if temperature is None else str(temperature),
+    }
+
+
+class ResponseCache:
+    """
+    Summary:
+        Persistent SQLite cache of LLM responses with least-recently-used eviction.
+
+        Keys are built by `make_key` from every input that changes the answer, so a
+        cache entry stays valid across machines and vector store rebuilds.
+
+    Args:
+        db_path (str): path of the SQLite database file.
+        max_entries (int): number of entries kept before the least recently used are evicted.
+        max_bytes (int, optional): total size of cached values kept before eviction.
+    """
+
+    def __init__(
+        self,
+        db_path: str = "../data/llm_cache.db",
+        max_entries: int = 100_000,
+        max_bytes: Optional[int] = None,
+    ):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._max_entries: int = max_entries
+        self._max_bytes: Optional[int] = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_responses_access ON responses (last_access)"
+            )
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    @staticmethod
+    def make_key(**parts) -> str:
+        """Hash keyword parts (content hash, prompt text, model, ...) into a key."""
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), time.time()),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        while count > self._max_entries or (
+            self._max_bytes is not None and total > self._max_bytes and count > 1
+        ):
+            # drop the least recently used tenth at once instead of one row per put
+            batch = max(1, count - self._max_entries, count // 10)
+            evicted = self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                (batch,),
+            ).rowcount
+            self.evictions += evicted
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        requests = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / requests if requests else 0.0,
+        }
@@ -11,14 +11,17 @@ from prompts import (
     ActionReasoningPrompt,
     SummarizerPrompt
 )
-from markitdown import MarkItDown
-from langchain_core.runnables import RunnablePassthrough, RunnableMap, RunnableLambda
+from content_extractor import ContentExtractor
+from llm_cache import ResponseCache, llm_identity
+from langchain_core.runnables import RunnablePassthrough, RunnableMap
+from operator import itemgetter
 from langchain_core.vectorstores import VectorStoreRetriever
 from schemas import FileDescription
 from abc import ABC, abstractmethod
 from langchain_chroma import Chroma
-from typing import Optional
-from browser_use import Agent, Controller, AgentHistoryList
+from typing import List, Optional
+import hashlib
+from pathlib import Path
 
 
 class BaseLLMService(ABC):
@@ -39,6 +42,8 @@ class BaseLLMService(ABC):
         pass
 
 class FileDescriptor(BaseLLMService):
+    word_number: int = 100
+
     class OutputFormat(BaseModel):
         content: str = Field(
             ...,
@@ -46,28 +51,88 @@ class FileDescriptor(BaseLLMService):
             description="A concise yet informative summary of the file's content.",
         )
 
-    def __init__(self, llm: BaseChatModel, max_content_length: int = 200):
+    def __init__(
+        self,
+        llm: BaseChatModel,
+        max_content_length: int = 200,
+        extractor: Optional[ContentExtractor] = None,
+        cache: Optional[ResponseCache] = None,
+    ):
         super().__init__(llm, self.OutputFormat, name=self.__class__.__name__)
         self._prompt: ChatPromptTemplate = FileDescriptorPrompt.prompt_templace
         self._chain = self._prompt | self._llm
+        self._cache: Optional[ResponseCache] = cache
+        # everything besides the content that changes the description
+        self._cache_key_parts: dict = {
+            "service": self.name,
+            "system_prompt": FileDescriptorPrompt._system_prompt,
+            "user_prompt": FileDescriptorPrompt._user_prompt,
+            "word_number": self.word_number,
+            **llm_identity(llm),
+        }
         self.max_content_length: int = (
             max_content_length  # Maximum content length for the readed content
         )
+        # one extractor (and MarkItDown converter) is shared by every file
+        self._extractor: ContentExtractor = extractor or ContentExtractor(
+            max_chars=max_content_length
+        )
 
-    def _read_content(self, file_path: str) -> str:
-        """_summary_
-
-        preserve the first "truncation_number" characters
+    def read_content(self, file_path: str) -> str:
+        """
+        Summary:
+            preserve the first "max_content_length" characters, reading only as much
+            of the file as needed. Falls back to the file name if nothing was extracted.
 
         Args:
-            file_path (str): _description_
+            file_path (str): the path of the file to be read
 
         Returns:
-            str: _description_
+            str: the leading content of the file
         """
-        md = MarkItDown(enable_plugins=False)
-        result = md.convert(file_path)
-        return result.text_content[: self.max_content_length]
+        content = self._extractor.extract(file_path)[: self.max_content_length]
+        return content if content.strip() else Path(file_path).name
+
+    async def aread_content(self, file_path: str) -> str:
+        """Same as `read_content`, awaiting the extractor's pool instead of blocking."""
+        content = (await self._extractor.aextract(file_path))[: self.max_content_length]
+        return content if content.strip() else Path(file_path).name
+
+    def estimate_tokens(self, content: str) -> int:
+        """Rough token count of one describe request, used for tokens/min limiting."""
+        return len(FileDescriptorPrompt._system_prompt) // 4 + len(content) // 2 + 200
+
+    def _cache_key(self, content: str) -> str:
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        return ResponseCache.make_key(content_hash=content_hash, **self._cache_key_parts)
+
+    def describe(self, content: str) -> str:
+        key = self._cache_key(content) if self._cache else None
+        if key and (cached := self._cache.get(key)) is not None:
+            return cached
+        result: FileDescriptor.OutputFormat = self._chain.invoke(
+            {"word_number": self.word_number, "file_content": content}
+        )
+        if key:
+            self._cache.put(key, result.content)
+        return result.content
+
+    def lookup_cache(self, content: str) -> Optional[str]:
+        """Cached description of `content`, without calling the LLM."""
+        if self._cache is None:
+            return None
+        return self._cache.get(self._cache_key(content))
+
+    async def adescribe(self, content: str, check_cache: bool = True) -> str:
+        key = self._cache_key(content) if self._cache else None
+        if key and check_cache and (cached := self._cache.get(key)) is not None:
+            return cached
+        result: FileDescriptor.OutputFormat = await self._chain.ainvoke(
+            {"word_number": self.word_number, "file_content": content}
+        )
+        if key:
+            self._cache.put(key, result.content)
+        return result.content
 
     def run(self, file_path: str) -> str:
         f"""
@@ -81,12 +146,9 @@ class FileDescriptor(BaseLLMService):
             str: file description with "max_content_length" characters
         """
         # read content from file_path
-        content = self._read_content(file_path)
+        content = self.read_content(file_path)
         # get description from chain
-        result: FileDescriptor.FileDescriptorOutput = self._chain.invoke(
-            {"word_number": 100, "file_content": content}
-        )
-        return result.content
+        return self.describe(content)
 
 class FileRetrieverLLMService(BaseLLMService):
     class OutputFormat(BaseModel):
@@ -111,14 +173,22 @@ class FileRetrieverLLMService(BaseLLMService):
         self._prompt: ChatPromptTemplate = FileRetrieverLLMServicePrompt.prompt_template
         self._chain = self._prompt | self._llm
 
-    def run(self, user_query: str, retriever: VectorStoreRetriever) -> str:
-        chain = {
+    def _with_retriever(self, retriever: VectorStoreRetriever):
+        return {
             "context": retriever,
             "user_query": RunnablePassthrough(),
         } | self._chain
+
+    def run(self, user_query: str, retriever: VectorStoreRetriever) -> str:
+        chain = self._with_retriever(retriever)
         result: FileRetrieverLLMService.OutputFormat = chain.invoke(user_query)
         return result.file_path
 
+    async def arun(self, user_query: str, retriever: VectorStoreRetriever) -> str:
+        chain = self._with_retriever(retriever)
+        result: FileRetrieverLLMService.OutputFormat = await chain.ainvoke(user_query)
+        return result.file_path
+
 class BrowserUseLLMService(BaseLLMService):
     class Result(BaseModel):
         download_file_url: str
@@ -127,10 +197,15 @@ class BrowserUseLLMService(BaseLLMService):
     def __init__(self, llm: BaseChatModel, planner_llm: Optional[BaseChatModel] = None):
         super().__init__(llm, name=self.__class__.__name__)
         self._planner_llm: Optional[BaseChatModel] = planner_llm
-        self._controler = Controller(output_model=self.Result)
+        self._controler = None
 
-    async def run(self, state, user_query: str):
-        """Run the browser agent with the given task."""
+    async def run(self, state, user_query: str, browser=None, browser_context=None):
+        """Run the browser agent with the given task, on a pooled browser when given."""
+        # browser_use is heavy, import it only when a web task runs
+        from browser_use import Agent, Controller, AgentHistoryList
+
+        if self._controler is None:
+            self._controler = Controller(output_model=self.Result)
         agent = Agent(
             task=user_query,
             llm=self._llm,
@@ -142,6 +217,8 @@ class BrowserUseLLMService(BaseLLMService):
             save_conversation_path=r"..\data\logs\browser_use_conversation",
             extend_system_message=f"If the following information is useful then you can reference it, if not, just ignore it. {state['web_manual']}",
             controller=self._controler,
+            browser=browser,
+            browser_context=browser_context,
         )
         history_list: AgentHistoryList = await agent.run(max_steps=25)
         is_successful: bool = history_list.is_successful()
@@ -177,6 +254,16 @@ class DispatcherLLMService(BaseLLMService):
         result: DispatcherLLMService.OutputFormat = self._chain.invoke(
             {"user_task_description": user_query}
         )
+        return self._to_task(result)
+
+    async def arun(self, user_query: str) -> str:
+        result: DispatcherLLMService.OutputFormat = await self._chain.ainvoke(
+            {"user_task_description": user_query}
+        )
+        return self._to_task(result)
+
+    @staticmethod
+    def _to_task(result: "DispatcherLLMService.OutputFormat") -> str:
         if result.is_web_task:
             return "web"
         elif result.is_filesystem_task:
@@ -198,14 +285,22 @@ class WebGuiderLLMService(BaseLLMService):
         self._prompt: ChatPromptTemplate = WebManualLLMServicePrompt.prompt_template
         self._chain = self._prompt | self._llm
 
-    def run(self, user_query: str, retriever: VectorStoreRetriever) -> str:
-        chain = {
+    def _with_retriever(self, retriever: VectorStoreRetriever):
+        return {
             "context": retriever,
             "user_query": RunnablePassthrough(),
         } | self._chain
+
+    def run(self, user_query: str, retriever: VectorStoreRetriever) -> str:
+        chain = self._with_retriever(retriever)
         result: WebGuiderLLMService.OutputFormat = chain.invoke(user_query)
         return result.content
 
+    async def arun(self, user_query: str, retriever: VectorStoreRetriever) -> str:
+        chain = self._with_retriever(retriever)
+        result: WebGuiderLLMService.OutputFormat = await chain.ainvoke(user_query)
+        return result.content
+
 class MessageSenderLLMService(BaseLLMService):
     def __init__(self, llm: BaseChatModel):
         super().__init__(llm, name=self.__class__.__name__)
@@ -214,22 +309,57 @@ class MessageSenderLLMService(BaseLLMService):
         self._llm = self._llm.bind_tools(self._tools)
         self._chain = self._prompt | self._llm
 
-    def run(
-        self, retriever: VectorStoreRetriever, user_query: str, file_path: str
-    ) -> str:
-        chain = (
+    def _with_retriever(self, retriever: VectorStoreRetriever):
+        return (
             RunnableMap(
                 {
-                    "context": RunnableLambda(
-                        lambda x: retriever.invoke(x["user_query"])
-                    ),  # retriever 只拿到 user_query
-                    "user_query": lambda x: x["user_query"],
-                    "file_path": lambda x: x["file_path"],
+                    "context": itemgetter("user_query")
+                    | retriever,  # retriever 只拿到 user_query
+                    "user_query": itemgetter("user_query"),
+                    "file_path": itemgetter("file_path"),
+                    "candidates": itemgetter("candidates"),
                 }
             )
             | self._chain
         )
-        result = chain.invoke({"user_query": user_query, "file_path": file_path})
+
+    @staticmethod
+    def _format_candidates(candidates: Optional[List[str]]) -> str:
+        return ", ".join(candidates) if candidates else "none"
+
+    def run(
+        self,
+        retriever: VectorStoreRetriever,
+        user_query: str,
+        file_path: str,
+        candidates: Optional[List[str]] = None,
+    ) -> str:
+        chain = self._with_retriever(retriever)
+        result = chain.invoke(
+            {
+                "user_query": user_query,
+                "file_path": file_path,
+                "candidates": self._format_candidates(candidates),
+            }
+        )
+        args = result.tool_calls[0]["args"]
+        return args
+
+    async def arun(
+        self,
+        retriever: VectorStoreRetriever,
+        user_query: str,
+        file_path: str,
+        candidates: Optional[List[str]] = None,
+    ) -> dict:
+        chain = self._with_retriever(retriever)
+        result = await chain.ainvoke(
+            {
+                "user_query": user_query,
+                "file_path": file_path,
+                "candidates": self._format_candidates(candidates),
+            }
+        )
         args = result.tool_calls[0]["args"]
         return args
 
@@ -245,11 +375,32 @@ class ActionReasoningLLMService(BaseLLMService):
         super().__init__(llm, self.OutputFormat, name=self.__class__.__name__)
         self._prompt: ChatPromptTemplate = ActionReasoningPrompt.prompt_template
         self._chain = self._prompt | self._llm
+        self._unchanged_chain = ActionReasoningPrompt.unchanged_prompt_template | self._llm
+
+    def _chain_for(self, after_image_url: Optional[str]):
+        # without an AFTER image the page did not change, one image is sent instead of two
+        return self._chain if after_image_url else self._unchanged_chain
 
     def run(
         self, user_query: str, before_image_url, after_image_url, step, step_text
     ) -> str:
-        result: ActionReasoningLLMService.OutputFormat = self._chain.invoke(
+        result: ActionReasoningLLMService.OutputFormat = self._chain_for(after_image_url).invoke(
+            {
+                "before_image_url": before_image_url,
+                "after_image_url": after_image_url,
+                "step": step,
+                "step_text": step_text,
+                "user_query": user_query,
+            }
+        )
+        return result.reasoning
+
+    async def arun(
+        self, user_query: str, before_image_url, after_image_url, step, step_text
+    ) -> str:
+        result: ActionReasoningLLMService.OutputFormat = await self._chain_for(
+            after_image_url
+        ).ainvoke(
             {
                 "before_image_url": before_image_url,
                 "after_image_url": after_image_url,
@@ -273,4 +424,13 @@ class SummarizerLLMService(BaseLLMService):
                 "extracted_content": extracted_content,
             }
         )
-        return result
\ No newline at end of file
+        return result
+
+    async def arun(self, user_query: str, extracted_content: str) -> str:
+        result: str = await self._chain.ainvoke(
+            {
+                "user_query": user_query,
+                "extracted_content": extracted_content,
+            }
+        )
+        return result
@@ -0,0 +1,467 @@
+import base64
+import os
+import queue
+import smtplib
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from email.message import EmailMessage
+from email.policy import SMTP
+from email.utils import formataddr, formatdate, getaddresses, make_msgid
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# 57 raw bytes encode to one 76-character base64 line
+_BASE64_LINE_BYTES = 57
+_READ_BYTES = _BASE64_LINE_BYTES * 1024
+
+
+def parse_address(address: str) -> Tuple[str, str]:
+    """
+    Display name and bare address of a single mailbox. CR/LF, several
+    addresses or anything without an `@` is rejected with ValueError, so
+    neither the headers nor the SMTP envelope can be injected into.
+    """
+    if "\r" in address or "\n" in address:
+        raise ValueError(f"Invalid email address: {address!r}")
+    addresses = getaddresses([address])
+    if len(addresses) != 1 or "@" not in addresses[0][1]:
+        raise ValueError(f"Invalid email address: {address!r}")
+    name, email = addresses[0]
+    return name, email
+
+
+def write_mime_message(
+    path: Path, sender: str, recipient: str, subject: str, body: str, attachment: str
+) -> None:
+    """
+    Write a multipart message with one attachment to `path`, encoding the
+    attachment in chunks so it is never held in memory as a whole. The headers
+    and MIME structure come from `email.message.EmailMessage`, which encodes
+    non-ASCII text and refuses header values with line breaks. Lines end with
+    CRLF, ready to be streamed as SMTP DATA.
+    """
+    message = EmailMessage(policy=SMTP)
+    message["From"] = formataddr(parse_address(sender))
+    message["To"] = formataddr(parse_address(recipient))
+    message["Subject"] = subject
+    message["Date"] = formatdate(localtime=True)
+    message["Message-ID"] = make_msgid()
+    message.set_content(body, charset="utf-8", cte="base64")
+    message.make_mixed()
+
+    # the attachment is streamed in place of a placeholder payload
+    placeholder = f"@@attachment-{uuid.uuid4().hex}@@"
+    part = EmailMessage(policy=SMTP)
+    part["Content-Type"] = "application/octet-stream"
+    part["Content-Transfer-Encoding"] = "base64"
+    part.add_header("Content-Disposition", "attachment", filename=Path(attachment).name)
+    part.set_payload(placeholder)
+    message.attach(part)
+    head, tail = message.as_bytes().split(placeholder.encode("ascii"))
+
+    with open(path, "wb") as out, open(attachment, "rb") as f:
+        out.write(head)
+        while chunk := f.read(_READ_BYTES):
+            out.write(base64.encodebytes(chunk).replace(b"\n", b"\r\n"))
+        # the encoded attachment already ends with a line break
+        out.write(tail.removeprefix(b"\r\n"))
+        out.flush()
+        os.fsync(out.fileno())
+
+
+class SMTPConnectionPool:
+    """
+    Summary:
+        Pool of authenticated SMTP sessions reused across messages.
+
+        A session is checked with NOOP before reuse when it has been idle for
+        more than `check_after` seconds and dropped after `idle_timeout`, since
+        servers close idle connections. Sessions that fail are discarded.
+
+    Args:
+        host (str): SMTP server.
+        port (int): SMTP port.
+        username (str, optional): login user, None skips authentication.
+        password (str, optional): login password.
+        starttls (bool): upgrade the connection with STARTTLS.
+        max_connections (int): sessions kept open at once.
+        idle_timeout (float): seconds after which an idle session is closed.
+        check_after (float): idle seconds after which a session is checked before reuse.
+        timeout (float): socket timeout in seconds.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        starttls: bool = True,
+        max_connections: int = 2,
+        idle_timeout: float = 240.0,
+        check_after: float = 10.0,
+        timeout: float = 30.0,
+    ):
+        self._host: str = host
+        self._port: int = port
+        self._username: Optional[str] = username
+        self._password: Optional[str] = password
+        self._starttls: bool = starttls
+        self._idle_timeout: float = idle_timeout
+        self._check_after: float = check_after
+        self._timeout: float = timeout
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._idle: "queue.LifoQueue[tuple]" = queue.LifoQueue()
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self._host, self._port, timeout=self._timeout)
+        smtp.ehlo()
+        if self._starttls:
+            smtp.starttls()
+            smtp.ehlo()
+        if self._username:
+            smtp.login(self._username, self._password)
+        return smtp
+
+    @staticmethod
+    def _close(smtp: smtplib.SMTP) -> None:
+        try:
+            smtp.quit()
+        except Exception:
+            smtp.close()
+
+    def _is_alive(self, smtp: smtplib.SMTP, idle_since: float) -> bool:
+        idle = time.monotonic() - idle_since
+        if idle > self._idle_timeout:
+            return False
+        if idle <= self._check_after:
+            return True
+        try:
+            return smtp.noop()[0] == 250
+        except OSError:
+            return False
+
+    @contextmanager
+    def connection(self) -> Iterator[smtplib.SMTP]:
+        with self._slots:
+            smtp: Optional[smtplib.SMTP] = None
+            while smtp is None:
+                try:
+                    candidate, idle_since = self._idle.get_nowait()
+                except queue.Empty:
+                    smtp = self._connect()
+                    break
+                if self._is_alive(candidate, idle_since):
+                    smtp = candidate
+                else:
+                    self._close(candidate)
+            try:
+                yield smtp
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                # the server answered, the session is fine: reset the transaction and keep it
+                try:
+                    smtp.rset()
+                except OSError:
+                    self._close(smtp)
+                    raise
+                self._idle.put((smtp, time.monotonic()))
+                raise
+            except BaseException:
+                # disconnects and socket errors (SMTPException is an OSError)
+                self._close(smtp)
+                raise
+            else:
+                self._idle.put((smtp, time.monotonic()))
+
+    def close(self) -> None:
+        while True:
+            try:
+                smtp, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(smtp)
+
+
+def send_spooled(smtp: smtplib.SMTP, sender: str, recipient: str, path: Path) -> None:
+    """Send a spooled message, streaming it as SMTP DATA with dot-stuffing."""
+    code, reply = smtp.mail(sender)
+    if code != 250:
+        raise smtplib.SMTPSenderRefused(code, reply, sender)
+    code, reply = smtp.rcpt(recipient)
+    if code not in (250, 251):
+        raise smtplib.SMTPRecipientsRefused({recipient: (code, reply)})
+    smtp.putcmd("data")
+    code, reply = smtp.getreply()
+    if code != 354:
+        raise smtplib.SMTPDataError(code, reply)
+    with open(path, "rb") as f:
+        for line in f:
+            if line.startswith(b"."):
+                line = b"." + line
+            smtp.send(line)
+    smtp.send(b".\r\n")
+    code, reply = smtp.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, reply)
+
+
+class OutboundMailQueue:
+    """
+    Summary:
+        Durable outbox for emails with attachments.
+
+        `enqueue` spools the MIME message to disk, records it in SQLite and
+        returns; the message is then on disk and survives a restart. Worker
+        threads send queued messages over pooled SMTP sessions, retrying
+        temporary failures with exponential backoff. Permanent rejections (5xx)
+        and messages out of attempts are marked failed. Messages that were being
+        sent when the process stopped are queued again on start.
+
+    Args:
+        directory (str): where the outbox database and spooled messages live.
+        pool (SMTPConnectionPool): SMTP sessions used to send.
+        sender (str): the From address.
+        workers (int): messages sent concurrently.
+        max_attempts (int): sending attempts before a message is failed.
+        initial_backoff (float): seconds before the first retry.
+        max_backoff (float): upper bound of the retry delay.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        pool: SMTPConnectionPool,
+        sender: str,
+        workers: int = 2,
+        max_attempts: int = 6,
+        initial_backoff: float = 5.0,
+        max_backoff: float = 600.0,
+    ):
+        self._directory = Path(directory)
+        self._spool_directory = self._directory / "spool"
+        self._spool_directory.mkdir(parents=True, exist_ok=True)
+        self._pool: SMTPConnectionPool = pool
+        self._sender: str = sender
+        self._workers: int = workers
+        self._max_attempts: int = max_attempts
+        self._initial_backoff: float = initial_backoff
+        self._max_backoff: float = max_backoff
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self._directory / "outbox.db"), check_same_thread=False
+        )
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=FULL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id TEXT PRIMARY KEY,
+                    recipient TEXT NOT NULL,
+                    spool_path TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def is_running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self) -> "OutboundMailQueue":
+        if self.is_running:
+            return self
+        with self._lock, self._conn:
+            # interrupted sends are retried, at-least-once delivery
+            self._conn.execute(
+                "UPDATE outbox SET status = 'queued' WHERE status = 'sending'"
+            )
+        self._stopping.clear()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"mail-queue-{i}", daemon=True)
+            for i in range(self._workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._pool.close()
+
+    def enqueue(
+        self,
+        recipient: str,
+        file_path: str,
+        subject: str = "Test Email",
+        body: str = "",
+    ) -> str:
+        """Spool and record a message; returns its id once it is safely on disk."""
+        # the envelope gets the bare address, the To header keeps the display name
+        _, address = parse_address(recipient)
+        message_id = uuid.uuid4().hex
+        spool_path = self._spool_directory / f"{message_id}.eml"
+        write_mime_message(
+            spool_path, self._sender, recipient, subject, body, file_path
+        )
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO outbox (id, recipient, spool_path, status, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?)",
+                (message_id, address, str(spool_path), now, now),
+            )
+        self.start()
+        self._wakeup.set()
+        return message_id
+
+    def status(self, message_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT recipient, status, attempts, last_error, created_at FROM outbox WHERE id = ?",
+                (message_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        recipient, status, attempts, last_error, created_at = row
+        return {
+            "id": message_id,
+            "recipient": recipient,
+            "status": status,
+            "attempts": attempts,
+            "last_error": last_error,
+            "created_at": created_at,
+        }
+
+    def _claim(self) -> Optional[tuple]:
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT id, recipient, spool_path, attempts FROM outbox "
+                "WHERE status = 'queued' AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at LIMIT 1",
+                (time.time(),),
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE outbox SET status = 'sending' WHERE id = ?", (row[0],)
+                )
+        return row
+
+    def _next_due_in(self) -> float:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'queued'"
+            ).fetchone()
+        if row[0] is None:
+            return 60.0
+        return max(0.0, row[0] - time.time())
+
+    def _finish(self, message_id: str, status: str, spool_path: str, **fields) -> None:
+        assignments = ", ".join(f"{name} = ?" for name in ("status", *fields))
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE outbox SET {assignments} WHERE id = ?",
+                (status, *fields.values(), message_id),
+            )
+        if status in ("sent", "failed"):
+            Path(spool_path).unlink(missing_ok=True)
+
+    @staticmethod
+    def _is_permanent(error: Exception) -> bool:
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            return all(code >= 500 for code, _ in error.recipients.values())
+        code = getattr(error, "smtp_code", None)
+        return code is not None and code >= 500
+
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            claimed = self._claim()
+            if claimed is None:
+                self._wakeup.wait(self._next_due_in())
+                self._wakeup.clear()
+                continue
+            message_id, recipient, spool_path, attempts = claimed
+            try:
+                with self._pool.connection() as smtp:
+                    send_spooled(smtp, self._sender, recipient, Path(spool_path))
+            except Exception as e:
+                attempts += 1
+                if self._is_permanent(e) or attempts >= self._max_attempts:
+                    print(f"郵件寄送失敗（{recipient}）：{e}")
+                    self._finish(
+                        message_id,
+                        "failed",
+                        spool_path,
+                        attempts=attempts,
+                        last_error=str(e),
+                    )
+                    continue
+                delay = min(
+                    self._initial_backoff * 2 ** (attempts - 1), self._max_backoff
+                )
+                self._finish(
+                    message_id,
+                    "queued",
+                    spool_path,
+                    attempts=attempts,
+                    last_error=str(e),
+                    next_attempt_at=time.time() + delay,
+                )
+                continue
+            self._finish(
+                message_id, "sent", spool_path, attempts=attempts + 1, last_error=None
+            )
+
+
+_mail_queue: Optional[OutboundMailQueue] = None
+_mail_queue_lock = threading.Lock()
+
+
+def get_mail_queue() -> OutboundMailQueue:
+    """
+    The process-wide outbox, configured from the environment and started on first
+    access, so mail left queued by a previous run is delivered without a new
+    `enqueue`. Point SMTP_HOST and SMTP_PORT at a local stand-in (for example
+    `python -m aiosmtpd -n -l localhost:8025` with SMTP_STARTTLS=false) to try
+    sending without Gmail.
+    """
+    global _mail_queue
+    with _mail_queue_lock:
+        if _mail_queue is None:
+            account = os.getenv("GMAIL_ACCOUNT")
+            pool = SMTPConnectionPool(
+                host=os.getenv("SMTP_HOST", "smtp.gmail.com"),
+                port=int(os.getenv("SMTP_PORT", "587")),
+                username=os.getenv("SMTP_USERNAME", account) or None,
+                password=os.getenv("SMTP_PASSWORD", os.getenv("GOOGLE_APP_PASSWORD")),
+                starttls=os.getenv("SMTP_STARTTLS", "true").lower() != "false",
+                max_connections=int(os.getenv("SMTP_CONNECTIONS", "2")),
+            )
+            _mail_queue = OutboundMailQueue(
+                directory=os.getenv("MAIL_QUEUE_DIR", "../data/mail_queue"),
+                pool=pool,
+                sender=os.getenv("MAIL_FROM", account) or "agent@localhost",
+                workers=int(os.getenv("SMTP_CONNECTIONS", "2")),
+            ).start()
+        return _mail_queue
+
+
+def shutdown_mail_queue() -> None:
+    """Stop the outbox workers if the outbox was ever used; queued mail stays on disk."""
+    with _mail_queue_lock:
+        if _mail_queue is not None:
+            _mail_queue.stop()
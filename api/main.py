@@ -1,99 +1,120 @@
 import asyncio
-from node import (
-    Synchronizer,
-    FileRetriever,
-    BrowserUse,
-    Dispatcher,
-    WebGuider,
-    UserActionRecorder,
-    MessageSender,
-    ActionReasoner,
-)
+from typing import Optional, Tuple
 from schemas import State
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
-from langgraph.graph import StateGraph, START, END
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-
-# embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-embeddings2 = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
-vectorstore_filesystem_manager = Chroma(
-    collection_name="filesystem_manager",
-    embedding_function=embeddings2,
-    persist_directory="../data/filesystem_manager_db",
-)
-vectorstore_web_manual = Chroma(
-    collection_name="web_user_manual",
-    embedding_function=embeddings2,
-    persist_directory="../data/web_user_manual_db",
-)
-vectorstore_email_contact = Chroma(
-    collection_name="email_contact",
-    embedding_function=embeddings2,
-    persist_directory="../data/email_contact_db",
-)
-
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0)
-
-synchronizer: Synchronizer = Synchronizer(
-    observed_directory="../data/mock_filesystem",
-    vectorstore=vectorstore_filesystem_manager,
-    llm=llm,
-    sleep_time_each_file_when_embedding=4,
-)
-
-file_retriever: FileRetriever = FileRetriever(
-    vectorstore=vectorstore_filesystem_manager,
-    llm=llm,
-)
-
-dispatcher: Dispatcher = Dispatcher(llm=llm)
-
-browser_use: BrowserUse = BrowserUse(
-    llm=llm,
-)
-messenge_sender: MessageSender = MessageSender(
-    llm=llm,
-    vectorstore=vectorstore_email_contact,
-)
-action_reasoner: ActionReasoner = ActionReasoner(
-    llm=llm,
-    vectorstore=vectorstore_web_manual,
-)
-webguider: WebGuider = WebGuider(vectorstore=vectorstore_web_manual, llm=llm, k=2)
-recorder: UserActionRecorder = UserActionRecorder()
-graph_builder = StateGraph(State)
-graph_builder.add_node(synchronizer.name, synchronizer.run)
-graph_builder.add_node(file_retriever.name, file_retriever.run)
-graph_builder.add_node(browser_use.name, browser_use.run)
-graph_builder.add_node(dispatcher.name, dispatcher.run)
-graph_builder.add_node(webguider.name, webguider.run)
-graph_builder.add_node(recorder.name, recorder.run)
-graph_builder.add_node(messenge_sender.name, messenge_sender.run)
-graph_builder.add_node(action_reasoner.name, action_reasoner.run)
-graph_builder.add_edge(file_retriever.name, messenge_sender.name)
-graph_builder.add_edge(START, dispatcher.name)
-graph_builder.add_conditional_edges(
-    dispatcher.name,
-    path=dispatcher.branch,
-    path_map=[webguider.name, synchronizer.name, recorder.name],
-)
-graph_builder.add_edge(synchronizer.name, file_retriever.name)
-graph_builder.add_edge(messenge_sender.name, END)
-graph_builder.add_edge(webguider.name, browser_use.name)
-graph_builder.add_edge(browser_use.name, END)
-graph_builder.add_edge(recorder.name, action_reasoner.name)
-graph_builder.add_edge(action_reasoner.name, END)
-graph = graph_builder.compile()
+from services import ServiceRegistry, get_registry
+from semantic_cache import TASK_COLLECTIONS, CachedResult
+
+_graph = None
+
+
+def build_graph(registry: ServiceRegistry):
+    from langgraph.graph import StateGraph, START, END
+
+    synchronizer = registry.synchronizer
+    file_retriever = registry.file_retriever
+    dispatcher = registry.dispatcher
+    browser_use = registry.browser_use
+    messenge_sender = registry.message_sender
+    action_reasoner = registry.action_reasoner
+    webguider = registry.webguider
+    recorder = registry.recorder
+
+    graph_builder = StateGraph(State)
+    graph_builder.add_node(synchronizer.name, synchronizer.run)
+    graph_builder.add_node(file_retriever.name, file_retriever.run)
+    graph_builder.add_node(browser_use.name, browser_use.run)
+    graph_builder.add_node(dispatcher.name, dispatcher.run)
+    graph_builder.add_node(webguider.name, webguider.run)
+    graph_builder.add_node(recorder.name, recorder.run)
+    graph_builder.add_node(messenge_sender.name, messenge_sender.run)
+    graph_builder.add_node(action_reasoner.name, action_reasoner.run)
+    graph_builder.add_edge(file_retriever.name, messenge_sender.name)
+    graph_builder.add_edge(START, dispatcher.name)
+    graph_builder.add_conditional_edges(
+        dispatcher.name,
+        path=dispatcher.branch,
+        path_map=[webguider.name, synchronizer.name, recorder.name],
+    )
+    graph_builder.add_edge(synchronizer.name, file_retriever.name)
+    graph_builder.add_edge(messenge_sender.name, END)
+    graph_builder.add_edge(webguider.name, browser_use.name)
+    graph_builder.add_edge(browser_use.name, END)
+    graph_builder.add_edge(recorder.name, action_reasoner.name)
+    graph_builder.add_edge(action_reasoner.name, END)
+    return graph_builder.compile()
+
+
+def get_graph(registry: Optional[ServiceRegistry] = None):
+    """The compiled agent graph, built on first use."""
+    global _graph
+    if _graph is None:
+        _graph = build_graph(registry or get_registry())
+    return _graph
+
+
+async def replay_cached_result(cached: CachedResult) -> dict:
+    """Return a cached result, re-running only the side effect it stands for."""
+    result: dict = {**cached.result, "from_cache": True}
+    if cached.task == "filesystem":
+        # the email must really be sent again, only dispatch/retrieval are skipped
+        result.update(
+            await get_registry().message_sender.send(
+                recipient=result["recipient"], file_path=result["retrieved_file_path"]
+            )
+        )
+    return result
+
+
+async def route_query(user_query: str) -> Tuple[dict, Optional[dict]]:
+    """
+    Summary:
+        Classify `user_query` and look it up in the semantic result cache.
+
+    Args:
+        user_query (str): the user's request.
+
+    Returns:
+        Tuple[dict, Optional[dict]]: the graph input carrying the routing, and the
+        replayed cached result when one matched (None otherwise).
+    """
+    registry = get_registry()
+    # 先分類再查快取：只比對同類任務的結果，recorder 需要使用者親自示範，不查快取
+    routing: dict = await registry.dispatcher.run({"user_query": user_query})
+    task: str = routing["task_classification"]
+    cached: Optional[CachedResult] = None
+    if task in TASK_COLLECTIONS:
+        try:
+            cached = await registry.result_cache.alookup(user_query, task)
+        except Exception as e:
+            print(f"語意快取查詢失敗：{e}")
+    # 已分類的查詢不會再經過 Dispatcher 的路由
+    inputs: dict = {"user_query": user_query, **routing}
+    if cached is None:
+        return inputs, None
+    print(f"使用快取結果（相似度 {cached.similarity:.3f}）：{cached.user_query}")
+    return inputs, {**routing, **await replay_cached_result(cached)}
+
+
+async def store_result(user_query: str, result: dict) -> None:
+    """Keep a finished graph result for similar later queries."""
+    try:
+        await get_registry().result_cache.astore(user_query, result)
+    except Exception as e:
+        print(f"語意快取寫入失敗：{e}")
+
 
 async def run_agent(user_query: str) -> dict:
-    result = await graph.ainvoke({"user_query": user_query})
+    inputs, cached = await route_query(user_query)
+    if cached is not None:
+        return cached
+    result = await get_graph().ainvoke(inputs)
+    await store_result(user_query, result)
     return result
 
+
 async def main():
     user_query = input("請輸入指令: ")
-    output = await graph.ainvoke(
+    output = await get_graph().ainvoke(
         {
             "user_query": user_query,
         }
@@ -102,4 +123,4 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
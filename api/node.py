@@ -2,13 +2,14 @@ from langchain_chroma import Chroma
 from schemas import FileSnapshot
 from pathlib import Path
 from tqdm import tqdm
-import time
-import base64
+from tqdm.asyncio import tqdm_asyncio
+import asyncio
+import os
+import traceback
+import uuid
 import json
-import requests
 from pydantic import BaseModel
-from mimetypes import guess_type
-from typing import List, Dict, Tuple
+from typing import Callable, List, Dict, Tuple, Optional
 from llm_services import (
     FileDescriptor,
     FileRetrieverLLMService,
@@ -19,7 +20,27 @@ from llm_services import (
     ActionReasoningLLMService,
     SummarizerLLMService,
 )
-from user_action_recorder_service import run_recorder
+from rate_limiter import RateLimiter, is_rate_limit_error
+from screenshot_pipeline import EncodedScreenshot, ScreenshotEncoder
+from recording_screenshots import load_screenshot_paths
+from vectorstore_writer import BatchedVectorStoreWriter
+from contacts import contact_hash, contact_id, parse_contacts
+from contact_index import ContactIndex
+from recipient_resolver import RecipientMatch, RecipientResolver
+from file_manifest import FileManifest, FileRecord, hash_file
+from filesystem_watcher import FilesystemWatcher
+from content_extractor import DEFAULT_MAX_MEMORY_BYTES, ContentExtractor
+from llm_cache import ResponseCache
+from dispatch_router import DispatchRouter, RouteDecision
+from browser_pool import BrowserLease, BrowserPool
+from downloader import DownloadError, DownloadResult, StreamingDownloader
+from recording_replay import (
+    ReplayEngine,
+    ReplayLibrary,
+    ReplayResult,
+    ReplayScript,
+    SelectorMiss,
+)
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
@@ -27,7 +48,7 @@ from langchain_core.vectorstores import VectorStoreRetriever
 
 from abc import ABC, abstractmethod
 from schemas import State
-from utils import send_email_with_attachment
+from utils import EMAIL_ERROR_PREFIX, send_email_with_attachment, run_blocking
 
 BASE_DIR = Path(__file__).resolve().parent.parent 
 
@@ -48,47 +69,94 @@ class Synchronizer(BaseService):
         llm: BaseChatModel = None,
         max_content_length: int = 100,
         sleep_time_each_file_when_embedding: int = 0,
+        max_concurrency: int = 8,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_retries: int = 5,
+        write_batch_size: int = 64,
+        write_batch_chars: int = 32_000,
+        manifest_path: str = "../data/filesystem_manifest.db",
+        watch_wait_timeout: float = 30.0,
+        extraction_processes: Optional[int] = None,
+        extraction_timeout: float = 20.0,
+        extraction_max_memory_bytes: Optional[int] = DEFAULT_MAX_MEMORY_BYTES,
+        description_cache_path: Optional[str] = "../data/llm_cache.db",
+        description_cache_max_entries: int = 100_000,
     ):
         super().__init__(name=self.__class__.__name__)
         self._observed_directory: str = observed_directory
         self._vectorstore: Chroma = vectorstore
+        # CPU-bound document parsing runs on its own process pool (0 = threads)
+        self._extractor: ContentExtractor = ContentExtractor(
+            max_chars=max_content_length,
+            timeout=extraction_timeout,
+            process_workers=(
+                os.cpu_count() or 1
+                if extraction_processes is None
+                else extraction_processes
+            ),
+            max_memory_bytes=extraction_max_memory_bytes,
+        )
         self._file_descriptor: FileDescriptor = FileDescriptor(
-            llm=llm, max_content_length=max_content_length
+            llm=llm,
+            max_content_length=max_content_length,
+            extractor=self._extractor,
+            cache=(
+                ResponseCache(
+                    description_cache_path,
+                    max_entries=description_cache_max_entries,
+                )
+                if description_cache_path
+                else None
+            ),
         )
         self._sleep_time_each_file_when_embedding: int = (
             sleep_time_each_file_when_embedding
         )
+        # the old fixed sleep per file is kept as an upper bound of the request rate
+        if requests_per_minute is None and sleep_time_each_file_when_embedding > 0:
+            requests_per_minute = 60 / sleep_time_each_file_when_embedding
+        self._max_concurrency: int = max_concurrency
+        self._max_retries: int = max_retries
+        self._rate_limiter: RateLimiter = RateLimiter(
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+        )
+        self._write_batch_size: int = write_batch_size
+        self._write_batch_chars: int = write_batch_chars
+        self._manifest: FileManifest = FileManifest(manifest_path)
+        self._watcher: Optional[FilesystemWatcher] = None
+        self._watch_wait_timeout: float = watch_wait_timeout
+        # content hashes computed by whoever wrote the file, keyed by path
+        self._known_hashes: Dict[str, Tuple[int, int, str]] = {}
 
-    def _get_last_modified_time(self, file: Path) -> int:
-        """Get the last modified time of a file."""
-        return int(file.stat().st_mtime)
+    @staticmethod
+    def _document_id(file_name: str) -> str:
+        """Stable vector store id of a file, so re-describing a file upserts in place."""
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, file_name))
 
-    def _get_file_snapshots_from_filesystem_dict(self) -> Dict[str, FileSnapshot]:
-        """Get current file snapshots from the filesystem."""
-        # Assuming the mock filesystem is located at "../data/mock_filesystem"
-        files: List[Path] = [
-            path for path in Path(self._observed_directory).rglob("*") if path.is_file()
-        ]
-        file_snapshots: Dict[str, FileSnapshot] = {
-            str(file): FileSnapshot(
-                file_name=str(file),
-                last_modified_time=self._get_last_modified_time(file),
-            )
-            for file in files
-        }
-        return file_snapshots
+    @property
+    def observed_directory(self) -> str:
+        return self._observed_directory
 
-    # def _get_file_snapshots_from_filesystem_list(
-    #     self
-    # ) -> List[FileSnapshot]:
-    #     files: List[Path] = [path for path in Path(self._observed_directory).rglob("*") if path.is_file()]
-    #     file_snapshots: List[FileSnapshot] = [
-    #         FileSnapshot(
-    #             file_name=str(file), last_modified_time=self._get_last_modified_time(file)
-    #         )
-    #         for file in files
-    #     ]
-    #     return file_snapshots
+    def _scan_filesystem(
+        self, paths: Optional[List[str]] = None
+    ) -> Dict[str, os.stat_result]:
+        """Stat every file under the observed directory, or only under `paths`."""
+        roots: List[Path] = (
+            [Path(self._observed_directory)]
+            if paths is None
+            else [Path(path) for path in paths]
+        )
+        files: Dict[str, os.stat_result] = {}
+        for root in roots:
+            if root.is_file():
+                files[str(root)] = root.stat()
+            elif root.is_dir():
+                files.update(
+                    {str(path): path.stat() for path in root.rglob("*") if path.is_file()}
+                )
+        return files
 
     def _get_file_snapshots_from_vectorstore_dict(self) -> Dict[str, FileSnapshot]:
         metadatas = self._vectorstore.get(include=["metadatas"])["metadatas"]
@@ -105,95 +173,318 @@ class Synchronizer(BaseService):
     #     ]
     #     return vector_db_snapshots
 
+    def _bootstrap_manifest(self, current_files: Dict[str, os.stat_result]) -> None:
+        """
+        Seed an empty manifest from a vector store built before the manifest existed.
+        Records whose file still has the stored mtime are trusted and hashed once.
+        """
+        records: List[FileRecord] = []
+        for file_snapshot in self._get_file_snapshots_from_vectorstore_dict().values():
+            stat = current_files.get(file_snapshot.file_name)
+            if stat is None or int(stat.st_mtime) != file_snapshot.last_modified_time:
+                continue
+            records.append(
+                FileRecord.from_stat(
+                    file_snapshot.file_name, stat, hash_file(file_snapshot.file_name)
+                )
+            )
+        self._manifest.upsert(records)
+
     def _get_need_sync_files(
-        self,
-    ) -> Tuple[Dict[str, FileSnapshot], Dict[str, FileSnapshot]]:
+        self, paths: Optional[List[str]] = None
+    ) -> Tuple[
+        List[FileRecord], List[str], List[Tuple[str, FileRecord]], List[Tuple[str, FileRecord]]
+    ]:
         """
         Summary:
-            Extracts deleated file, new files and modified files by comparing current and previous file snapshots.
+            Compares the filesystem with the manifest of described files.
 
-            A file is considered deleated if it no longer exists in the filesystem.
-            A file is considered modified if the timestamp of the file has changed.
-            A file is considered new if it appears in the current snapshot but not in
-            the previous one.
+            A file whose size, mtime_ns and inode match the manifest is unchanged and not hashed.
+            A file whose stat changed but whose content hash did not is only refreshed in the manifest.
+            A new path with the inode or content hash of a vanished path is a move and is relinked.
+            A new path with the content hash of another existing file is a copy and reuses its description.
+            Every other new or modified file needs a description from the LLM.
+            A manifest path that is no longer on disk and was not moved is deleted.
 
-            These files need to be synchronized with vector database which store the previous file data.
+            With `paths`, only those files and directories are compared (used by the watcher).
 
         Returns:
-            List[FileSnapshot]: A list of `FileSnapshot` instances representing files
-            that are either outdated or newly added.
+            Tuple: (need_update_files, need_delete_files, need_relink_files, need_copy_files),
+            where relink and copy entries are (source path, new `FileRecord`) pairs.
         """
+        if len(self._manifest) == 0:
+            # the bootstrap needs the whole tree
+            paths = None
+        current_files: Dict[str, os.stat_result] = self._scan_filesystem(paths)
+        if len(self._manifest) == 0:
+            self._bootstrap_manifest(current_files)
+        manifest: Dict[str, FileRecord] = self._manifest.all()
 
-        # Load the previous file snapshots
-        previous_file_snapshots: Dict[str, FileSnapshot] = (
-            self._get_file_snapshots_from_vectorstore_dict()
+        scanned_prefixes: Optional[Tuple[str, ...]] = (
+            None
+            if paths is None
+            else tuple(str(Path(path)) + os.sep for path in paths)
         )
-
-        # extract files thar are no longer exist
-        outdated_files: Dict[str, FileSnapshot] = {
-            file.file_name: file
-            for file in previous_file_snapshots.values()
-            if not Path(file.file_name).exists()
+        scanned_paths = set() if paths is None else {str(Path(path)) for path in paths}
+        vanished: Dict[str, FileRecord] = {
+            path: record
+            for path, record in manifest.items()
+            if path not in current_files
+            and (
+                scanned_prefixes is None
+                or path in scanned_paths
+                or path.startswith(scanned_prefixes)
+            )
         }
-        previous_file_snapshots = {
-            file.file_name: file
-            for file in previous_file_snapshots.values()
-            if Path(file.file_name).exists()
+        vanished_by_inode: Dict[Tuple[int, int, int], FileRecord] = {
+            (record.inode, record.size, record.mtime_ns): record
+            for record in vanished.values()
         }
-
-        # extract new files and modified files
-        current_file_snapshot: Dict[str, FileSnapshot] = (
-            self._get_file_snapshots_from_filesystem_dict()
-        )
-        new_files: Dict[str, FileSnapshot] = {
-            file.file_name: file
-            for file in current_file_snapshot.values()
-            if file.file_name not in previous_file_snapshots.keys()
+        vanished_by_hash: Dict[str, FileRecord] = {
+            record.content_hash: record for record in vanished.values()
         }
-
-        # extract modified files
-        modified_files: Dict[str, FileSnapshot] = {
-            file.file_name: file
-            for file in previous_file_snapshots.values()
-            if file.last_modified_time
-            != current_file_snapshot.get(file.file_name).last_modified_time
+        indexed_by_hash: Dict[str, str] = {
+            record.content_hash: path
+            for path, record in manifest.items()
+            if path not in vanished
         }
 
-        need_update_files: List[FileSnapshot] = list(modified_files.values()) + list(
-            new_files.values()
+        need_update_files: List[FileRecord] = []
+        need_relink_files: List[Tuple[str, FileRecord]] = []
+        need_copy_files: List[Tuple[str, FileRecord]] = []
+        touched_files: List[FileRecord] = []
+        for path, stat in current_files.items():
+            known: Optional[FileRecord] = manifest.get(path)
+            if known is not None and known.matches_stat(stat):
+                continue
+
+            # a rename keeps inode, size and mtime, so it is relinked without hashing
+            moved = vanished_by_inode.get((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+            if known is None and moved is not None and moved.path in vanished:
+                vanished.pop(moved.path)
+                need_relink_files.append(
+                    (moved.path, FileRecord.from_stat(path, stat, moved.content_hash))
+                )
+                continue
+
+            try:
+                record = FileRecord.from_stat(path, stat, self._content_hash(path, stat))
+            except OSError as e:
+                print(f"無法讀取檔案 {path}: {e}")
+                continue
+            if known is not None and known.content_hash == record.content_hash:
+                touched_files.append(record)
+                continue
+
+            moved = vanished_by_hash.get(record.content_hash)
+            if moved is not None and moved.path in vanished:
+                vanished.pop(moved.path)
+                need_relink_files.append((moved.path, record))
+                continue
+
+            source = indexed_by_hash.get(record.content_hash)
+            if source is not None and source != path:
+                need_copy_files.append((source, record))
+                continue
+
+            need_update_files.append(record)
+
+        # unchanged content only refreshes its stat, it never leaves the manifest
+        self._manifest.upsert(touched_files)
+        need_delete_files: List[str] = list(vanished.keys())
+        return need_update_files, need_delete_files, need_relink_files, need_copy_files
+
+    def _content_hash(self, path: str, stat: os.stat_result) -> str:
+        known = self._known_hashes.pop(path, None)
+        if known is not None and known[:2] == (stat.st_size, stat.st_mtime_ns):
+            return known[2]
+        return hash_file(path)
+
+    def register_file(self, path: str, content_hash: str) -> None:
+        """
+        Index a file written by the agent itself, whose hash is already known,
+        so it is not read again before being described.
+        """
+        path = str(Path(path))
+        stat = os.stat(path)
+        self._known_hashes[path] = (stat.st_size, stat.st_mtime_ns, content_hash)
+        if self._watcher is not None and self._watcher.is_running:
+            self._watcher.notify(path)
+
+    @staticmethod
+    def _metadata(record: FileRecord) -> Dict:
+        return FileSnapshot(
+            file_name=record.path,
+            last_modified_time=record.last_modified_time,
+            content_hash=record.content_hash,
+        ).model_dump()
+
+    def _reuse_description(
+        self, source_path: str, record: FileRecord, remove_source: bool
+    ) -> bool:
+        """
+        Summary:
+            Store the description and embedding of `source_path` under `record.path`
+            without calling the LLM. Used for moved files and for copies.
+
+        Returns:
+            bool: False if the source has no stored description.
+        """
+        stored = self._vectorstore._collection.get(
+            where={"file_name": source_path},
+            include=["embeddings", "documents"],
+            limit=1,
         )
-        need_delete_files: List[FileSnapshot] = list(outdated_files.values())
+        if not stored["ids"]:
+            return False
+        self._vectorstore.delete(where={"file_name": record.path})
+        self._vectorstore._collection.upsert(
+            ids=[self._document_id(record.path)],
+            embeddings=[stored["embeddings"][0]],
+            documents=[stored["documents"][0]],
+            metadatas=[self._metadata(record)],
+        )
+        if remove_source:
+            self._vectorstore.delete(where={"file_name": source_path})
+        return True
 
-        return need_update_files, need_delete_files
+    async def _describe_file(
+        self, record: FileRecord, semaphore: asyncio.Semaphore
+    ) -> Optional[Document]:
+        """
+        Summary:
+            Describe one file under the concurrency and rate limits.
+            Rate limited calls are retried with the limiter's adaptive backoff,
+            other failures skip the file so it is picked up again on the next sync.
+        """
+        # extraction is bounded by the extractor's pool, only LLM calls hold the semaphore
+        try:
+            content: str = await self._file_descriptor.aread_content(record.path)
+        except Exception as e:
+            print(f"無法讀取檔案 {record.path}: {e}")
+            return None
+        cached: Optional[str] = self._file_descriptor.lookup_cache(content)
+        if cached is not None:
+            return Document(page_content=cached, metadata=self._metadata(record))
+        async with semaphore:
+            tokens: int = self._file_descriptor.estimate_tokens(content)
+            for attempt in range(self._max_retries + 1):
+                await self._rate_limiter.acquire(tokens=tokens)
+                try:
+                    description: str = await self._file_descriptor.adescribe(
+                        content, check_cache=False
+                    )
+                except Exception as e:
+                    if is_rate_limit_error(e) and attempt < self._max_retries:
+                        self._rate_limiter.report_rate_limited()
+                        continue
+                    print(f"無法產生檔案描述 {record.path}: {e}")
+                    return None
+                self._rate_limiter.report_success()
+                return Document(page_content=description, metadata=self._metadata(record))
+
+    def watch(self, **kwargs) -> FilesystemWatcher:
+        """Start a background watcher that keeps the index fresh; see `FilesystemWatcher`."""
+        if self._watcher is None or not self._watcher.is_running:
+            self._watcher = FilesystemWatcher(self, **kwargs).start()
+        return self._watcher
+
+    def unwatch(self) -> None:
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
 
-    def run(self, state: State) -> None:
-        need_delete_files: List[FileSnapshot] = []
-        need_update_files: List[FileSnapshot] = []
+    async def sync(self, paths: Optional[List[str]] = None) -> None:
+        """Sync the whole observed directory, or only `paths`, into the vector store."""
+        need_update_files, need_delete_files, need_relink_files, need_copy_files = (
+            await asyncio.to_thread(self._get_need_sync_files, paths)
+        )
 
-        need_update_files, need_delete_files = self._get_need_sync_files()
+        # moves and copies reuse stored descriptions, before any record is replaced
+        reused_files: List[Tuple[str, FileRecord, bool]] = [
+            (source_path, record, True) for source_path, record in need_relink_files
+        ] + [(source_path, record, False) for source_path, record in need_copy_files]
+        for source_path, record, is_move in tqdm(
+            reused_files, desc="Relinking moved and copied files"
+        ):
+            if not self._reuse_description(source_path, record, remove_source=is_move):
+                need_update_files.append(record)
+                if is_move:
+                    need_delete_files.append(source_path)
+                continue
+            if is_move:
+                self._manifest.relink(source_path, record)
+            else:
+                self._manifest.upsert([record])
 
         if need_delete_files:
-            for file_snapshot in tqdm(
+            for file_name in tqdm(
                 need_delete_files, desc="Deleting files from vector database"
             ):
-                self._vectorstore.delete(where={"file_name": file_snapshot.file_name})
+                self._vectorstore.delete(where={"file_name": file_name})
+            self._manifest.delete(need_delete_files)
 
         if need_update_files:
-            documents: list[Document] = []
-            for file_snapshot in tqdm(
-                need_update_files, desc="Creating files description"
+            # the old records stay until the new description is written, so a file
+            # whose description fails keeps its stale entry instead of none
+            writer = BatchedVectorStoreWriter(
+                self._vectorstore,
+                max_batch_size=self._write_batch_size,
+                max_batch_chars=self._write_batch_chars,
+            )
+            records: Dict[str, FileRecord] = {
+                self._document_id(record.path): record for record in need_update_files
+            }
+            semaphore = asyncio.Semaphore(self._max_concurrency)
+            tasks = [
+                asyncio.create_task(self._describe_file(record, semaphore))
+                for record in need_update_files
+            ]
+            described: List[str] = []
+            for task in tqdm(
+                asyncio.as_completed(tasks),
+                total=len(tasks),
+                desc="Creating files description",
             ):
-                content = self._file_descriptor.run(file_snapshot.file_name)
-                metadata = {
-                    "file_name": file_snapshot.file_name,
-                    "last_modified_time": file_snapshot.last_modified_time,
-                }
-                time.sleep(4)
-                documents.append(Document(page_content=content, metadata=metadata))
-                self._vectorstore.add_documents(
-                    [Document(page_content=content, metadata=metadata)]
-                )
-        return
+                document: Optional[Document] = await task
+                if document is not None:
+                    document_id = self._document_id(document.metadata["file_name"])
+                    described.append(document_id)
+                    await asyncio.to_thread(writer.add, document, document_id)
+            await asyncio.to_thread(writer.flush)
+            failed = {document_id for document_id, _ in writer.failed}
+            written: List[str] = [
+                document_id for document_id in described if document_id not in failed
+            ]
+            await asyncio.to_thread(self._delete_leftover_records, written, records)
+            # only files whose description reached the vector store enter the manifest
+            self._manifest.upsert(records[document_id] for document_id in written)
+
+    def _delete_leftover_records(
+        self, written: List[str], records: Dict[str, FileRecord]
+    ) -> None:
+        """Drop other records of rewritten files, e.g. written before ids were stable."""
+        if not written:
+            return
+        stored = self._vectorstore._collection.get(
+            where={"file_name": {"$in": [records[document_id].path for document_id in written]}},
+            include=[],
+        )
+        kept = set(written)
+        leftover: List[str] = [id for id in stored["ids"] if id not in kept]
+        if leftover:
+            self._vectorstore.delete(ids=leftover)
+
+    async def run(self, state: State) -> None:
+        if self._watcher is not None and self._watcher.is_running:
+            # the watcher keeps the index fresh, only changes not yet synced are waited on;
+            # file names say nothing reliable about a query (e.g. a Chinese query and an
+            # English file name), so every pending path is waited on
+            await self._watcher.wait_for(
+                self._watcher.pending_paths(), timeout=self._watch_wait_timeout
+            )
+            return
+        await self.sync()
 
 
 class FileRetriever(BaseService):
@@ -214,10 +505,10 @@ class FileRetriever(BaseService):
             search_type=serch_type, search_kwargs={"k": k}
         )
 
-    def run(self, state: State) -> str:
+    async def run(self, state: State) -> str:
         """Retrieve files from the vector database based on the query."""
         query = state["user_query"]
-        result: str = self._file_retriever_llm_service.run(
+        result: str = await self._file_retriever_llm_service.arun(
             user_query=query, retriever=self._retriever
         )
         return {"retrieved_file_path": result}
@@ -225,47 +516,106 @@ class FileRetriever(BaseService):
 
 class BrowserUse(BaseService):
     
-    def __init__(self, llm: BaseChatModel, planner_llm: BaseChatModel = None):
+    def __init__(
+        self,
+        llm: BaseChatModel,
+        planner_llm: BaseChatModel = None,
+        replay_engine: Optional[ReplayEngine] = None,
+        browser_pool: Optional[BrowserPool] = None,
+        downloader: Optional[StreamingDownloader] = None,
+        on_download: Optional[Callable[[str, str], None]] = None,
+    ):
         super().__init__(name=self.__class__.__name__)
         self._browser_use_llm_service: BrowserUseLLMService = BrowserUseLLMService(
             llm=llm,
             planner_llm=planner_llm,
         )
+        self._replay_engine: Optional[ReplayEngine] = replay_engine
+        self._browser_pool: Optional[BrowserPool] = browser_pool
+        self._downloader: StreamingDownloader = downloader or StreamingDownloader(
+            str(BASE_DIR / Path("data/mock_filesystem"))
+        )
+        # called with (path, content_hash) so the indexer can skip rereading the file
+        self._on_download: Optional[Callable[[str, str], None]] = on_download
 
-    def _download(self, url: str) -> str:
-        file_name = Path(url).name
-        file_path = BASE_DIR / Path("data/mock_filesystem") / file_name
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        response = requests.get(url)
-        if response.status_code == 200:
-            with open(file_path, 'wb') as f:
-                f.write(response.content)
-            print(f"檔案已成功下載為 {file_path}")
-        else:
-            print(f"下載失敗，HTTP 狀態碼：{response.status_code}")
-        return str(file_name)
+    async def _download(self, url: str) -> Optional[str]:
+        try:
+            download: DownloadResult = await self._downloader.download(url)
+        except DownloadError as e:
+            print(f"下載失敗：{e}")
+            return None
+        print(f"檔案已成功下載為 {download.path}")
+        if self._on_download is not None:
+            self._on_download(download.path, download.content_hash)
+        return download.file_name
     
-    async def run(self, state: State) -> None:
+    async def _replay(self, state: State, lease: Optional[BrowserLease]) -> Optional[dict]:
+        script = ReplayScript.from_dict(state["replay_script"])
+        try:
+            replay: ReplayResult = await self._replay_engine.run(
+                script, state.get("replay_params") or {}, lease=lease
+            )
+        except SelectorMiss as e:
+            print(f"{e}，改由瀏覽器代理接手")
+            return None
+        except Exception as e:
+            # navigation errors, closed pages, failed downloads... the agent can still do the task
+            print(f"重播失敗，改由瀏覽器代理接手：{e!r}")
+            traceback.print_exc()
+            return None
+        if self._on_download is not None:
+            for download in replay.downloads:
+                self._on_download(download.path, download.content_hash)
+        return {
+            "browser_use_is_done": True,
+            "extracted_content": replay.extracted_content,
+            "file_name": replay.file_name,
+            "replayed_steps": replay.completed_steps,
+        }
+
+    async def _run_with(self, state: State, lease: Optional[BrowserLease]) -> dict:
         user_query = state["user_query"]
+        if self._replay_engine is not None and state.get("replay_script"):
+            replayed: Optional[dict] = await self._replay(state, lease)
+            if replayed is not None:
+                return replayed
+        browser_kwargs: dict = {}
+        if lease is not None:
+            browser_kwargs = {
+                "browser": lease.browser,
+                "browser_context": await lease.agent_context(),
+            }
         result, is_successful = await self._browser_use_llm_service.run(
-            user_query=user_query, state=state
+            user_query=user_query, state=state, **browser_kwargs
         )
         file_name = None
         if result.download_file_url:
-            file_name: str = self._download(result.download_file_url)
+            file_name = await self._download(result.download_file_url)
         return {
             "browser_use_is_done": is_successful,
             "extracted_content": result.extracted_content,
             "file_name": file_name if file_name else None
         }
 
+    async def run(self, state: State) -> None:
+        if self._browser_pool is None:
+            return await self._run_with(state, None)
+        # a warm pooled browser with a private context per task
+        async with self._browser_pool.lease() as lease:
+            return await self._run_with(state, lease)
+
 
 class Dispatcher(BaseService):
-    def __init__(self, llm: BaseChatModel = None):
+    def __init__(self, llm: BaseChatModel = None, router: Optional[DispatchRouter] = None):
         super().__init__(name=self.__class__.__name__)
         self._llm_service: DispatcherLLMService = DispatcherLLMService(
             llm=llm,
         )
+        self._router: Optional[DispatchRouter] = router
+
+    @property
+    def router(self) -> Optional[DispatchRouter]:
+        return self._router
 
     def branch(self, state: State) -> str:
         print("tast_classification:", state["task_classification"])
@@ -278,10 +628,24 @@ class Dispatcher(BaseService):
         else:
             raise ValueError("Invalid task classification.")
 
-    def run(self, state: State):
+    async def run(self, state: State):
+        if state.get("task_classification"):
+            # run_agent already dispatched the query before consulting the result cache
+            return {}
         user_query = state["user_query"]
-        task: str = self._llm_service.run(user_query=user_query)
-        return {"task_classification": task}
+        if self._router is None:
+            task: str = await self._llm_service.arun(user_query=user_query)
+            return {"task_classification": task}
+        # cache, keyword rules and embedding centroids first, the LLM only when unsure
+        decision: RouteDecision = await self._router.aroute(
+            user_query,
+            llm_fallback=lambda query: self._llm_service.arun(user_query=query),
+        )
+        return {
+            "task_classification": decision.task,
+            "dispatch_source": decision.source,
+            "dispatch_confidence": decision.confidence,
+        }
 
 
 class WebGuider(BaseService):
@@ -291,6 +655,7 @@ class WebGuider(BaseService):
         llm: BaseChatModel,
         serch_type: str = "similarity",
         k: int = 2,
+        replay_library: Optional[ReplayLibrary] = None,
     ):
         super().__init__(name=self.__class__.__name__)
         self._web_guider_llm_service: WebGuiderLLMService = WebGuiderLLMService(
@@ -299,10 +664,21 @@ class WebGuider(BaseService):
         self._retriever = vectorstore.as_retriever(
             search_type=serch_type, search_kwargs={"k": k}
         )
+        self._replay_library: Optional[ReplayLibrary] = replay_library
 
-    def run(self, state: State) -> str:
+    async def run(self, state: State) -> str:
         user_query = state["user_query"]
-        result: str = self._web_guider_llm_service.run(
+        if self._replay_library is not None:
+            # a task the user already demonstrated is replayed without asking the LLM
+            match = await run_blocking(self._replay_library.find, user_query)
+            if match is not None:
+                script, params = match
+                return {
+                    "web_manual": script.describe(),
+                    "replay_script": script.to_dict(),
+                    "replay_params": params,
+                }
+        result: str = await self._web_guider_llm_service.arun(
             user_query=user_query, retriever=self._retriever
         )
         return {"web_manual": result}
@@ -312,8 +688,12 @@ class UserActionRecorder(BaseService):
     def __init__(self):
         super().__init__(name=self.__class__.__name__)
 
-    def run(self, state: State) -> None:
-        run_recorder(state=state)
+    async def run(self, state: State) -> None:
+        # selenium is only needed while recording
+        from user_action_recorder_service import run_recorder
+
+        # a recording session blocks for minutes, keep it off the event loop
+        await run_blocking(run_recorder, state=state, pool="recorder")
         
 
 
@@ -329,6 +709,8 @@ class MessageSender(BaseService):
         llm: BaseChatModel,
         serch_type: str = "similarity",
         k: int = 4,
+        contact_index: Optional[ContactIndex] = None,
+        resolver: Optional[RecipientResolver] = None,
     ):
         super().__init__(name=self.__class__.__name__)
         self._vectorstore = vectorstore
@@ -338,75 +720,217 @@ class MessageSender(BaseService):
         self._retriever: VectorStoreRetriever = vectorstore.as_retriever(
             search_type=serch_type, search_kwargs={"k": k}
         )
+        # listing, lookups and counts go to the side table, Chroma only holds embeddings
+        self._contact_index: ContactIndex = contact_index or ContactIndex()
+        self._contact_index_checked: bool = False
+        # names and addresses that can be matched without the LLM
+        self._resolver: RecipientResolver = resolver or RecipientResolver(self._contact_index)
+
+    @property
+    def contact_index(self) -> ContactIndex:
+        return self._ensure_contact_index()
+
+    def _ensure_contact_index(self) -> ContactIndex:
+        """The contact side table, filled from Chroma on first use."""
+        if not self._contact_index_checked:
+            # built once from Chroma when missing or out of step, e.g. on first start
+            if self._contact_index.count() != self._vectorstore._collection.count():
+                stored = self._vectorstore.get(include=["metadatas"])
+                self._contact_index.replace_all(
+                    (doc_id, metadata or {})
+                    for doc_id, metadata in zip(stored["ids"], stored["metadatas"])
+                )
+            self._contact_index_checked = True
+        return self._contact_index
+
+    def list_contacts(
+        self,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        prefix: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        return self.contact_index.page(limit=limit, cursor=cursor, prefix=prefix)
         
-    def update_contact(self, contact_entries: list[ContactEntry]):
-        all_ids = self._vectorstore.get()['ids']
-        if all_ids:
-            self._vectorstore.delete(ids=all_ids)
-            print(f"🧹 已清除舊有 {len(all_ids)} 筆聯絡人")
-
-        docs = []
-        for contact in contact_entries:
+    def update_contact(self, contact_entries: list[ContactEntry]) -> Dict[str, int]:
+        """Make the address book equal to `contact_entries`, touching only changed contacts."""
+        return self.sync_contacts(
+            [
+                {"name": contact.name, "description": contact.description, "email": contact.email}
+                for contact in contact_entries
+            ],
+            remove_missing=True,
+        )
+
+    def import_contacts(self, text: str, file_name: str = "") -> Dict[str, int]:
+        """Merge a CSV or vCard export into the address book."""
+        return self.sync_contacts(parse_contacts(text, file_name), remove_missing=False)
+
+    def sync_contacts(
+        self, contacts: List[Dict[str, str]], remove_missing: bool = False
+    ) -> Dict[str, int]:
+        """
+        Summary:
+            Diff-based contact sync. Every contact is stored under a stable id derived
+            from its normalised email with the hash of its fields in the metadata, so
+            only new or changed contacts are embedded (in batches) and only contacts
+            missing from `contacts` are deleted when `remove_missing` is set.
+
+        Returns:
+            Dict[str, int]: counts of added, updated, deleted and unchanged contacts.
+        """
+        wanted: Dict[str, Tuple[str, Dict[str, str]]] = {}
+        for contact in contacts:
+            # the last entry of a duplicated email wins
+            wanted[contact_id(contact["email"])] = (
+                contact_hash(contact["name"], contact["description"], contact["email"]),
+                contact,
+            )
+
+        contact_index: ContactIndex = self.contact_index
+        stored: Dict[str, Tuple[Optional[str], str]] = contact_index.hashes()
+        stored_hashes: Dict[str, Optional[str]] = {
+            doc_id: content_hash for doc_id, (content_hash, _) in stored.items()
+        }
+
+        writer = BatchedVectorStoreWriter(self._vectorstore)
+        written: Dict[str, Dict] = {}
+        counts: Dict[str, int] = {"added": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+        for doc_id, (content_hash, contact) in wanted.items():
+            if stored_hashes.get(doc_id) == content_hash:
+                counts["unchanged"] += 1
+                continue
+            counts["updated" if doc_id in stored_hashes else "added"] += 1
             metadata = {
-                "name": contact.name,
-                "description": contact.description,
-                "email": contact.email,
+                "name": contact["name"],
+                "description": contact["description"],
+                "email": contact["email"],
+                "content_hash": content_hash,
             }
-            content = f"聯絡人資料：{contact.name}"  # 可選，主要內容可簡寫
-            docs.append(Document(page_content=content, metadata=metadata))
+            content = f"聯絡人資料：{contact['name']}"  # 可選，主要內容可簡寫
+            writer.add(Document(page_content=content, metadata=metadata), doc_id)
+            written[doc_id] = metadata
+        writer.flush()
+        if writer.failed:
+            print(f"⚠️ {len(writer.failed)} 筆聯絡人寫入失敗")
+            for doc_id, _ in writer.failed:
+                written.pop(doc_id, None)
+        contact_index.upsert(written.items())
 
-        print(f"📄 將新增 {len(docs)} 筆聯絡人（含 metadata）")
-        self._vectorstore.add_documents(docs)
+        # entries stored before ids were stable are replaced by their stable copy
+        to_delete: List[str] = [
+            doc_id
+            for doc_id, (content_hash, email) in stored.items()
+            if doc_id not in wanted
+            and (remove_missing or (content_hash is None and contact_id(email) in wanted))
+        ]
+        if to_delete:
+            self._vectorstore.delete(ids=to_delete)
+            contact_index.delete(to_delete)
+        counts["deleted"] = len(to_delete)
+        print(
+            f"📄 聯絡人同步：新增 {counts['added']}、更新 {counts['updated']}、"
+            f"刪除 {counts['deleted']}、未變更 {counts['unchanged']}"
+        )
+        return counts
 
     def delete_contact_by_name(self, name: str):
-        docs = self._vectorstore.get(include=["metadatas"])
-        ids = docs.get("ids", [])
-        metadatas = docs.get("metadatas", [])
-
-        to_delete = [
-            doc_id for doc_id, meta in zip(ids, metadatas)
-            if meta and meta.get("name") == name
-        ]
+        to_delete: List[str] = self.contact_index.ids_by_name(name)
 
         if to_delete:
             self._vectorstore.delete(ids=to_delete)
+            self._contact_index.delete(to_delete)
             print(f"✅ 已刪除聯絡人：{name}")
         else:
             print(f"⚠️ 找不到聯絡人：{name}")
 
             
-    def run(self, state: State) -> None:
+    async def run(self, state: State) -> None:
         user_query: str = state["user_query"]
         file_path: str = state["retrieved_file_path"]
-        args: dict = self._llm_service.run(
-            user_query=user_query, file_path=file_path, retriever=self._retriever
-        )
-        file_name: str = Path(args["file_path"]).name
-        recipient: str = args["recipient"]
-        send_email_with_attachment.invoke(args)
-        return{
-            "extracted_content": f"已將檔案{file_name}寄送給{recipient}"
+        # the resolver reads the side table
+        await run_blocking(self._ensure_contact_index)
+        match: Optional[RecipientMatch] = await run_blocking(self._resolver.resolve, user_query)
+        if match is not None and match.confidence > 0:
+            print(f"📇 收件人由{match.source}比對決定：{match.email}（信心 {match.confidence}）")
+            result: dict = await self.send(recipient=match.email, file_path=file_path)
+            return {**result, "recipient_match": match.to_dict()}
+
+        # nothing matched, several contacts did or names were only similar:
+        # the LLM decides from the retrieved contacts and the candidates
+        args: dict = await self._llm_service.arun(
+            user_query=user_query,
+            file_path=file_path,
+            retriever=self._retriever,
+            candidates=match.candidates if match is not None else None,
+        )
+        result = await self.send(recipient=args["recipient"], file_path=args["file_path"])
+        llm_match = RecipientMatch(
+            email=args["recipient"],
+            name="",
+            source="llm",
+            confidence=None,  # the tool call carries no confidence
+            candidates=match.candidates if match is not None else [],
+        )
+        return {**result, "recipient_match": llm_match.to_dict()}
+
+    async def send(self, recipient: str, file_path: str) -> dict:
+        """Send `file_path` to `recipient`; also used to replay a cached send."""
+        file_name: str = Path(file_path).name
+        # returns once the message is in the durable outbox, delivery happens in the background
+        status: str = await run_blocking(
+            send_email_with_attachment.invoke,
+            {"recipient": recipient, "file_path": file_path},
+        )
+        if status.startswith(EMAIL_ERROR_PREFIX):
+            print(f"檔案{file_name}寄給{recipient}失敗：{status}")
+            return {
+                "extracted_content": f"無法將檔案{file_name}寄給{recipient}（{status}）",
+                "recipient": recipient,
+                "retrieved_file_path": file_path,
+                "email_queued": False,
+            }
+        return {
+            "extracted_content": f"已將檔案{file_name}排入寄件佇列，寄給{recipient}（{status}）",
+            "recipient": recipient,
+            "retrieved_file_path": file_path,
+            "email_queued": True,
         }
 
 class ActionReasoner(BaseService):
-    def __init__(self, llm: BaseChatModel = None, vectorstore: Chroma = None):
+    """
+    Summary:
+        Explains every recorded step of a demonstration with the LLM.
+        Steps only depend on their own screenshots and text, so they are reasoned
+        about concurrently, bounded by `max_concurrency` and the rate limiter,
+        and written back in recording order.
+
+    Args:
+        llm (BaseChatModel): multimodal model used for the steps.
+        vectorstore (Chroma): where the learned manual is stored.
+        max_concurrency (int): steps reasoned about at the same time.
+        requests_per_minute (float, optional): request quota of the LLM, None for unlimited.
+        max_retries (int): retries of a failing step before it is marked as failed.
+        screenshot_encoder (ScreenshotEncoder, optional): downscales, caches and dedupes the screenshots.
+    """
+
+    def __init__(
+        self,
+        llm: BaseChatModel = None,
+        vectorstore: Chroma = None,
+        max_concurrency: int = 8,
+        requests_per_minute: Optional[float] = None,
+        max_retries: int = 3,
+        screenshot_encoder: Optional[ScreenshotEncoder] = None,
+    ):
         super().__init__(name=self.__class__.__name__)
         self._llm_service: ActionReasoningLLMService = ActionReasoningLLMService(
             llm=llm,
         )
         self._vectorstore: Chroma = vectorstore
-
-    def _local_image_to_data_url(self, image_path):
-        mime_type, _ = guess_type(image_path)
-        # Default to png
-        if mime_type is None:
-            mime_type = "image/png"
-
-        # Read and encode the image file
-        with open(image_path, "rb") as image_file:
-            base64_encoded_data = base64.b64encode(image_file.read()).decode("utf-8")
-        # Construct the data URL
-        return f"data:{mime_type};base64,{base64_encoded_data}"
+        self._max_concurrency: int = max_concurrency
+        self._max_retries: int = max_retries
+        self._rate_limiter: RateLimiter = RateLimiter(requests_per_minute=requests_per_minute)
+        self._screenshot_encoder: ScreenshotEncoder = screenshot_encoder or ScreenshotEncoder()
 
     def _get_latest_recording_dir(self) -> Path:
         root = Path(r"..\data\userInteraction_recording")
@@ -423,16 +947,12 @@ class ActionReasoner(BaseService):
         )
         return latest_recording
 
-    def _load_latest_recording_data(self) -> Tuple[List[Path], Dict]:
+    def _load_latest_recording_data(self) -> Tuple[Dict[int, Path], Dict]:
         latest = self._get_latest_recording_dir()
         if not latest:
             raise FileNotFoundError("No valid recording folder found.")
 
-        screenshot_dir = latest / "screenshot_recording"
-        screenshots = sorted(
-            screenshot_dir.glob("screenshot_*.png"),
-            key=lambda p: int(p.stem.split("_")[1]),
-        )
+        screenshots = load_screenshot_paths(latest / "screenshot_recording")
 
         json_path = latest / "Interactions_recording.json"
         with open(json_path, "r", encoding="utf-8") as f:
@@ -444,49 +964,139 @@ class ActionReasoner(BaseService):
         task_question = latest_recording_json["task_question"]
         doc = Document(
             page_content=json.dumps(latest_recording_json),
-            metadata={"task_question": task_question},
+            metadata={
+                "task_question": task_question,
+                # a manual with unexplained steps is kept, but says so
+                "failed_steps": len(latest_recording_json.get("failed_steps", [])),
+            },
         )
         self._vectorstore.add_documents([doc])
 
-    def run(self, state: State) -> str:
-        latest_recording_screenshots, latest_recording_json = (
-            self._load_latest_recording_data()
+    async def _reason_step(
+        self,
+        user_query: str,
+        step: int,
+        step_text: str,
+        before_image: EncodedScreenshot,
+        after_image: Optional[EncodedScreenshot],
+        semaphore: asyncio.Semaphore,
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Summary:
+            Reason about one step under the concurrency and rate limits.
+            Rate limited calls back off through the limiter, other failures are
+            retried with an exponential delay; a step that keeps failing is
+            reported as failed instead of failing the whole recording.
+
+        Returns:
+            Tuple: (step description, None) or (None, error of the last attempt).
+        """
+        async with semaphore:
+            for attempt in range(self._max_retries + 1):
+                await self._rate_limiter.acquire()
+                try:
+                    step_description: str = await self._llm_service.arun(
+                        user_query=user_query,
+                        before_image_url=before_image.data_url,
+                        after_image_url=after_image.data_url if after_image else None,
+                        step_text=step_text,
+                        step=step,
+                    )
+                except Exception as e:
+                    if attempt == self._max_retries:
+                        print(f"⚠️ 第 {step} 步推理失敗：{e}")
+                        return None, f"{type(e).__name__}: {e}"
+                    if is_rate_limit_error(e):
+                        self._rate_limiter.report_rate_limited()
+                    else:
+                        await asyncio.sleep(2**attempt)
+                    continue
+                self._rate_limiter.report_success()
+                return step_description, None
+
+    async def run(self, state: State) -> str:
+        latest_recording_screenshots, latest_recording_json = await asyncio.to_thread(
+            self._load_latest_recording_data
         )
         user_query = state["user_query"]
         del latest_recording_json["userInteraction_recording"][0]
-        for i, step_info in tqdm(
-            enumerate(latest_recording_json["userInteraction_recording"], start=0),
-            desc="thinking action steps..",
-        ):
-            step = i
-            step_text = step_info["Actual_Interaction"]
-            print(step, step_text)
-            before_image_url = self._local_image_to_data_url(
-                latest_recording_screenshots[i]
-            )
-            after_image_url = self._local_image_to_data_url(
-                latest_recording_screenshots[
-                    min(i + 1, len(latest_recording_screenshots) - 1)
-                ]
+        steps: List[Dict] = latest_recording_json["userInteraction_recording"]
+        # every screenshot is encoded once, even though most are used by two steps
+        encoded: List[EncodedScreenshot] = await asyncio.gather(
+            *(
+                asyncio.to_thread(self._screenshot_encoder.encode, path)
+                for path in latest_recording_screenshots.values()
             )
+        )
+        # frames are paired with steps by step number, a failed capture leaves a gap
+        screenshots: Dict[int, EncodedScreenshot] = dict(
+            zip(latest_recording_screenshots, encoded)
+        )
+        original_bytes: int = sum(screenshot.original_bytes for screenshot in encoded)
+        encoded_bytes: int = sum(screenshot.encoded_bytes for screenshot in encoded)
+        print(f"🖼️ 截圖壓縮：{original_bytes // 1024} KB → {encoded_bytes // 1024} KB")
 
-            step_description: str = self._llm_service.run(
-                user_query=user_query,
-                before_image_url=before_image_url,
-                after_image_url=after_image_url,
-                step_text=step_text,
-                step=step,
-            )
-            latest_recording_json["userInteraction_recording"][i]["llm_result"] = (
-                step_description
+        last_screenshot: int = max(screenshots, default=0)
+        semaphore = asyncio.Semaphore(self._max_concurrency)
+        tasks = []
+        for i, step_info in enumerate(steps):
+            number: int = step_info.get("Interaction_Step", i + 1)
+            before_image = screenshots.get(number)
+            after_image = screenshots.get(number + 1)
+            if after_image is None and number >= last_screenshot:
+                # nothing was captured after the last step, the page is taken as unchanged
+                after_image = before_image
+            if before_image is None or after_image is None:
+                missing: int = number if before_image is None else number + 1
+                tasks.append(asyncio.sleep(0, result=(None, f"第 {missing} 張截圖擷取失敗")))
+                continue
+            tasks.append(
+                self._reason_step(
+                    user_query=user_query,
+                    step=i,
+                    step_text=step_info["Actual_Interaction"],
+                    before_image=before_image,
+                    # a frame that did not visibly change is not sent a second time
+                    after_image=(
+                        None
+                        if self._screenshot_encoder.is_duplicate(before_image, after_image)
+                        else after_image
+                    ),
+                    semaphore=semaphore,
+                )
             )
-        self._store_to_vectorstore(latest_recording_json)
+        # gather keeps the order of `tasks`, so results line up with the steps
+        results: List[Tuple[Optional[str], Optional[str]]] = await tqdm_asyncio.gather(
+            *tasks, desc="thinking action steps.."
+        )
+        failed_steps: List[int] = []
+        for i, (step_info, (step_description, error)) in enumerate(zip(steps, results)):
+            # a failed step stays visibly unexplained instead of looking like an empty answer
+            step_info["llm_result"] = step_description
+            if error is not None:
+                step_info["llm_error"] = error
+                failed_steps.append(i)
+        latest_recording_json["failed_steps"] = failed_steps
         with open(
             f"../data/userInteraction_recording/llm_result.json", "w", encoding="utf-8"
         ) as f:
             json.dump(latest_recording_json, f, ensure_ascii=False, indent=4)
 
-        return {"extracted_content": "學習完成"}
+        if steps and len(failed_steps) == len(steps):
+            print("⚠️ 所有步驟推理失敗，不儲存此操作手冊")
+            return {
+                "extracted_content": "學習失敗：所有步驟推理失敗，操作手冊未儲存",
+                "failed_steps": failed_steps,
+            }
+        await asyncio.to_thread(self._store_to_vectorstore, latest_recording_json)
+        if failed_steps:
+            listed = "、".join(str(i) for i in failed_steps)
+            print(f"⚠️ 操作手冊已儲存，但第 {listed} 步沒有推理結果")
+            return {
+                "extracted_content": f"學習完成，但第 {listed} 步推理失敗，操作手冊缺少這些步驟的說明",
+                "failed_steps": failed_steps,
+            }
+        return {"extracted_content": "學習完成", "failed_steps": []}
     
 class Summarizer(BaseService):
     def __init__(self, llm: BaseChatModel = None):
@@ -495,10 +1105,10 @@ class Summarizer(BaseService):
             llm=llm,
         )
 
-    def run(self, state: State):
+    async def run(self, state: State):
         user_query = state["user_query"]
         extracted_content = state["extracted_content"]
-        result: str = self._llm_service.run(
+        result: str = await self._llm_service.arun(
             user_query=user_query, extracted_content=extracted_content
         )
         return {"summarizer_answer": result}
@@ -191,6 +191,35 @@ class ActionReasoningPrompt:
         ]
     )
 
+    # used when the AFTER screenshot is a near-duplicate of the BEFORE one and is not sent
+    unchanged_prompt_template = ChatPromptTemplate.from_messages(
+        [
+            {"role": "system", "content": _system_prompt},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": "The Task Goal is: {user_query}."},
+                    {
+                        "type": "text",
+                        "text": "You will receive each operation step one by one to reason how each operation helps complete this task.",
+                    },
+                    {"type": "text", "text": "Now analyzing action step {step}."},
+                    {"type": "text", "text": 'Action Description: "{step_text}"'},
+                    {"type": "text", "text": "1. Screenshot BEFORE the action:"},
+                    {"type": "image_url", "image_url": {"url": "{before_image_url}"}},
+                    {
+                        "type": "text",
+                        "text": "2. The page showed no visible change after the action, so the AFTER screenshot is omitted.",
+                    },
+                    {
+                        "type": "text",
+                        "text": "Please carefully infer the reasoning and intention behind this step based on the available information.",
+                    },
+                ],
+            },
+        ]
+    )
+
 
 @dataclass
 class MessageSenderPrompt:
@@ -204,8 +233,10 @@ class MessageSenderPrompt:
         """
         query: {user_query}
         context: {context}
+        candidates: {candidates}
         file_path: {file_path}
         Please send the message according to the user's query. also find the corresponding email address from the context.
+        The candidates are email addresses of contacts whose names only resemble the query; choose one only if the query really refers to that contact.
         """
     ).strip()
 
@@ -0,0 +1,133 @@
+import asyncio
+import random
+import time
+from typing import Optional
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """
+    Check if an exception raised by an LLM provider means the quota was exceeded.
+
+    Gemini surfaces 429s as `ResourceExhausted` (google.api_core) or as
+    `ChatGoogleGenerativeAIError` with the status text in the message, so the
+    check is done on the class name and message instead of concrete types.
+    """
+    if (
+        getattr(error, "status_code", None) == 429
+        or getattr(error, "code", None) == 429
+    ):
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(
+        marker in text
+        for marker in (
+            "429",
+            "resourceexhausted",
+            "resource_exhausted",
+            "rate limit",
+            "quota",
+        )
+    )
+
+
+class TokenBucket:
+    """A token bucket refilled continuously at `capacity` units per minute."""
+
+    def __init__(self, per_minute: float):
+        if per_minute <= 0:
+            raise ValueError("per_minute must be positive")
+        self.capacity: float = float(per_minute)
+        self._rate: float = self.capacity / 60.0
+        self._tokens: float = self.capacity
+        self._last_refill: float = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._last_refill) * self._rate
+        )
+        self._last_refill = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units can be consumed (0 if available now)."""
+        self._refill()
+        # a single request larger than the bucket is let through once it is full
+        amount = min(amount, self.capacity)
+        if self._tokens >= amount:
+            return 0.0
+        return (amount - self._tokens) / self._rate
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self._tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    Summary:
+        Async limiter combining a requests/min and a tokens/min bucket with an
+        adaptive cooldown that grows on every 429 and decays on success.
+
+    Args:
+        requests_per_minute (float, optional): request quota, None for unlimited.
+        tokens_per_minute (float, optional): token quota, None for unlimited.
+        initial_backoff (float): cooldown in seconds after the first 429.
+        max_backoff (float): upper bound of the cooldown in seconds.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        self._request_bucket: Optional[TokenBucket] = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self._token_bucket: Optional[TokenBucket] = (
+            TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        )
+        self._initial_backoff: float = initial_backoff
+        self._max_backoff: float = max_backoff
+        self._backoff: float = 0.0
+        self._cooldown_until: float = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        # created lazily so the limiter can be built outside of a running loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def _wait_time(self, tokens: int) -> float:
+        wait = max(0.0, self._cooldown_until - time.monotonic())
+        if self._request_bucket:
+            wait = max(wait, self._request_bucket.wait_time(1))
+        if self._token_bucket and tokens:
+            wait = max(wait, self._token_bucket.wait_time(tokens))
+        return wait
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """Wait until one request costing `tokens` tokens fits in the quota."""
+        async with self._get_lock():
+            while (wait := self._wait_time(tokens)) > 0:
+                await asyncio.sleep(wait)
+            if self._request_bucket:
+                self._request_bucket.consume(1)
+            if self._token_bucket and tokens:
+                self._token_bucket.consume(tokens)
+
+    def report_rate_limited(self) -> float:
+        """Register a 429 and return the cooldown (with jitter) now in effect."""
+        self._backoff = min(
+            self._max_backoff, max(self._initial_backoff, self._backoff * 2)
+        )
+        cooldown = self._backoff * random.uniform(0.8, 1.2)
+        self._cooldown_until = max(self._cooldown_until, time.monotonic() + cooldown)
+        return cooldown
+
+    def report_success(self) -> None:
+        self._backoff /= 2
+        if self._backoff < self._initial_backoff:
+            self._backoff = 0.0
@@ -0,0 +1,248 @@
+import re
+import threading
+import unicodedata
+from dataclasses import asdict, dataclass, field
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Set, Tuple
+from contact_index import ContactIndex
+
+try:
+    from pypinyin import lazy_pinyin
+except (
+    ImportError
+):  # pypinyin is optional, romanised Chinese names are then not matched
+    lazy_pinyin = None
+
+EMAIL_RE = re.compile(r"[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}")
+_CJK_RE = re.compile(r"[㐀-鿿豈-﫿]")
+_LATIN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize_text(text: str) -> str:
+    return unicodedata.normalize("NFKC", text).casefold().strip()
+
+
+def to_pinyin(text: str) -> str:
+    """Toneless pinyin of the Chinese characters in `text`, other letters kept, no spaces."""
+    if lazy_pinyin is None:
+        return ""
+    return "".join(_LATIN_RE.findall("".join(lazy_pinyin(normalize_text(text)))))
+
+
+@dataclass
+class RecipientMatch:
+    email: str
+    name: str
+    source: str  # "email" | "exact_name" | "pinyin" | "fuzzy_name" | "llm"
+    confidence: Optional[float]
+    candidates: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class _Contact:
+    name: str
+    email: str
+    key: str
+    pinyin: str
+    is_cjk: bool
+
+
+class RecipientResolver:
+    """
+    Summary:
+        Deterministic recipient resolution in front of the MessageSender LLM.
+
+        1. a literal email address in the query
+        2. a contact name appearing in the query, the longest match wins
+        3. the same by pinyin, so "Chen Xiaoming", "陳小明" and "陈小明" match
+        4. contacts whose name is only similar to a part of the query, above
+           `min_similarity`; these are never used directly ("my boss" is not
+           "Anna", "陳小美" is not "陳小明") and go to the LLM as candidates
+
+        Only the first three tiers skip the LLM. Anything else, including several
+        contacts matching equally well, is left to the LLM. The in-memory index
+        is rebuilt when the contacts change.
+
+    Args:
+        contact_index (ContactIndex): the contact side table.
+        min_similarity (float): SequenceMatcher ratio required for a fuzzy candidate.
+        max_candidates (int): fuzzy candidates handed to the LLM.
+    """
+
+    def __init__(
+        self,
+        contact_index: ContactIndex,
+        min_similarity: float = 0.8,
+        max_candidates: int = 5,
+    ):
+        self._contact_index: ContactIndex = contact_index
+        self._min_similarity: float = min_similarity
+        self._max_candidates: int = max_candidates
+        self._lock = threading.Lock()
+        self._version: int = -1
+        self._contacts: List[_Contact] = []
+        self._by_email: Dict[str, _Contact] = {}
+        self._grams: Dict[str, Set[int]] = {}
+
+    @staticmethod
+    def _grams_of(key: str) -> Set[str]:
+        grams = set(_CJK_RE.findall(key))
+        for word in _LATIN_RE.findall(key):
+            grams.update(word[i : i + 3] for i in range(max(1, len(word) - 2)))
+        return grams
+
+    def _refresh(self) -> None:
+        if self._contact_index.version == self._version:
+            return
+        version = self._contact_index.version
+        rows, _ = self._contact_index.page()
+        contacts: List[_Contact] = []
+        for row in rows:
+            key = normalize_text(row["name"])
+            if len(key) < 2:
+                continue
+            contacts.append(
+                _Contact(
+                    name=row["name"],
+                    email=row["email"],
+                    key=key,
+                    pinyin=to_pinyin(key) if _CJK_RE.search(key) else "",
+                    is_cjk=bool(_CJK_RE.search(key)),
+                )
+            )
+        grams: Dict[str, Set[int]] = {}
+        for i, contact in enumerate(contacts):
+            for gram in self._grams_of(contact.key):
+                grams.setdefault(gram, set()).add(i)
+        self._contacts = contacts
+        self._by_email = {
+            normalize_text(contact.email): contact for contact in contacts
+        }
+        self._grams = grams
+        self._version = version
+
+    @staticmethod
+    def _spans(
+        needle: str, haystack: str, word_boundaries: bool
+    ) -> List[Tuple[int, int]]:
+        if word_boundaries:
+            pattern = rf"(?<![a-z0-9]){re.escape(needle)}(?![a-z0-9])"
+        else:
+            pattern = re.escape(needle)
+        return [match.span() for match in re.finditer(pattern, haystack)]
+
+    def _unique(
+        self, matches: List[Tuple[int, int, _Contact]], source: str, confidence: float
+    ) -> Optional[RecipientMatch]:
+        """The match covering the longest span, or an ambiguous result."""
+        if not matches:
+            return None
+        # drop names found inside a longer matched name ("Amy" in "Amy Chen")
+        kept = [
+            (start, end, contact)
+            for start, end, contact in matches
+            if not any(
+                s <= start and end <= e and (e - s) > (end - start)
+                for s, e, _ in matches
+            )
+        ]
+        emails = {normalize_text(contact.email): contact for _, _, contact in kept}
+        if len(emails) == 1:
+            contact = next(iter(emails.values()))
+            return RecipientMatch(contact.email, contact.name, source, confidence)
+        return RecipientMatch(
+            "",
+            "",
+            source,
+            0.0,
+            candidates=[contact.email for contact in emails.values()],
+        )
+
+    def _match_names(self, query: str) -> Optional[RecipientMatch]:
+        matches = [
+            (start, end, contact)
+            for contact in self._contacts
+            if contact.key in query
+            for start, end in self._spans(contact.key, query, not contact.is_cjk)
+        ]
+        return self._unique(matches, "exact_name", 0.95)
+
+    def _match_pinyin(self, query: str) -> Optional[RecipientMatch]:
+        if lazy_pinyin is None:
+            return None
+        query_pinyin = to_pinyin(query)
+        matches = [
+            (start, end, contact)
+            for contact in self._contacts
+            if len(contact.pinyin) >= 4 and contact.pinyin in query_pinyin
+            for start, end in self._spans(contact.pinyin, query_pinyin, False)
+        ]
+        return self._unique(matches, "pinyin", 0.85)
+
+    def _match_fuzzy(self, query: str) -> Optional[RecipientMatch]:
+        query_grams = self._grams_of(query)
+        shared: Dict[int, int] = {}
+        for gram in query_grams:
+            for i in self._grams.get(gram, ()):
+                shared[i] = shared.get(i, 0) + 1
+        candidates = sorted(shared, key=shared.get, reverse=True)[:50]
+
+        scores: List[Tuple[float, _Contact]] = []
+        for i in candidates:
+            contact = self._contacts[i]
+            size = len(contact.key)
+            windows = {
+                query[start : start + length]
+                for length in (size - 1, size, size + 1)
+                for start in range(max(1, len(query) - length + 1))
+            }
+            best = max(
+                SequenceMatcher(None, contact.key, window).ratio() for window in windows
+            )
+            scores.append((best, contact))
+        scores.sort(key=lambda score: score[0], reverse=True)
+        emails: Dict[str, str] = {}
+        for score, contact in scores:
+            if score < self._min_similarity or len(emails) >= self._max_candidates:
+                break
+            emails.setdefault(normalize_text(contact.email), contact.email)
+        if not emails:
+            return None
+        # a similar name is a hint, not a decision: the LLM confirms it
+        return RecipientMatch(
+            "", "", "fuzzy_name", 0.0, candidates=list(emails.values())
+        )
+
+    def resolve(self, user_query: str) -> Optional[RecipientMatch]:
+        """
+        Returns:
+            RecipientMatch: a match with confidence > 0, an ambiguous match with
+            confidence 0 and its candidates, or None when nothing matched.
+        """
+        with self._lock:
+            self._refresh()
+        emails = {
+            normalize_text(email): email for email in EMAIL_RE.findall(user_query)
+        }
+        if len(emails) == 1:
+            email = next(iter(emails.values()))
+            known = self._by_email.get(normalize_text(email))
+            return RecipientMatch(email, known.name if known else "", "email", 1.0)
+        if len(emails) > 1:
+            return RecipientMatch(
+                "", "", "email", 0.0, candidates=list(emails.values())
+            )
+
+        query = normalize_text(user_query)
+        ambiguous: Optional[RecipientMatch] = None
+        for matcher in (self._match_names, self._match_pinyin, self._match_fuzzy):
+            match = matcher(query)
+            if match is None:
+                continue
+            if match.confidence > 0:
+                return match
+            ambiguous = ambiguous or match
+        return ambiguous
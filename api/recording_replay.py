@@ -0,0 +1,374 @@
+import json
+import re
+import threading
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+from browser_pool import BrowserLease
+from downloader import DownloadResult, StreamingDownloader
+
+# recorder steps that are bookkeeping, not interactions
+_SKIPPED_STEPS = ("Start from the website at", "Task Completed")
+
+
+def _quote(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def candidate_selectors(raw: dict) -> List[str]:
+    """Playwright selectors for a recorded element, most specific first."""
+    tag = (raw.get("target") or "").lower() or "*"
+    selectors: List[str] = []
+    if raw.get("id"):
+        selectors.append(f'[id="{_quote(raw["id"])}"]')
+    lines = [
+        line.strip() for line in (raw.get("text") or "").splitlines() if line.strip()
+    ]
+    if lines:
+        text = lines[0]
+        if len(raw.get("text") or "") < 100 and len(lines) == 1:
+            selectors.append(f'{tag}:text-is("{_quote(text)}")')
+            selectors.append(f'text="{_quote(text)}"')
+        else:
+            # the recorder truncates text at 100 characters, match a prefix
+            selectors.append(f"text={text}")
+    classes = str(raw.get("class") or "").split()
+    if classes:
+        selectors.append(
+            tag + "".join(f'[class~="{_quote(name)}"]' for name in classes)
+        )
+    return selectors
+
+
+@dataclass
+class ReplayStep:
+    action: str  # "click" | "input" | "select" | "scroll" | "back"
+    url: str
+    description: str
+    selectors: List[str] = field(default_factory=list)
+    value: Optional[str] = None
+    param: Optional[str] = None
+    distance: int = 0
+    submit: bool = False
+
+
+@dataclass
+class ReplayScript:
+    task_question: str
+    steps: List[ReplayStep]
+    params: Dict[str, str]
+    pattern: str
+
+    def bind(self, user_query: str) -> Optional[Dict[str, str]]:
+        """Parameter values for `user_query`, or None if it is another task."""
+        match = re.fullmatch(self.pattern, user_query.strip(), flags=re.IGNORECASE)
+        if match is None:
+            return None
+        return {
+            name: match.group(name) or default for name, default in self.params.items()
+        }
+
+    def describe(self) -> str:
+        return "\n".join(
+            f"{i}. {step.description} (on {step.url})"
+            for i, step in enumerate(self.steps)
+        )
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ReplayScript":
+        return cls(
+            task_question=data["task_question"],
+            steps=[ReplayStep(**step) for step in data["steps"]],
+            params=data["params"],
+            pattern=data["pattern"],
+        )
+
+
+def _is_word_char(char: str) -> bool:
+    # CJK characters are tokens of their own, only latin words and numbers run on
+    return char.isascii() and (char.isalnum() or char == "_")
+
+
+def _find_token(text: str, value: str, spans: List[tuple]) -> int:
+    """Start of the first free occurrence of `value` in `text` that is not part of a longer word, or -1."""
+    start = text.find(value)
+    while start >= 0:
+        end = start + len(value)
+        inside_word = (
+            start > 0 and _is_word_char(text[start - 1]) and _is_word_char(value[0])
+        ) or (end < len(text) and _is_word_char(text[end]) and _is_word_char(value[-1]))
+        overlaps = any(
+            start < taken_end and taken_start < end
+            for taken_start, taken_end, _ in spans
+        )
+        if not inside_word and not overlaps:
+            return start
+        start = text.find(value, start + 1)
+    return -1
+
+
+def _task_pattern(task_question: str, params: Dict[str, str]) -> str:
+    """Regex matching the task question with every parameter value left free."""
+    task_question = task_question.strip().rstrip("。.!！?？ ")
+    spans = []
+    lowered = task_question.lower()
+    for name, value in params.items():
+        value = value.strip().lower()
+        start = _find_token(lowered, value, spans) if value else -1
+        if start >= 0:
+            spans.append((start, start + len(value), name))
+    pattern, position = "", 0
+    for start, end, name in sorted(spans):
+        pattern += re.escape(task_question[position:start]) + f"(?P<{name}>.+?)"
+        position = end
+    pattern += re.escape(task_question[position:])
+    pattern = re.sub(r"(\\ |\s)+", r"\\s*", pattern)
+    return pattern + r"\s*[。.!！?？]*"
+
+
+def compile_recording(recording: dict) -> Optional[ReplayScript]:
+    """
+    Turn a stored `Interactions_recording.json` into a replay script.
+
+    Input values become parameters; a parameter whose value appears in the task
+    question is filled from the matching part of a new query. Returns None for
+    recordings made before raw interactions were stored.
+    """
+    steps: List[ReplayStep] = []
+    params: Dict[str, str] = {}
+    entries = [
+        entry
+        for entry in recording.get("userInteraction_recording", [])
+        if not entry["Actual_Interaction"].startswith(_SKIPPED_STEPS)
+    ]
+    for i, entry in enumerate(entries):
+        raw: Optional[dict] = entry.get("Raw_Interaction")
+        if raw is None:
+            return None
+        url: str = entry["Executed_On_URL"]
+        description: str = entry["Actual_Interaction"]
+        kind = raw.get("type")
+        if kind == "click":
+            steps.append(
+                ReplayStep(
+                    "click", url, description, selectors=candidate_selectors(raw)
+                )
+            )
+        elif kind in ("input", "change"):
+            name = f"p{len(params)}"
+            params[name] = raw.get("value") or ""
+            next_url = (
+                entries[i + 1]["Executed_On_URL"] if i + 1 < len(entries) else url
+            )
+            steps.append(
+                ReplayStep(
+                    "input" if kind == "input" else "select",
+                    url,
+                    description,
+                    selectors=candidate_selectors(raw),
+                    value=params[name],
+                    param=name,
+                    # the page changed right after typing, the user pressed Enter
+                    submit=kind == "input" and next_url != url,
+                )
+            )
+        elif kind == "scroll":
+            steps.append(
+                ReplayStep(
+                    "scroll",
+                    url,
+                    description,
+                    distance=int(raw.get("total_scroll_distance", 0)),
+                )
+            )
+        elif kind == "navigation":
+            steps.append(ReplayStep("back", url, description))
+        else:
+            return None
+    if not steps:
+        return None
+    task_question: str = recording["task_question"]
+    return ReplayScript(
+        task_question=task_question,
+        steps=steps,
+        params=params,
+        pattern=_task_pattern(task_question, params),
+    )
+
+
+class ReplayLibrary:
+    """
+    Summary:
+        Finds a replayable recording for a query without calling a model.
+
+        Recordings stored by the ActionReasoner are compiled once and matched by
+        their task-question template; the compiled scripts are refreshed when
+        the collection size changes.
+
+    Args:
+        vectorstore (Chroma): the `web_user_manual` collection.
+    """
+
+    def __init__(self, vectorstore):
+        self._vectorstore = vectorstore
+        self._lock = threading.Lock()
+        self._count: int = -1
+        self._scripts: List[ReplayScript] = []
+
+    def _refresh(self) -> None:
+        count: int = self._vectorstore._collection.count()
+        if count == self._count:
+            return
+        scripts: List[ReplayScript] = []
+        for content in self._vectorstore.get(include=["documents"])["documents"]:
+            try:
+                script = compile_recording(json.loads(content))
+            except (ValueError, KeyError, TypeError, AttributeError):
+                continue
+            if script is not None:
+                scripts.append(script)
+        self._scripts, self._count = scripts, count
+
+    def find(self, user_query: str) -> Optional[tuple]:
+        """The most recent matching script and its bound parameters, or None."""
+        with self._lock:
+            self._refresh()
+            scripts = list(self._scripts)
+        for script in reversed(scripts):
+            params = script.bind(user_query)
+            if params is not None:
+                return script, params
+        return None
+
+
+class SelectorMiss(Exception):
+    def __init__(self, step: int, description: str):
+        super().__init__(f"Replay step {step} found no element: {description}")
+        self.step: int = step
+
+
+@dataclass
+class ReplayResult:
+    completed_steps: int
+    final_url: str
+    extracted_content: str
+    file_name: Optional[str] = None
+    downloads: List[DownloadResult] = field(default_factory=list)
+
+
+class ReplayEngine:
+    """
+    Summary:
+        Executes a `ReplayScript` directly with patchright, without any LLM.
+
+        Each step tries its selectors in order for at most `step_timeout`
+        seconds; if none matches, `SelectorMiss` is raised so the caller can
+        hand the task to the browser agent. Downloads are stored through
+        `downloader`, with the same file-name checks, partial file and hash as
+        the downloads of the browser agent.
+
+    Args:
+        downloader (StreamingDownloader): stores the files the replay downloads.
+        headless (bool): run the browser without a window.
+        step_timeout (float): seconds to wait for each step's element.
+        max_content_chars (int): characters of the final page returned as content.
+    """
+
+    def __init__(
+        self,
+        downloader: StreamingDownloader,
+        headless: bool = False,
+        step_timeout: float = 5.0,
+        max_content_chars: int = 2000,
+    ):
+        self._downloader: StreamingDownloader = downloader
+        self._headless: bool = headless
+        self._step_timeout_ms: float = step_timeout * 1000
+        self._max_content_chars: int = max_content_chars
+
+    async def _locate(self, page, step: ReplayStep):
+        for selector in step.selectors:
+            locator = page.locator(selector).first
+            try:
+                await locator.wait_for(state="visible", timeout=self._step_timeout_ms)
+                return locator
+            except Exception:
+                # timeouts and invalid selectors alike, from patchright or a pooled playwright
+                continue
+        return None
+
+    async def _execute(self, page, step: ReplayStep, params: Dict[str, str]) -> bool:
+        if step.action == "scroll":
+            await page.mouse.wheel(0, step.distance)
+            return True
+        if step.action == "back":
+            await page.go_back()
+            return True
+        locator = await self._locate(page, step)
+        if locator is None:
+            return False
+        value = params.get(step.param, step.value) if step.param else step.value
+        if step.action == "click":
+            await locator.click(timeout=self._step_timeout_ms)
+        elif step.action == "input":
+            await locator.fill(value or "", timeout=self._step_timeout_ms)
+            if step.submit:
+                await locator.press("Enter")
+        elif step.action == "select":
+            await locator.select_option(value, timeout=self._step_timeout_ms)
+        try:
+            await page.wait_for_load_state(
+                "domcontentloaded", timeout=self._step_timeout_ms
+            )
+        except Exception:
+            pass
+        return True
+
+    async def _run_on_page(
+        self, page, script: ReplayScript, params: Dict[str, str]
+    ) -> ReplayResult:
+        downloads = []
+        page.on("download", downloads.append)
+        await page.goto(script.steps[0].url)
+        for i, step in enumerate(script.steps):
+            print(f"重播步驟 {i}: {step.description}")
+            if not await self._execute(page, step, params):
+                raise SelectorMiss(i, step.description)
+
+        stored: List[DownloadResult] = [
+            await self._downloader.save(
+                download.save_as, download.suggested_filename, key=download.url
+            )
+            for download in downloads
+        ]
+        text: str = await page.inner_text("body")
+        return ReplayResult(
+            completed_steps=len(script.steps),
+            final_url=page.url,
+            extracted_content=f"{await page.title()}\n{text[: self._max_content_chars]}",
+            file_name=stored[-1].file_name if stored else None,
+            downloads=stored,
+        )
+
+    async def run(
+        self,
+        script: ReplayScript,
+        params: Dict[str, str],
+        lease: Optional[BrowserLease] = None,
+    ) -> ReplayResult:
+        """Replay `script`, in a private context of `lease` when a pooled browser is given."""
+        if lease is not None:
+            context = await lease.playwright_context(accept_downloads=True)
+            return await self._run_on_page(await context.new_page(), script, params)
+
+        from patchright.async_api import async_playwright
+
+        async with async_playwright() as playwright:
+            browser = await playwright.chromium.launch(headless=self._headless)
+            try:
+                page = await browser.new_page(accept_downloads=True)
+                return await self._run_on_page(page, script, params)
+            finally:
+                await browser.close()
@@ -0,0 +1,173 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
+
+INDEX_FILE = "index.json"
+_EXTENSIONS = {"jpeg": "jpg", "webp": "webp", "png": "png"}
+
+
+class ScreenshotRecorder:
+    """
+    Summary:
+        Screenshot storage of one recording.
+
+        `capture` grabs the viewport through CDP `Page.captureScreenshot`, which
+        encodes the frame as JPEG or WebP in the browser. It is the only part
+        that runs on the interaction loop, because the frame has to show the page
+        at that step. Hashing, dedupe and disk writes happen on a background
+        thread. Files are named after a digest of their content, so a frame
+        identical to one already stored is not written again and a file the
+        index points to is never overwritten, even when a step is captured
+        twice. `index.json` maps every step to its image file and lists the
+        steps whose capture failed; it is kept in memory and written at most
+        every `index_interval` seconds while recording, and once more on `close`.
+
+    Args:
+        directory (str): the recording's `screenshot_recording` directory.
+        image_format (str): "jpeg" or "webp".
+        quality (int): encoder quality, 0-100.
+        index_interval (float): minimum seconds between two writes of `index.json`.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        image_format: str = "jpeg",
+        quality: int = 70,
+        index_interval: float = 1.0,
+    ):
+        image_format = image_format.lower()
+        if image_format not in ("jpeg", "webp"):
+            raise ValueError(f"Unsupported image format: {image_format}")
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._image_format: str = image_format
+        self._quality: int = quality
+        self._frames: Dict[int, str] = {}
+        self._missing: Set[int] = set()
+        self._index_interval: float = index_interval
+        self._index_dirty: bool = False
+        self._index_written_at: float = time.monotonic()
+        self._queue: "queue.Queue[Optional[Tuple[int, Optional[bytes], Optional[str]]]]" = queue.Queue()
+        self._worker = threading.Thread(
+            target=self._work, name="ScreenshotRecorder", daemon=True
+        )
+        self._worker.start()
+
+    def _grab(self, driver) -> Tuple[bytes, str]:
+        try:
+            result = driver.execute_cdp_cmd(
+                "Page.captureScreenshot",
+                {"format": self._image_format, "quality": self._quality},
+            )
+            return base64.b64decode(result["data"]), self._image_format
+        except Exception as e:
+            # 非 Chromium 瀏覽器沒有 CDP，退回 WebDriver 截圖
+            logging.warning(f"CDP screenshot failed, falling back to PNG: {e}")
+            return driver.get_screenshot_as_png(), "png"
+
+    def capture(self, driver, step: int) -> None:
+        """Capture the current viewport as the screenshot of `step`; returns before anything is written."""
+        try:
+            data, image_format = self._grab(driver)
+        except Exception as e:
+            logging.warning(f"Failed to capture screenshot {step}: {e}")
+            # recorded as a gap, so the step is not paired with another step's frame
+            self._queue.put((step, None, None))
+            return
+        self._queue.put((step, data, image_format))
+
+    def _write_index(self) -> None:
+        index = {
+            "format": self._image_format,
+            "frames": {str(step): name for step, name in sorted(self._frames.items())},
+            "missing": sorted(self._missing - self._frames.keys()),
+        }
+        tmp_path = self._directory / f"{INDEX_FILE}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self._directory / INDEX_FILE)
+
+    def _flush_index(self) -> None:
+        try:
+            self._write_index()
+        except OSError as e:
+            logging.error(f"Failed to write the screenshot index: {e}")
+            return
+        self._index_dirty = False
+        self._index_written_at = time.monotonic()
+
+    def _index_due_in(self) -> Optional[float]:
+        """Seconds until the pending index write is due, None when nothing is pending."""
+        if not self._index_dirty:
+            return None
+        return max(
+            0.0, self._index_written_at + self._index_interval - time.monotonic()
+        )
+
+    def _store(
+        self, step: int, data: Optional[bytes], image_format: Optional[str]
+    ) -> None:
+        if data is None:
+            # a failed recapture keeps the frame the step already has
+            self._missing.add(step)
+            self._index_dirty = True
+            return
+        name = f"screenshot_{hashlib.sha256(data).hexdigest()[:32]}.{_EXTENSIONS[image_format]}"
+        path = self._directory / name
+        if not path.exists():
+            tmp_path = self._directory / f"{name}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        # a step captured twice keeps its last frame
+        self._frames[step] = name
+        self._index_dirty = True
+
+    def _work(self) -> None:
+        # rewriting the index after every frame would make a recording quadratic
+        while True:
+            try:
+                item = self._queue.get(timeout=self._index_due_in())
+            except queue.Empty:
+                self._flush_index()
+                continue
+            if item is None:
+                break
+            try:
+                self._store(*item)
+            except Exception as e:
+                logging.error(f"Failed to store screenshot {item[0]}: {e}")
+            if self._index_due_in() == 0.0:
+                self._flush_index()
+        if self._index_dirty:
+            self._flush_index()
+
+    def close(self) -> None:
+        """Wait until every captured frame and the index are on disk."""
+        self._queue.put(None)
+        self._worker.join()
+
+
+def load_screenshot_paths(directory: Path) -> Dict[int, Path]:
+    """
+    Screenshot of every captured step, from `index.json` or the legacy
+    `screenshot_<step>.png` names. Steps whose capture failed are absent.
+    """
+    index_path = directory / INDEX_FILE
+    if index_path.exists():
+        with open(index_path, "r", encoding="utf-8") as f:
+            frames: Dict[str, str] = json.load(f)["frames"]
+        return {int(step): directory / name for step, name in frames.items()}
+    return {
+        int(path.stem.split("_")[1]): path
+        for path in directory.glob("screenshot_*.png")
+        if path.stem.split("_")[1].isdigit()
+    }
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 from typing import Annotated
 from typing_extensions import TypedDict
 from langgraph.graph.message import add_messages
@@ -14,11 +14,21 @@ class State(TypedDict):
     retrieved_file_path: str
     user_query: str
     task_classification: Literal["file", "web", "web_record"]
+    dispatch_source: str
+    dispatch_confidence: Optional[float]
     web_manual: str
+    replay_script: Optional[dict]
+    replay_params: Dict[str, str]
+    replayed_steps: int
     browser_use_is_done: bool
     extracted_content: str
+    failed_steps: List[int]
     summarizer_answer: str
     file_name: str
+    recipient: str
+    recipient_match: Dict
+    email_queued: bool
+    from_cache: bool
 
 
 class FileSnapshot(BaseModel):
@@ -28,6 +38,11 @@ class FileSnapshot(BaseModel):
         title="Last Modified Time",
         description="The last modified time of the file.",
     )
+    content_hash: Optional[str] = Field(
+        default=None,
+        title="Content Hash",
+        description="The streaming content hash of the file when it was described.",
+    )
 
 
 class FileDescription(BaseModel):
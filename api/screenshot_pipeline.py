@@ -0,0 +1,125 @@
+import base64
+import io
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Tuple, Union
+
+from PIL import Image
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+def thumbnail_of(image: Image.Image, size: int = 256) -> Tuple[Tuple[int, int], bytes]:
+    """
+    Grayscale thumbnail whose longer side is `size` pixels, as (size, pixels).
+    Fine enough that a typed character, a ticked checkbox or an opened
+    dropdown still changes some pixels noticeably.
+    """
+    thumbnail = image.convert("L")
+    thumbnail.thumbnail((size, size), Image.BILINEAR)
+    return thumbnail.size, thumbnail.tobytes()
+
+
+@dataclass
+class EncodedScreenshot:
+    data_url: str
+    thumbnail_size: Tuple[int, int]
+    thumbnail: bytes
+    original_bytes: int
+    encoded_bytes: int
+
+
+class ScreenshotEncoder:
+    """
+    Summary:
+        Turns recorded screenshots into the data URLs sent to the LLM.
+
+        Each file is decoded once, downscaled so its longer side is at most
+        `max_side` pixels, re-encoded as JPEG or WebP and kept in a small LRU
+        cache keyed by path, size and mtime. A screenshot that is both the
+        "after" image of one step and the "before" image of the next is
+        therefore encoded only once. The grayscale thumbnail computed alongside
+        lets callers drop frames that did not change at all: frames count as
+        duplicates only if no thumbnail pixel differs by more than
+        `pixel_tolerance`, which absorbs JPEG noise but not a typed character.
+
+    Args:
+        max_side (int): longest side of the encoded image in pixels.
+        image_format (str): "JPEG" or "WEBP".
+        quality (int): encoder quality, 1-100.
+        max_entries (int): encoded screenshots kept in memory.
+        pixel_tolerance (int): largest grayscale difference, 0-255, of any thumbnail pixel of duplicates.
+    """
+
+    def __init__(
+        self,
+        max_side: int = 1280,
+        image_format: str = "JPEG",
+        quality: int = 70,
+        max_entries: int = 256,
+        pixel_tolerance: int = 8,
+    ):
+        image_format = image_format.upper()
+        if image_format not in _MIME_TYPES:
+            raise ValueError(f"Unsupported image format: {image_format}")
+        self._max_side: int = max_side
+        self._image_format: str = image_format
+        self._quality: int = quality
+        self._max_entries: int = max_entries
+        self._pixel_tolerance: int = pixel_tolerance
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, int, int], EncodedScreenshot]" = (
+            OrderedDict()
+        )
+
+    def _encode(self, path: Path, original_bytes: int) -> EncodedScreenshot:
+        with Image.open(path) as image:
+            image.load()
+            thumbnail_size, thumbnail = thumbnail_of(image)
+            if max(image.size) > self._max_side:
+                image.thumbnail((self._max_side, self._max_side), Image.LANCZOS)
+            # JPEG has no alpha channel, screenshots do not need one
+            image = image.convert("RGB")
+            buffer = io.BytesIO()
+            image.save(buffer, format=self._image_format, quality=self._quality)
+        encoded = buffer.getvalue()
+        data_url = f"data:{_MIME_TYPES[self._image_format]};base64," + base64.b64encode(
+            encoded
+        ).decode("ascii")
+        return EncodedScreenshot(
+            data_url=data_url,
+            thumbnail_size=thumbnail_size,
+            thumbnail=thumbnail,
+            original_bytes=original_bytes,
+            encoded_bytes=len(encoded),
+        )
+
+    def encode(self, image_path: Union[str, Path]) -> EncodedScreenshot:
+        path = Path(image_path)
+        stat = os.stat(path)
+        key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+        # encoded outside the lock so several screenshots can be encoded in parallel threads
+        encoded = self._encode(path, stat.st_size)
+        with self._lock:
+            self._cache[key] = encoded
+            while len(self._cache) > self._max_entries:
+                self._cache.popitem(last=False)
+        return encoded
+
+    def is_duplicate(self, a: EncodedScreenshot, b: EncodedScreenshot) -> bool:
+        if a.thumbnail_size != b.thumbnail_size:
+            return False
+        if a.thumbnail == b.thumbnail:
+            return True
+        return (
+            max(abs(x - y) for x, y in zip(a.thumbnail, b.thumbnail))
+            <= self._pixel_tolerance
+        )
@@ -0,0 +1,271 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+from dispatch_router import normalize_query
+
+# 各類任務的結果依賴哪些向量資料庫；recorder 需要使用者親自示範，不快取
+TASK_COLLECTIONS: Dict[str, List[str]] = {
+    "web": ["web_user_manual"],
+    "filesystem": ["filesystem_manager", "email_contact"],
+}
+
+
+def directory_fingerprint(directory: str) -> str:
+    """
+    Cheap change marker of a persistent Chroma directory: the newest mtime and the
+    total size of the files in it and in its segment folders. Any write changes it.
+    """
+    root = Path(directory)
+    if not root.exists():
+        return "missing"
+    newest, total = 0, 0
+    for entry in root.iterdir():
+        for path in entry.iterdir() if entry.is_dir() else [entry]:
+            if path.is_file():
+                stat = path.stat()
+                newest = max(newest, stat.st_mtime_ns)
+                total += stat.st_size
+    return f"{newest}:{total}"
+
+
+def file_fingerprint(file_path: str) -> str:
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return "missing"
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def has_side_effect(task: str, result: dict) -> bool:
+    """Whether replaying the result acts on someone's behalf: sends an email or hands out a download."""
+    if task == "filesystem":
+        return True
+    return bool(result.get("file_name"))
+
+
+@dataclass
+class CachedResult:
+    user_query: str
+    task: str
+    result: dict
+    similarity: float
+
+
+class SemanticResultCache:
+    """
+    Summary:
+        Cache of successful agent results keyed by the embedding of the user query.
+
+        A lookup runs after dispatch and only considers entries of the same task.
+        Results with a side effect (an email sent, a file downloaded) are replayed
+        only for the same normalised query, because a similar query may name
+        another recipient, file or page. Read-only results are returned for the
+        most similar stored query above `threshold`. In both cases the entry must
+        be younger than `ttl_seconds` and its dependencies must not have changed:
+        the Chroma collections used by its task and the file it produced or sent.
+
+    Args:
+        db_path (str): SQLite file of the cache.
+        embeddings (Embeddings): embeds user queries.
+        collection_directories (dict): collection name -> persist directory.
+        file_directory (str): directory that downloaded `file_name`s are relative to.
+        threshold (float): minimum cosine similarity for a hit on a read-only result.
+        ttl_seconds (float): lifetime of an entry.
+        max_entries (int): entries kept, oldest first out.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        embeddings: Embeddings,
+        collection_directories: Dict[str, str],
+        file_directory: str = "../data/mock_filesystem",
+        threshold: float = 0.95,
+        ttl_seconds: float = 24 * 60 * 60,
+        max_entries: int = 1000,
+    ):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._embeddings: Embeddings = embeddings
+        self._collection_directories: Dict[str, str] = collection_directories
+        self._file_directory: str = file_directory
+        self._threshold: float = threshold
+        self._ttl_seconds: float = ttl_seconds
+        self._max_entries: int = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            columns = {
+                row[1] for row in self._conn.execute("PRAGMA table_info(results)")
+            }
+            if columns and "normalized_query" not in columns:
+                # entries of older versions cannot tell side-effecting results apart
+                self._conn.execute("DROP TABLE results")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS results (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_query TEXT NOT NULL,
+                    normalized_query TEXT NOT NULL,
+                    task TEXT NOT NULL,
+                    side_effect INTEGER NOT NULL,
+                    vector BLOB NOT NULL,
+                    result TEXT NOT NULL,
+                    dependencies TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @staticmethod
+    def _unit(vector: List[float]) -> List[float]:
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def _target_file(self, task: str, result: dict) -> Optional[str]:
+        if task == "filesystem":
+            return result.get("retrieved_file_path")
+        if result.get("file_name"):
+            return str(Path(self._file_directory) / result["file_name"])
+        return None
+
+    def _dependencies(self, task: str, result: dict) -> Dict[str, str]:
+        dependencies = {
+            f"collection:{name}": directory_fingerprint(
+                self._collection_directories[name]
+            )
+            for name in TASK_COLLECTIONS.get(task, [])
+            if name in self._collection_directories
+        }
+        target_file = self._target_file(task, result)
+        if target_file:
+            dependencies[f"file:{target_file}"] = file_fingerprint(target_file)
+        return dependencies
+
+    def _is_valid(self, dependencies: Dict[str, str]) -> bool:
+        for key, fingerprint in dependencies.items():
+            kind, name = key.split(":", 1)
+            if kind == "collection":
+                current = directory_fingerprint(self._collection_directories[name])
+            else:
+                current = file_fingerprint(name)
+            if current != fingerprint:
+                return False
+        return True
+
+    def _is_cacheable(self, result: dict) -> bool:
+        task = result.get("task_classification")
+        if task == "web":
+            return bool(result.get("browser_use_is_done"))
+        if task == "filesystem":
+            # a send that never reached the outbox must not be replayed as a success
+            return bool(
+                result.get("retrieved_file_path")
+                and result.get("recipient")
+                and result.get("email_queued")
+            )
+        return False
+
+    def _delete(self, ids: List[int]) -> None:
+        if not ids:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM results WHERE id = ?", [(id,) for id in ids]
+            )
+
+    async def alookup(self, user_query: str, task: str) -> Optional[CachedResult]:
+        """The cached result of `user_query`, already dispatched to `task`, if still valid."""
+        normalized = normalize_query(user_query)
+        query_vector: Optional[List[float]] = None
+        deadline = time.time() - self._ttl_seconds
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, user_query, normalized_query, side_effect, vector, result, "
+                "dependencies, created_at FROM results WHERE task = ?",
+                (task,),
+            ).fetchall()
+        expired: List[int] = []
+        best: Optional[tuple] = None
+        for (
+            id,
+            query,
+            stored_normalized,
+            side_effect,
+            blob,
+            result,
+            dependencies,
+            created_at,
+        ) in rows:
+            if created_at < deadline:
+                expired.append(id)
+                continue
+            if stored_normalized == normalized:
+                similarity = 1.0
+            elif side_effect:
+                continue
+            else:
+                if query_vector is None:
+                    query_vector = self._unit(
+                        await self._embeddings.aembed_query(user_query)
+                    )
+                similarity = sum(
+                    a * b for a, b in zip(query_vector, array("f", blob).tolist())
+                )
+            if similarity >= self._threshold and (best is None or similarity > best[0]):
+                best = (similarity, id, query, result, dependencies)
+        self._delete(expired)
+
+        if best is not None:
+            similarity, id, query, result, dependencies = best
+            if self._is_valid(json.loads(dependencies)):
+                self.hits += 1
+                return CachedResult(
+                    user_query=query,
+                    task=task,
+                    result=json.loads(result),
+                    similarity=similarity,
+                )
+            self._delete([id])
+        self.misses += 1
+        return None
+
+    async def astore(self, user_query: str, result: dict) -> bool:
+        """Store a successful result; returns False if the result is not cacheable."""
+        if not self._is_cacheable(result):
+            return False
+        task: str = result["task_classification"]
+        vector = self._unit(await self._embeddings.aembed_query(user_query))
+        payload = json.dumps(result, ensure_ascii=False, default=str)
+        dependencies = json.dumps(self._dependencies(task, result))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO results (user_query, normalized_query, task, side_effect, "
+                "vector, result, dependencies, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    user_query,
+                    normalize_query(user_query),
+                    task,
+                    int(has_side_effect(task, result)),
+                    array("f", vector).tobytes(),
+                    payload,
+                    dependencies,
+                    time.time(),
+                ),
+            )
+            self._conn.execute(
+                "DELETE FROM results WHERE id NOT IN "
+                "(SELECT id FROM results ORDER BY created_at DESC LIMIT ?)",
+                (self._max_entries,),
+            )
+        return True
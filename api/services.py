@@ -0,0 +1,275 @@
+import os
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+    from langchain_core.embeddings import Embeddings
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from browser_pool import BrowserPool
+    from downloader import StreamingDownloader
+    from semantic_cache import SemanticResultCache
+    from node import (
+        ActionReasoner,
+        BrowserUse,
+        Dispatcher,
+        FileRetriever,
+        MessageSender,
+        Synchronizer,
+        UserActionRecorder,
+        WebGuider,
+    )
+
+load_dotenv()
+
+
+class service:
+    """
+    Like `functools.cached_property`, but the service is built only once even when
+    several threads ask for it first at the same time (startup builds the
+    Synchronizer in a worker thread while requests may already use the registry).
+    Services are built under a lock of their own, so building one service does
+    not wait for an unrelated one.
+    """
+
+    def __init__(self, factory: Callable):
+        self._factory = factory
+        self._name: str = factory.__name__
+        self.__doc__ = factory.__doc__
+
+    def __set_name__(self, owner, name: str) -> None:
+        self._name = name
+
+    def __get__(self, registry: "ServiceRegistry", owner=None):
+        if registry is None:
+            return self
+        built = registry.__dict__
+        if self._name in built:
+            return built[self._name]
+        with registry._build_lock(self._name):
+            if self._name not in built:
+                built[self._name] = self._factory(registry)
+            return built[self._name]
+
+
+class ServiceRegistry:
+    """
+    Summary:
+        Central registry of the shared embeddings, vector stores, LLM and graph nodes.
+
+        Every service is created on first access and then reused, so importing the
+        API or a script does not open any database or build any client until a
+        request actually needs it. Heavy optional subsystems (browser_use, selenium,
+        markitdown) are imported by the nodes only when they run.
+
+    Args:
+        llm_model (str): Gemini chat model used by every node.
+        temperature (float): sampling temperature of the chat model.
+        data_dir (str): directory holding the persistent stores.
+        observed_directory (str): directory indexed by the Synchronizer.
+        webguider_k (int): number of manual entries retrieved by the WebGuider.
+        browser_pool_size (int): warm browser processes shared by web tasks.
+    """
+
+    def __init__(
+        self,
+        llm_model: str = "gemini-2.0-flash",
+        temperature: float = 0,
+        data_dir: str = "../data",
+        observed_directory: str = "../data/mock_filesystem",
+        webguider_k: int = 2,
+        browser_pool_size: int = 2,
+    ):
+        self._llm_model: str = llm_model
+        self._temperature: float = temperature
+        self._data_dir: str = data_dir
+        self._observed_directory: str = observed_directory
+        self._webguider_k: int = webguider_k
+        self._browser_pool_size: int = browser_pool_size
+        self._build_locks: Dict[str, threading.RLock] = {}
+        self._build_locks_lock = threading.Lock()
+
+    def _build_lock(self, name: str) -> threading.RLock:
+        with self._build_locks_lock:
+            return self._build_locks.setdefault(name, threading.RLock())
+
+    def is_built(self, name: str) -> bool:
+        """Whether the service `name` has been created, without creating it."""
+        return name in self.__dict__
+
+    def _vectorstore(self, collection_name: str, directory: str) -> "Chroma":
+        from langchain_chroma import Chroma
+        from embedding_backends import check_vector_dimension
+
+        persist_directory = f"{self._data_dir}/{directory}"
+        vectorstore = Chroma(
+            collection_name=collection_name,
+            embedding_function=self.embeddings,
+            persist_directory=persist_directory,
+        )
+        check_vector_dimension(vectorstore, self.embeddings, persist_directory)
+        return vectorstore
+
+    @service
+    def embeddings(self) -> "Embeddings":
+        from embedding_backends import build_embeddings
+
+        return build_embeddings(cache_path=f"{self._data_dir}/embedding_cache.db")
+
+    @service
+    def vectorstore_filesystem_manager(self) -> "Chroma":
+        return self._vectorstore("filesystem_manager", "filesystem_manager_db")
+
+    @service
+    def vectorstore_web_manual(self) -> "Chroma":
+        return self._vectorstore("web_user_manual", "web_user_manual_db")
+
+    @service
+    def vectorstore_email_contact(self) -> "Chroma":
+        return self._vectorstore("email_contact", "email_contact_db")
+
+    @service
+    def llm(self) -> "BaseChatModel":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        return ChatGoogleGenerativeAI(
+            model=self._llm_model, temperature=self._temperature
+        )
+
+    @service
+    def synchronizer(self) -> "Synchronizer":
+        from node import Synchronizer
+
+        return Synchronizer(
+            observed_directory=self._observed_directory,
+            vectorstore=self.vectorstore_filesystem_manager,
+            llm=self.llm,
+            max_concurrency=8,
+            requests_per_minute=60,
+            tokens_per_minute=1_000_000,
+            manifest_path=f"{self._data_dir}/filesystem_manifest.db",
+            description_cache_path=f"{self._data_dir}/llm_cache.db",
+            extraction_max_memory_bytes=(
+                int(os.getenv("EXTRACTION_MAX_MEMORY_MB", "1024")) * 1024 * 1024 or None
+            ),
+        )
+
+    @service
+    def file_retriever(self) -> "FileRetriever":
+        from node import FileRetriever
+
+        return FileRetriever(
+            vectorstore=self.vectorstore_filesystem_manager, llm=self.llm
+        )
+
+    @service
+    def dispatcher(self) -> "Dispatcher":
+        from dispatch_router import DispatchRouter
+        from node import Dispatcher
+
+        return Dispatcher(
+            llm=self.llm,
+            router=DispatchRouter(
+                db_path=f"{self._data_dir}/dispatch_router.db",
+                embeddings=self.embeddings,
+            ),
+        )
+
+    @service
+    def browser_use(self) -> "BrowserUse":
+        from node import BrowserUse
+        from recording_replay import ReplayEngine
+
+        return BrowserUse(
+            llm=self.llm,
+            replay_engine=ReplayEngine(downloader=self.downloader),
+            browser_pool=self.browser_pool,
+            downloader=self.downloader,
+            on_download=self.synchronizer.register_file,
+        )
+
+    @service
+    def downloader(self) -> "StreamingDownloader":
+        from downloader import StreamingDownloader
+
+        return StreamingDownloader(directory=self._observed_directory)
+
+    @service
+    def browser_pool(self) -> "BrowserPool":
+        from browser_pool import BrowserPool
+
+        return BrowserPool(
+            max_browsers=self._browser_pool_size,
+            contexts_per_browser=2,
+            max_uses=20,
+        )
+
+    @service
+    def message_sender(self) -> "MessageSender":
+        from node import MessageSender
+
+        from contact_index import ContactIndex
+
+        return MessageSender(
+            llm=self.llm,
+            vectorstore=self.vectorstore_email_contact,
+            contact_index=ContactIndex(f"{self._data_dir}/contact_index.db"),
+        )
+
+    @service
+    def action_reasoner(self) -> "ActionReasoner":
+        from node import ActionReasoner
+
+        return ActionReasoner(
+            llm=self.llm,
+            vectorstore=self.vectorstore_web_manual,
+            max_concurrency=8,
+            requests_per_minute=60,
+        )
+
+    @service
+    def webguider(self) -> "WebGuider":
+        from node import WebGuider
+        from recording_replay import ReplayLibrary
+
+        return WebGuider(
+            vectorstore=self.vectorstore_web_manual,
+            llm=self.llm,
+            k=self._webguider_k,
+            replay_library=ReplayLibrary(self.vectorstore_web_manual),
+        )
+
+    @service
+    def result_cache(self) -> "SemanticResultCache":
+        from semantic_cache import SemanticResultCache
+
+        return SemanticResultCache(
+            db_path=f"{self._data_dir}/result_cache.db",
+            embeddings=self.embeddings,
+            collection_directories={
+                "filesystem_manager": f"{self._data_dir}/filesystem_manager_db",
+                "web_user_manual": f"{self._data_dir}/web_user_manual_db",
+                "email_contact": f"{self._data_dir}/email_contact_db",
+            },
+            file_directory=self._observed_directory,
+        )
+
+    @service
+    def recorder(self) -> "UserActionRecorder":
+        from node import UserActionRecorder
+
+        return UserActionRecorder()
+
+
+_registry: Optional[ServiceRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ServiceRegistry:
+    """The process-wide registry used by the API and the CLI."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ServiceRegistry()
+        return _registry
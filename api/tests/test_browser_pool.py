@@ -0,0 +1,126 @@
+import asyncio
+
+from browser_pool import BrowserPool
+
+
+class FakeContext:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class FakePlaywrightBrowser:
+    def __init__(self):
+        self.connected = True
+
+    def is_connected(self):
+        return self.connected
+
+    async def new_context(self, **kwargs):
+        return FakeContext()
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.playwright_browser = None
+        self.closed = False
+
+    async def get_playwright_browser(self):
+        if self.playwright_browser is None:
+            self.playwright_browser = FakePlaywrightBrowser()
+        return self.playwright_browser
+
+    async def new_context(self):
+        return FakeContext()
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowserPool(BrowserPool):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.created = []
+
+    def _new_browser(self):
+        self.created.append(FakeBrowser())
+        return self.created[-1]
+
+
+def test_released_browser_is_reused_and_contexts_closed():
+    async def scenario():
+        pool = FakeBrowserPool(max_browsers=2)
+        async with pool.lease() as lease:
+            first = lease.browser
+            context = await lease.agent_context()
+        async with pool.lease() as lease:
+            assert lease.browser is first
+        assert context.closed
+        assert pool.stats() == {
+            "browsers": 1,
+            "active_tasks": 0,
+            "launches": 1,
+            "leases": 2,
+        }
+
+    asyncio.run(scenario())
+
+
+def test_tasks_wait_when_the_pool_is_full():
+    async def scenario():
+        pool = FakeBrowserPool(max_browsers=1, contexts_per_browser=1)
+        release = asyncio.Event()
+        order = []
+
+        async def task(name):
+            async with pool.lease():
+                order.append(f"{name} start")
+                if name == "first":
+                    await release.wait()
+                order.append(f"{name} end")
+
+        first = asyncio.create_task(task("first"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(task("second"))
+        await asyncio.sleep(0.05)
+        # the only slot is taken, the second task has not started
+        assert order == ["first start"]
+        assert pool.stats()["active_tasks"] == 1
+        release.set()
+        await asyncio.gather(first, second)
+        assert order == ["first start", "first end", "second start", "second end"]
+        assert len(pool.created) == 1
+
+    asyncio.run(scenario())
+
+
+def test_crashed_browser_is_discarded_instead_of_reused():
+    async def scenario():
+        pool = FakeBrowserPool(max_browsers=1)
+        async with pool.lease() as lease:
+            crashed = lease.browser
+            crashed.playwright_browser.connected = False
+        assert crashed.closed
+        async with pool.lease() as lease:
+            assert lease.browser is not crashed
+        assert pool.stats()["launches"] == 2
+        assert pool.stats()["browsers"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_browser_is_restarted_after_max_uses():
+    async def scenario():
+        pool = FakeBrowserPool(max_uses=2)
+        browsers = []
+        for _ in range(3):
+            async with pool.lease() as lease:
+                browsers.append(lease.browser)
+        assert browsers[0] is browsers[1] is not browsers[2]
+        assert browsers[0].closed
+        await pool.shutdown()
+        assert browsers[2].closed and pool.stats()["browsers"] == 0
+
+    asyncio.run(scenario())
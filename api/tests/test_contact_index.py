@@ -0,0 +1,59 @@
+import pytest
+
+from contact_index import ContactIndex, decode_cursor, encode_cursor
+
+
+def make_index(tmp_path, names):
+    index = ContactIndex(str(tmp_path / "contacts.db"))
+    index.upsert(
+        (
+            f"id-{i}",
+            {"name": name, "email": f"user{i}@example.com", "description": ""},
+        )
+        for i, name in enumerate(names)
+    )
+    return index
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor("陳小明", "id-1")) == ("陳小明", "id-1")
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
+
+
+def test_pages_cover_every_contact_once_including_equal_names(tmp_path):
+    names = ["Bob", "alice", "Alice", "carol", "Dave", "bob", "Eve"]
+    index = make_index(tmp_path, names)
+    seen, cursor = [], None
+    while True:
+        contacts, cursor = index.page(limit=2, cursor=cursor)
+        assert len(contacts) <= 2
+        seen += [contact["email"] for contact in contacts]
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(f"user{i}@example.com" for i in range(len(names)))
+    assert len(seen) == len(names)
+
+
+def test_last_full_page_has_no_cursor(tmp_path):
+    index = make_index(tmp_path, ["a", "b"])
+    contacts, cursor = index.page(limit=2)
+    assert len(contacts) == 2 and cursor is None
+
+
+def test_prefix_matches_names_and_emails(tmp_path):
+    index = make_index(tmp_path, ["陳小明", "陳小美", "林大華"])
+    contacts, _ = index.page(prefix="陳")
+    assert [contact["name"] for contact in contacts] == ["陳小明", "陳小美"]
+    contacts, _ = index.page(prefix="USER2")
+    assert [contact["name"] for contact in contacts] == ["林大華"]
+
+
+def test_count_and_lookups_follow_writes(tmp_path):
+    index = make_index(tmp_path, ["Ming", "Mei"])
+    assert index.count() == 2
+    assert index.ids_by_name("Ming") == ["id-0"]
+    assert index.ids_by_email("USER1@example.com") == ["id-1"]
+    index.delete(["id-0"])
+    assert index.count() == 1
+    assert index.ids_by_name("Ming") == []
@@ -0,0 +1,51 @@
+import pytest
+
+from contacts import contact_hash, contact_id, parse_contacts
+
+
+def test_contact_id_is_stable_across_case_and_whitespace():
+    assert contact_id(" Ming@Example.com ") == contact_id("ming@example.com")
+    assert contact_id("ming@example.com") != contact_id("mei@example.com")
+
+
+def test_contact_hash_changes_with_the_description():
+    assert contact_hash("Ming", "PM", "ming@example.com") != contact_hash(
+        "Ming", "CEO", "ming@example.com"
+    )
+
+
+def test_csv_with_aliased_columns_and_bom():
+    text = "﻿姓名,電子郵件,職稱\n陳小明,ming@example.com,經理\n無信箱,,\n"
+    assert parse_contacts(text, "contacts.csv") == [
+        {"name": "陳小明", "description": "經理", "email": "ming@example.com"}
+    ]
+
+
+def test_csv_without_email_column_is_rejected():
+    with pytest.raises(ValueError):
+        parse_contacts("name,phone\nMing,123\n", "contacts.csv")
+
+
+def test_vcard_with_folding_parameters_and_escapes():
+    text = (
+        "BEGIN:VCARD\r\n"
+        "VERSION:3.0\r\n"
+        "N:Chen;Ming;;;\r\n"
+        "item1.EMAIL;TYPE=INTERNET:ming@example.com\r\n"
+        "EMAIL:other@example.com\r\n"
+        "TITLE:Manager\\, Sales\r\n"
+        "ORG:ACME;Taipei\r\n"
+        "NOTE:first line\r\n"
+        " continued\r\n"
+        "END:VCARD\r\n"
+        "BEGIN:VCARD\r\n"
+        "FN:No Email\r\n"
+        "END:VCARD\r\n"
+    )
+    assert parse_contacts(text) == [
+        {
+            "name": "Ming Chen",
+            "description": "Manager, Sales; ACME Taipei; first linecontinued",
+            "email": "ming@example.com",
+        }
+    ]
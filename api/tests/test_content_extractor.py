@@ -0,0 +1,124 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from content_extractor import ContentExtractor, memory_limit_supported
+
+
+def test_reads_leading_text(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("你好" * 500, encoding="utf-8")
+    extractor = ContentExtractor(max_chars=10)
+    try:
+        assert extractor.extract(str(path)) == "你好" * 5
+        assert asyncio.run(extractor.aextract(str(path))) == "你好" * 5
+    finally:
+        extractor.shutdown()
+
+
+def test_thread_timeout_abandons_the_thread_and_bounds_stuck_threads(
+    tmp_path, monkeypatch
+):
+    release = threading.Event()
+    original = ContentExtractor._read_text
+
+    def read_text(self, path):
+        if path.stem == "slow":
+            release.wait(5)
+        return original(self, path)
+
+    monkeypatch.setattr(ContentExtractor, "_read_text", read_text)
+    (tmp_path / "slow.txt").write_text("slow")
+    (tmp_path / "fast.txt").write_text("fast")
+    extractor = ContentExtractor(timeout=0.2, max_workers=1, max_abandoned_threads=1)
+    try:
+        started = time.monotonic()
+        assert extractor.extract(str(tmp_path / "slow.txt")) == ""
+        assert time.monotonic() - started < 2
+        # the stuck thread is still running, no further thread is risked
+        assert extractor.extract(str(tmp_path / "fast.txt")) == ""
+        release.set()
+        deadline = time.monotonic() + 5
+        while extractor._too_many_abandoned() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert extractor.extract(str(tmp_path / "fast.txt")) == "fast"
+    finally:
+        release.set()
+        extractor.shutdown()
+
+
+def test_time_in_the_queue_does_not_count(tmp_path, monkeypatch):
+    original = ContentExtractor._read_text
+
+    def read_text(self, path):
+        time.sleep(0.3)
+        return original(self, path)
+
+    monkeypatch.setattr(ContentExtractor, "_read_text", read_text)
+    (tmp_path / "a.txt").write_text("a")
+    (tmp_path / "b.txt").write_text("b")
+    extractor = ContentExtractor(timeout=0.5, max_workers=1)
+
+    async def run():
+        return await asyncio.gather(
+            extractor.aextract(str(tmp_path / "a.txt")),
+            extractor.aextract(str(tmp_path / "b.txt")),
+        )
+
+    try:
+        assert asyncio.run(run()) == ["a", "b"]
+    finally:
+        extractor.shutdown()
+
+
+@pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork",
+    reason="the patched reader only reaches forked workers",
+)
+def test_process_timeout_kills_the_worker(tmp_path, monkeypatch):
+    original = ContentExtractor._read_text
+
+    def read_text(self, path):
+        if path.stem == "slow":
+            time.sleep(30)
+        return original(self, path)
+
+    monkeypatch.setattr(ContentExtractor, "_read_text", read_text)
+    (tmp_path / "slow.txt").write_text("slow")
+    (tmp_path / "fast.txt").write_text("fast")
+    extractor = ContentExtractor(timeout=0.5, process_workers=1)
+    try:
+        started = time.monotonic()
+        assert extractor.extract(str(tmp_path / "slow.txt")) == ""
+        assert time.monotonic() - started < 5
+        # the only worker was stuck; a replaced pool serves the next file
+        assert extractor.extract(str(tmp_path / "fast.txt")) == "fast"
+    finally:
+        extractor.shutdown()
+
+
+@pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork" or not memory_limit_supported(),
+    reason="the patched reader only reaches forked workers capped by RLIMIT_AS",
+)
+def test_worker_over_the_memory_cap_falls_back(tmp_path, monkeypatch):
+    original = ContentExtractor._read_text
+
+    def read_text(self, path):
+        if path.stem == "huge":
+            return bytes(512 * 1024 * 1024).decode()
+        return original(self, path)
+
+    monkeypatch.setattr(ContentExtractor, "_read_text", read_text)
+    (tmp_path / "huge.txt").write_text("huge")
+    (tmp_path / "small.txt").write_text("small")
+    extractor = ContentExtractor(process_workers=1, max_memory_bytes=128 * 1024 * 1024)
+    try:
+        assert extractor.extract(str(tmp_path / "huge.txt")) == ""
+        # the same worker keeps serving files
+        assert extractor.extract(str(tmp_path / "small.txt")) == "small"
+    finally:
+        extractor.shutdown()
@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from dispatch_router import DispatchRouter  # noqa: E402
+
+
+def route(router, query, task="web"):
+    calls = []
+
+    async def llm_fallback(user_query):
+        calls.append(user_query)
+        return task
+
+    decision = asyncio.run(router.aroute(query, llm_fallback=llm_fallback))
+    return decision, calls
+
+
+def test_keyword_decisions_are_not_cached(tmp_path):
+    router = DispatchRouter(db_path=str(tmp_path / "router.db"), stats_every=0)
+    decision, calls = route(router, "幫我到網站下載這份報告")
+    assert decision.source == "rules" and decision.task == "web"
+    assert 0 < decision.confidence < 1
+    assert not calls
+    assert router.stats()["cached_queries"] == 0
+
+
+def test_more_keywords_give_more_confidence(tmp_path):
+    router = DispatchRouter(db_path=str(tmp_path / "router.db"), stats_every=0)
+    two, _ = route(router, "到網站下載報告")
+    three, _ = route(router, "上網到網站下載報告")
+    assert three.confidence > two.confidence
+
+
+def test_a_single_keyword_is_left_to_the_llm(tmp_path):
+    router = DispatchRouter(db_path=str(tmp_path / "router.db"), stats_every=0)
+    decision, calls = route(router, "下載報告", task="web")
+    assert decision.source == "llm" and calls
+    # searching is not a web task by itself
+    decision, calls = route(router, "搜尋報告", task="filesystem")
+    assert decision.source == "llm" and decision.task == "filesystem"
+    decision, calls = route(router, "搜尋我電腦裡的報告", task="filesystem")
+    assert decision.source == "llm" and decision.task == "filesystem"
+
+
+def test_llm_decisions_are_cached_until_they_expire(tmp_path):
+    router = DispatchRouter(
+        db_path=str(tmp_path / "router.db"), cache_ttl=0.2, stats_every=0
+    )
+    decision, calls = route(router, "幫我處理一下那個東西", task="filesystem")
+    assert decision.source == "llm" and decision.confidence is None
+    decision, calls = route(router, "幫我處理一下那個東西")
+    assert decision.source == "cache" and decision.task == "filesystem"
+    assert not calls
+    time.sleep(0.3)
+    decision, calls = route(router, "幫我處理一下那個東西")
+    assert decision.source == "llm" and calls
+
+
+def test_forget_evicts_a_decision_across_restarts(tmp_path):
+    db_path = str(tmp_path / "router.db")
+    router = DispatchRouter(db_path=db_path, stats_every=0)
+    route(router, "幫我處理一下那個東西", task="filesystem")
+    assert DispatchRouter(db_path=db_path).stats()["cached_queries"] == 1
+    assert router.forget("幫我處理一下那個東西。")
+    assert not router.forget("幫我處理一下那個東西")
+    assert DispatchRouter(db_path=db_path).stats()["cached_queries"] == 0
+
+
+def test_stats_average_only_measured_confidences(tmp_path):
+    router = DispatchRouter(db_path=str(tmp_path / "router.db"), stats_every=0)
+    rules, _ = route(router, "到網站下載報告")
+    route(router, "幫我處理一下那個東西")
+    stats = router.stats()
+    assert stats["total"] == 2 and stats["llm"] == 1
+    assert stats["fast_path_rate"] == 0.5
+    assert stats["mean_confidence"] == pytest.approx(rules.confidence)
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from downloader import (
+    DownloadError,
+    StreamingDownloader,
+    file_name_from_url,
+    safe_file_name,
+)
+from file_manifest import hash_file
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("https://example.com/files/report.pdf", "report.pdf"),
+        ("https://example.com/%E5%A0%B1%E5%91%8A.pdf", "報告.pdf"),
+        ("https://example.com/files/..%2F..%2Fetc%2Fpasswd", "passwd"),
+        ("https://example.com/a/%2E%2E%5C%2E%2E%5Cboot.ini", "boot.ini"),
+        ("https://example.com/files/%2E%2E", "download"),
+        ("https://example.com/C%3Aevil.exe", "download"),
+        ("https://example.com/", "download"),
+    ],
+)
+def test_file_name_from_url_never_leaves_the_directory(url, expected):
+    assert file_name_from_url(url) == expected
+
+
+@pytest.mark.parametrize("name", ["", "..", "../x", "a\\b", "C:x", "a\nb"])
+def test_safe_file_name_rejects_paths(name):
+    with pytest.raises(DownloadError):
+        safe_file_name(name)
+
+
+def test_save_stores_a_written_file_with_its_hash(tmp_path):
+    downloader = StreamingDownloader(
+        str(tmp_path / "files"), partial_directory=str(tmp_path / "partial")
+    )
+
+    async def write(path):
+        path.write_bytes(b"content")
+
+    result = asyncio.run(downloader.save(write, "data.csv", key="https://x/data.csv"))
+    assert result.path == str((tmp_path / "files" / "data.csv").resolve())
+    assert (tmp_path / "files" / "data.csv").read_bytes() == b"content"
+    assert result.size == 7
+    assert result.content_hash == hash_file(result.path)
+    assert not list((tmp_path / "partial").iterdir())
+    with pytest.raises(DownloadError):
+        asyncio.run(downloader.save(write, "../data.csv", key="https://x/y"))
+
+
+def test_concurrent_saves_of_one_file_take_turns(tmp_path):
+    downloader = StreamingDownloader(
+        str(tmp_path / "files"), partial_directory=str(tmp_path / "partial")
+    )
+
+    def writer(content):
+        async def write(path):
+            with open(path, "wb") as f:
+                for byte in content:
+                    f.write(bytes([byte]))
+                    f.flush()
+                    await asyncio.sleep(0.001)
+
+        return write
+
+    async def scenario():
+        return await asyncio.gather(
+            downloader.save(writer(b"aaaa"), "data.csv", key="https://x/data.csv"),
+            downloader.save(writer(b"bbbbbb"), "data.csv", key="https://x/data.csv"),
+        )
+
+    first, second = asyncio.run(scenario())
+    assert (first.size, second.size) == (4, 6)
+    assert (tmp_path / "files" / "data.csv").read_bytes() == b"bbbbbb"
+
+
+def test_concurrent_downloads_of_one_url_do_not_mix(tmp_path):
+    httpx = pytest.importorskip("httpx")
+    body = bytes(range(256)) * 64
+
+    async def handler(request):
+        async def stream():
+            for start in range(0, len(body), 1024):
+                await asyncio.sleep(0.001)
+                yield body[start : start + 1024]
+
+        return httpx.Response(200, content=stream())
+
+    downloader = StreamingDownloader(
+        str(tmp_path / "files"),
+        partial_directory=str(tmp_path / "partial"),
+        chunk_size=512,
+    )
+
+    async def scenario():
+        downloader._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            return await asyncio.gather(
+                downloader.download("https://x/data.bin"),
+                downloader.download("https://x/data.bin"),
+                downloader.download("https://x/data.bin", file_name="copy.bin"),
+            )
+        finally:
+            await downloader.aclose()
+
+    results = asyncio.run(scenario())
+    assert [result.size for result in results] == [len(body)] * 3
+    for result in results:
+        assert open(result.path, "rb").read() == body
+        assert result.content_hash == hash_file(result.path)
+    assert not list((tmp_path / "partial").iterdir())
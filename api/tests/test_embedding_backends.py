@@ -0,0 +1,77 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+from embedding_backends import CachedEmbeddings, check_vector_dimension  # noqa: E402
+
+
+class CountingEmbeddings(Embeddings):
+    """Vectors derived from the text length, with a marker for queries."""
+
+    def __init__(self, model="fake-model"):
+        self.model = model
+        self.documents = []
+        self.queries = []
+
+    def embed_documents(self, texts):
+        self.documents.extend(texts)
+        return [[float(len(text)), 0.0] for text in texts]
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [float(len(text)), 1.0]
+
+
+def test_cached_vectors_skip_the_wrapped_model(tmp_path):
+    backend = CountingEmbeddings()
+    cache = CachedEmbeddings(backend, db_path=str(tmp_path / "cache.db"))
+    first = cache.embed_documents(["alpha", "beta", "alpha"])
+    assert backend.documents == ["alpha", "beta"]
+    assert cache.embed_documents(["beta", "alpha"]) == [first[1], first[0]]
+    assert backend.documents == ["alpha", "beta"]
+    assert cache.embed_query("alpha") == cache.embed_query("alpha")
+    assert backend.queries == ["alpha"]
+    # a new process reads the same store
+    reopened = CachedEmbeddings(backend, db_path=str(tmp_path / "cache.db"))
+    assert reopened.embed_documents(["alpha"]) == [first[0]]
+    assert backend.documents == ["alpha", "beta"]
+    assert (reopened.hits, reopened.misses) == (1, 0)
+
+
+def test_cache_keys_include_model_and_kind(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    first = CountingEmbeddings("model-a")
+    CachedEmbeddings(first, db_path=db_path).embed_documents(["alpha"])
+    # a query is not answered with the document vector of the same text
+    assert CachedEmbeddings(first, db_path=db_path).embed_query("alpha") == [5.0, 1.0]
+    assert first.queries == ["alpha"]
+    # another model does not see the first model's vectors
+    second = CountingEmbeddings("model-b")
+    CachedEmbeddings(second, db_path=db_path).embed_documents(["alpha"])
+    assert second.documents == ["alpha"]
+
+
+class FakeCollection:
+    def __init__(self, embeddings):
+        self._embeddings = embeddings
+
+    def get(self, limit=None, include=None):
+        return {"ids": ["id"] * len(self._embeddings), "embeddings": self._embeddings}
+
+
+class FakeVectorStore:
+    def __init__(self, embeddings):
+        self._collection = FakeCollection(embeddings)
+
+
+def test_mismatched_vector_dimension_fails_clearly():
+    embeddings = CountingEmbeddings()
+    check_vector_dimension(FakeVectorStore([]), embeddings, "empty_db")
+    assert embeddings.queries == []
+    check_vector_dimension(FakeVectorStore([[0.1, 0.2]]), embeddings, "same_db")
+    with pytest.raises(ValueError, match="other_db holds 3-dimensional vectors"):
+        check_vector_dimension(
+            FakeVectorStore([[0.1, 0.2, 0.3]]), embeddings, "other_db"
+        )
@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+from filesystem_watcher import FilesystemWatcher
+
+
+class FakeSynchronizer:
+    def __init__(self, directory):
+        self.observed_directory = str(directory)
+        self.synced = []
+
+    async def sync(self, paths=None):
+        self.synced.append(paths)
+
+
+def test_debounce_is_measured_from_the_latest_change(tmp_path):
+    watcher = FilesystemWatcher(FakeSynchronizer(tmp_path))
+    path = str(tmp_path / "report.pdf")
+    watcher.notify(path)
+    first = watcher._pending[path]
+    time.sleep(0.01)
+    watcher.notify(path)
+    assert watcher._pending[path] == first
+    assert watcher._last_change[path] > first
+
+
+def test_wait_for_syncs_pending_paths(tmp_path):
+    synchronizer = FakeSynchronizer(tmp_path)
+    watcher = FilesystemWatcher(
+        synchronizer, poll_interval=60, use_watchdog=False
+    ).start()
+    try:
+        path = str(tmp_path / "新檔案.txt")
+        assert asyncio.run(watcher.wait_for([], timeout=5))
+        watcher.notify(path)
+        assert asyncio.run(watcher.wait_for([path], timeout=5))
+        # in polling mode the wakeup may already have picked the path up in a full sync
+        assert synchronizer.synced[-1] in ([path], None)
+        assert watcher.pending_paths() == []
+    finally:
+        watcher.stop()
+
+
+def test_wait_for_returns_false_when_not_running(tmp_path):
+    watcher = FilesystemWatcher(FakeSynchronizer(tmp_path))
+    assert not asyncio.run(watcher.wait_for(None, timeout=0.1))
@@ -0,0 +1,74 @@
+import asyncio
+
+from jobs import JobManager
+
+
+class FakeGraph:
+    """Emits the root run's end event with the input echoed back."""
+
+    def __init__(self):
+        self.inputs = []
+
+    async def astream_events(self, inputs, version):
+        self.inputs.append(inputs)
+        yield {
+            "event": "on_chain_end",
+            "name": "LangGraph",
+            "parent_ids": [],
+            "data": {"output": {**inputs, "answer": 42}},
+        }
+
+
+async def run_job(manager, user_query):
+    job = await manager.submit(user_query)
+    events = [event async for event in manager.subscribe(job)]
+    await manager.shutdown()
+    return job, events
+
+
+def test_jobs_are_routed_and_their_results_stored():
+    graph = FakeGraph()
+    stored = []
+
+    async def router(user_query):
+        return {"user_query": user_query, "task_classification": "web"}, None
+
+    async def result_handler(user_query, result):
+        stored.append((user_query, result))
+
+    manager = JobManager(
+        graph_factory=lambda: graph, router=router, result_handler=result_handler
+    )
+    job, events = asyncio.run(run_job(manager, "download the report"))
+    assert job.status == "succeeded"
+    # the graph starts from the routing instead of classifying again
+    assert graph.inputs == [
+        {"user_query": "download the report", "task_classification": "web"}
+    ]
+    assert stored == [("download the report", job.result)]
+    routed = next(event for event in events if event["event"] == "routed")
+    assert routed["task_classification"] == "web"
+    assert routed["from_cache"] is False
+
+
+def test_a_ready_result_skips_the_graph():
+    graph = FakeGraph()
+    stored = []
+
+    async def router(user_query):
+        return {"user_query": user_query}, {"answer": "cached"}
+
+    async def result_handler(user_query, result):
+        stored.append(result)
+
+    manager = JobManager(
+        graph_factory=lambda: graph,
+        router=router,
+        result_handler=result_handler,
+        result_formatter=lambda result: {**result, "formatted": True},
+    )
+    job, _ = asyncio.run(run_job(manager, "download the report"))
+    assert job.status == "succeeded"
+    assert job.result == {"answer": "cached", "formatted": True}
+    assert graph.inputs == []
+    assert stored == []
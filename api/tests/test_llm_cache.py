@@ -0,0 +1,73 @@
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+import llm_cache  # noqa: E402
+from llm_cache import ResponseCache, llm_identity  # noqa: E402
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Every access gets a later time, so recency never ties."""
+    ticks = itertools.count(1)
+    monkeypatch.setattr(llm_cache, "time", SimpleNamespace(time=lambda: next(ticks)))
+
+
+def test_least_recently_used_entry_is_evicted_at_capacity(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.db"), max_entries=3)
+    for key in ("a", "b", "c"):
+        cache.put(key, key.upper())
+    assert cache.get("a") == "A"
+    cache.put("d", "D")
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in ("a", "c", "d")] == ["A", "C", "D"]
+    assert cache.stats()["entries"] == 3
+    assert cache.evictions == 1
+
+
+def test_size_limit_evicts_but_keeps_the_newest_entry(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.db"), max_bytes=10)
+    cache.put("old", "x" * 8)
+    cache.put("new", "y" * 8)
+    assert cache.get("old") is None
+    assert cache.get("new") == "y" * 8
+    cache.put("huge", "z" * 50)
+    assert cache.get("huge") == "z" * 50
+
+
+def test_hits_and_misses_are_counted(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+    assert cache.get("a") is None
+    cache.put("a", "A")
+    assert cache.get("a") == "A"
+    assert cache.get("a") == "A"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
+
+
+def test_entries_survive_reopening(tmp_path, clock):
+    ResponseCache(str(tmp_path / "cache.db")).put("a", "A")
+    assert ResponseCache(str(tmp_path / "cache.db")).get("a") == "A"
+
+
+def test_keys_separate_prompts_and_models():
+    parts = {"content_hash": "abc", "system_prompt": "describe", "model": "m1"}
+    key = ResponseCache.make_key(**parts)
+    assert key == ResponseCache.make_key(**dict(reversed(parts.items())))
+    assert key != ResponseCache.make_key(**{**parts, "system_prompt": "summarise"})
+    assert key != ResponseCache.make_key(**{**parts, "model": "m2"})
+    assert key != ResponseCache.make_key(**{**parts, "content_hash": "abd"})
+
+
+def test_llm_identity_distinguishes_model_and_temperature():
+    first = llm_identity(SimpleNamespace(model="gemini-2.0-flash", temperature=0))
+    assert first == {"model": "gemini-2.0-flash", "temperature": "0"}
+    assert first != llm_identity(SimpleNamespace(model="gemini-2.0-pro", temperature=0))
+    assert first != llm_identity(
+        SimpleNamespace(model="gemini-2.0-flash", temperature=0.7)
+    )
+    assert llm_identity(SimpleNamespace(model_name="gpt-4o"))["model"] == "gpt-4o"
@@ -0,0 +1,185 @@
+import email
+import socketserver
+import threading
+import time
+from email.policy import default
+
+import pytest
+
+import mail_queue
+from mail_queue import (
+    OutboundMailQueue,
+    SMTPConnectionPool,
+    get_mail_queue,
+    parse_address,
+    shutdown_mail_queue,
+    write_mime_message,
+)
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Minimal local SMTP server that keeps every message it accepts."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.messages = []  # (envelope recipient, raw message)
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        self.reply("220 localhost ready")
+        recipient = None
+        while line := self.rfile.readline():
+            command = line.decode("ascii").strip()
+            verb = command[:4].upper()
+            if verb == "EHLO" or verb == "HELO":
+                self.reply("250 localhost")
+            elif verb == "RCPT":
+                recipient = command.split(":", 1)[1].strip().strip("<>")
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = b""
+                while (chunk := self.rfile.readline()) != b".\r\n":
+                    data += chunk[1:] if chunk.startswith(b"..") else chunk
+                self.server.messages.append((recipient, data))
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:  # MAIL, RSET, NOOP
+                self.reply("250 OK")
+
+
+@pytest.fixture
+def smtp_server():
+    server = SMTPStandIn()
+    yield server
+    server.close()
+
+
+def test_parse_address_rejects_header_injection():
+    assert parse_address("陳小明 <ming@example.com>") == ("陳小明", "ming@example.com")
+    for address in (
+        "ming@example.com\r\nBcc: evil@example.com",
+        "ming@example.com\nSubject: spam",
+        "a@example.com, b@example.com",
+        "not an address",
+    ):
+        with pytest.raises(ValueError):
+            parse_address(address)
+
+
+def test_write_mime_message_streams_the_attachment(tmp_path):
+    attachment = tmp_path / "報告.bin"
+    attachment.write_bytes(bytes(range(256)) * 1000)
+    path = tmp_path / "message.eml"
+    write_mime_message(
+        path,
+        "agent@example.com",
+        "陳小明 <ming@example.com>",
+        "月報",
+        "內文",
+        str(attachment),
+    )
+    message = email.message_from_bytes(path.read_bytes(), policy=default)
+    assert message["To"] == "陳小明 <ming@example.com>"
+    assert message["Subject"] == "月報"
+    body, part = message.iter_parts()
+    assert body.get_content().strip() == "內文"
+    assert part.get_filename() == "報告.bin"
+    assert part.get_content() == attachment.read_bytes()
+
+
+def test_queue_delivers_through_local_smtp(tmp_path, smtp_server):
+    attachment = tmp_path / "notes.txt"
+    attachment.write_text(".starts with a dot\n")
+    pool = SMTPConnectionPool("127.0.0.1", smtp_server.port, starttls=False, timeout=5)
+    outbox = OutboundMailQueue(
+        str(tmp_path / "outbox"), pool, sender="agent@example.com", workers=1
+    )
+    try:
+        message_id = outbox.enqueue("Ming <ming@example.com>", str(attachment))
+        deadline = time.monotonic() + 5
+        while outbox.status(message_id)["status"] != "sent":
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+    finally:
+        outbox.stop()
+    ((recipient, raw),) = smtp_server.messages
+    assert recipient == "ming@example.com"
+    message = email.message_from_bytes(raw, policy=default)
+    _, part = message.iter_parts()
+    assert part.get_content() == attachment.read_bytes()
+
+
+def test_enqueue_rejects_injected_recipients(tmp_path):
+    pool = SMTPConnectionPool("127.0.0.1", 1, starttls=False)
+    outbox = OutboundMailQueue(
+        str(tmp_path / "outbox"), pool, sender="agent@example.com"
+    )
+    attachment = tmp_path / "notes.txt"
+    attachment.write_text("notes")
+    with pytest.raises(ValueError):
+        outbox.enqueue("ming@example.com\r\nBcc: evil@example.com", str(attachment))
+    assert not outbox.is_running
+
+
+def test_mail_left_in_the_outbox_is_sent_after_a_restart(
+    tmp_path, smtp_server, monkeypatch
+):
+    attachment = tmp_path / "notes.txt"
+    attachment.write_text("notes")
+    directory = tmp_path / "outbox"
+    # a run without workers only persists its mail, like a process that died
+    before = OutboundMailQueue(
+        str(directory),
+        SMTPConnectionPool("127.0.0.1", 1, starttls=False),
+        sender="agent@example.com",
+        workers=0,
+    )
+    queued = before.enqueue("ming@example.com", str(attachment))
+    interrupted = before.enqueue("hua@example.com", str(attachment))
+    with before._conn:
+        before._conn.execute(
+            "UPDATE outbox SET status = 'sending' WHERE id = ?", (interrupted,)
+        )
+
+    monkeypatch.setattr(mail_queue, "_mail_queue", None)
+    monkeypatch.setenv("MAIL_QUEUE_DIR", str(directory))
+    monkeypatch.setenv("SMTP_HOST", "127.0.0.1")
+    monkeypatch.setenv("SMTP_PORT", str(smtp_server.port))
+    monkeypatch.setenv("SMTP_STARTTLS", "false")
+    monkeypatch.setenv("SMTP_USERNAME", "")
+    monkeypatch.setenv("MAIL_FROM", "agent@example.com")
+    try:
+        outbox = get_mail_queue()
+        deadline = time.monotonic() + 5
+        while any(
+            outbox.status(message_id)["status"] != "sent"
+            for message_id in (queued, interrupted)
+        ):
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+    finally:
+        shutdown_mail_queue()
+    assert sorted(recipient for recipient, _ in smtp_server.messages) == [
+        "hua@example.com",
+        "ming@example.com",
+    ]
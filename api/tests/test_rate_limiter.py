@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import pytest
+
+from rate_limiter import RateLimiter, TokenBucket, is_rate_limit_error
+
+
+class ResourceExhausted(Exception):
+    pass
+
+
+def test_is_rate_limit_error_detects_provider_errors():
+    assert is_rate_limit_error(ResourceExhausted("quota"))
+    assert is_rate_limit_error(Exception("429 Too Many Requests"))
+    assert not is_rate_limit_error(ValueError("bad input"))
+
+
+def test_token_bucket_wait_time_after_consuming():
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.wait_time(60) == 0
+    bucket.consume(60)
+    # refilled at one unit per second
+    assert bucket.wait_time(1) == pytest.approx(1.0, abs=0.05)
+
+
+def test_token_bucket_lets_oversized_requests_through_when_full():
+    bucket = TokenBucket(per_minute=10)
+    assert bucket.wait_time(100) == 0
+
+
+def test_token_bucket_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(per_minute=0)
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(requests_per_minute=600)  # one every 0.1s once drained
+
+    async def run():
+        for _ in range(600):
+            limiter._request_bucket.consume(1)
+        start = time.monotonic()
+        await limiter.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.08
+
+
+def test_rate_limiter_backoff_grows_and_decays():
+    limiter = RateLimiter(initial_backoff=1.0, max_backoff=4.0)
+    assert 0.8 <= limiter.report_rate_limited() <= 1.2
+    assert 1.6 <= limiter.report_rate_limited() <= 2.4
+    limiter.report_rate_limited()
+    assert 3.2 <= limiter.report_rate_limited() <= 4.8  # capped at max_backoff
+    for _ in range(3):
+        limiter.report_success()
+    assert limiter._backoff == 0.0
@@ -0,0 +1,84 @@
+import pytest
+
+import recipient_resolver
+from contact_index import ContactIndex
+from recipient_resolver import RecipientResolver
+
+
+@pytest.fixture
+def resolver(tmp_path):
+    index = ContactIndex(str(tmp_path / "contacts.db"))
+    contacts = [
+        ("Anna", "anna@x.com"),
+        ("Amy Chen", "amy@x.com"),
+        ("Amy", "amy.other@x.com"),
+        ("陳小明", "ming@x.com"),
+        ("王大同", "tung@x.com"),
+    ]
+    index.upsert(
+        (email, {"name": name, "email": email, "description": ""})
+        for name, email in contacts
+    )
+    return RecipientResolver(index)
+
+
+def test_literal_email_wins(resolver):
+    match = resolver.resolve("send it to Bob@Example.com please")
+    assert (match.email, match.source, match.confidence) == (
+        "Bob@Example.com",
+        "email",
+        1.0,
+    )
+
+
+def test_several_emails_are_ambiguous(resolver):
+    match = resolver.resolve("send it to a@example.com and b@example.com")
+    assert match.confidence == 0.0 and len(match.candidates) == 2
+
+
+def test_exact_name_longest_match_wins(resolver):
+    match = resolver.resolve("send the report to Amy Chen")
+    assert (match.email, match.source) == ("amy@x.com", "exact_name")
+    assert match.confidence > 0
+
+
+def test_exact_cjk_name(resolver):
+    match = resolver.resolve("把報告寄給陳小明")
+    assert (match.email, match.source) == ("ming@x.com", "exact_name")
+
+
+def test_names_match_whole_words_only(resolver):
+    # "anna" inside "annual" is not Anna
+    match = resolver.resolve("send the annual report to my boss")
+    assert match is None or match.confidence == 0
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["send the annual report to my boss", "把報告寄給陳小美", "mail Ana the file"],
+)
+def test_similar_names_are_only_candidates(resolver, query):
+    match = resolver.resolve(query)
+    assert match is None or (match.confidence == 0 and match.email == "")
+
+
+def test_similar_cjk_name_is_passed_as_candidate(resolver):
+    match = resolver.resolve("把報告寄給陳小美")
+    assert match.source == "fuzzy_name"
+    assert match.candidates == ["ming@x.com"]
+
+
+def test_pinyin_match(resolver):
+    if recipient_resolver.lazy_pinyin is None:
+        pytest.skip("pypinyin is not installed")
+    match = resolver.resolve("send the report to Chen Xiaoming")
+    assert (match.email, match.source) == ("ming@x.com", "pinyin")
+
+
+def test_index_changes_are_picked_up(resolver):
+    match = resolver.resolve("寄給林小華")
+    assert match is None or not match.email
+    resolver._contact_index.upsert(
+        [("hua@x.com", {"name": "林小華", "email": "hua@x.com", "description": ""})]
+    )
+    assert resolver.resolve("寄給林小華").email == "hua@x.com"
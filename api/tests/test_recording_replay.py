@@ -0,0 +1,86 @@
+import re
+
+from recording_replay import _task_pattern, candidate_selectors, compile_recording
+
+
+def recording(task_question, *interactions):
+    return {
+        "task_question": task_question,
+        "userInteraction_recording": [
+            {
+                "Actual_Interaction": description,
+                "Executed_On_URL": url,
+                "Raw_Interaction": raw,
+            }
+            for description, url, raw in interactions
+        ],
+    }
+
+
+def test_candidate_selectors_most_specific_first():
+    selectors = candidate_selectors(
+        {"target": "BUTTON", "id": "go", "text": "Search", "class": "btn primary"}
+    )
+    assert selectors == [
+        '[id="go"]',
+        'button:text-is("Search")',
+        'text="Search"',
+        'button[class~="btn"][class~="primary"]',
+    ]
+
+
+def test_candidate_selectors_match_a_prefix_of_truncated_text():
+    assert candidate_selectors({"target": "div", "text": "first\nsecond"}) == [
+        "text=first"
+    ]
+
+
+def test_compiled_recording_binds_new_values():
+    script = compile_recording(
+        recording(
+            "Search weather in Taipei",
+            (
+                "Typed Taipei",
+                "https://example.com",
+                {"type": "input", "value": "Taipei", "target": "input", "id": "q"},
+            ),
+            (
+                "Clicked result",
+                "https://example.com/results",
+                {"type": "click", "target": "a", "text": "Weather"},
+            ),
+        )
+    )
+    assert [step.action for step in script.steps] == ["input", "click"]
+    # the page changed right after typing
+    assert script.steps[0].submit
+    assert script.bind("search weather in Tokyo.") == {"p0": "Tokyo"}
+    assert script.bind("download the Tokyo report") is None
+
+
+def test_compile_recording_needs_raw_interactions():
+    assert (
+        compile_recording(recording("Open", ("Clicked", "https://example.com", None)))
+        is None
+    )
+
+
+def test_parameters_match_whole_words_only():
+    # "in" also occurs inside "Find" and "invoices"
+    pattern = _task_pattern("Find invoices in March", {"p0": "in"})
+    match = re.fullmatch(pattern, "Find invoices before March")
+    assert match is not None and match.group("p0") == "before"
+
+
+def test_parameters_in_chinese_questions():
+    script = compile_recording(
+        recording(
+            "查詢台北的天氣",
+            (
+                "輸入台北",
+                "https://example.com",
+                {"type": "input", "value": "台北", "target": "input"},
+            ),
+        )
+    )
+    assert script.bind("查詢高雄的天氣") == {"p0": "高雄"}
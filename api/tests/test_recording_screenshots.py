@@ -0,0 +1,89 @@
+import base64
+import json
+import time
+
+from recording_screenshots import INDEX_FILE, ScreenshotRecorder, load_screenshot_paths
+
+
+class FakeDriver:
+    """Serves queued frames through CDP; None makes the capture fail."""
+
+    def __init__(self, *frames):
+        self.frames = list(frames)
+
+    def execute_cdp_cmd(self, command, params):
+        frame = self.frames.pop(0)
+        if frame is None:
+            raise RuntimeError("tab crashed")
+        return {"data": base64.b64encode(frame).decode("ascii")}
+
+    def get_screenshot_as_png(self):
+        raise RuntimeError("no fallback either")
+
+
+def record(tmp_path, captures):
+    recorder = ScreenshotRecorder(str(tmp_path))
+    driver = FakeDriver(*(frame for _, frame in captures))
+    try:
+        for step, _ in captures:
+            recorder.capture(driver, step)
+    finally:
+        recorder.close()
+    return load_screenshot_paths(tmp_path)
+
+
+def test_a_recaptured_step_does_not_change_other_steps(tmp_path):
+    frames = record(tmp_path, [(2, b"A"), (2, b"B"), (3, b"A")])
+    assert frames[2].read_bytes() == b"B"
+    assert frames[3].read_bytes() == b"A"
+
+
+def test_identical_frames_share_one_file(tmp_path):
+    frames = record(tmp_path, [(1, b"A"), (2, b"A"), (3, b"B")])
+    assert frames[1] == frames[2] != frames[3]
+    assert len(list(tmp_path.glob("screenshot_*"))) == 2
+
+
+def test_failed_captures_leave_an_explicit_gap(tmp_path):
+    frames = record(tmp_path, [(1, b"A"), (2, None), (3, b"C"), (3, None)])
+    assert sorted(frames) == [1, 3]
+    assert frames[3].read_bytes() == b"C"
+    index = json.loads((tmp_path / INDEX_FILE).read_text(encoding="utf-8"))
+    assert index["missing"] == [2]
+
+
+def test_legacy_png_names_are_keyed_by_step(tmp_path):
+    for step in (1, 2, 10):
+        (tmp_path / f"screenshot_{step}.png").write_bytes(b"png")
+    assert sorted(load_screenshot_paths(tmp_path)) == [1, 2, 10]
+
+
+def test_index_is_written_on_an_interval_and_at_close(tmp_path, monkeypatch):
+    writes = []
+    original = ScreenshotRecorder._write_index
+
+    def write_index(self):
+        writes.append(len(self._frames))
+        original(self)
+
+    monkeypatch.setattr(ScreenshotRecorder, "_write_index", write_index)
+    recorder = ScreenshotRecorder(str(tmp_path), index_interval=60)
+    driver = FakeDriver(*(bytes([step]) for step in range(50)))
+    for step in range(50):
+        recorder.capture(driver, step)
+    recorder.close()
+    assert writes == [50]
+    assert sorted(load_screenshot_paths(tmp_path)) == list(range(50))
+
+
+def test_index_is_flushed_while_recording(tmp_path):
+    recorder = ScreenshotRecorder(str(tmp_path), index_interval=0.05)
+    try:
+        recorder.capture(FakeDriver(b"A"), 1)
+        deadline = time.monotonic() + 5
+        while not (tmp_path / INDEX_FILE).exists():
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        assert sorted(load_screenshot_paths(tmp_path)) == [1]
+    finally:
+        recorder.close()
@@ -0,0 +1,45 @@
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+ImageDraw = pytest.importorskip("PIL.ImageDraw")
+
+from screenshot_pipeline import ScreenshotEncoder  # noqa: E402
+
+
+def form(path, text="", checked=False, quality=90):
+    """A 1280x720 page with a text box and a checkbox."""
+    image = Image.new("RGB", (1280, 720), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((100, 100, 500, 130), outline="black")
+    draw.text((105, 108), text, fill="black")
+    draw.rectangle((100, 200, 116, 216), outline="black")
+    if checked:
+        draw.line((102, 208, 108, 214, 114, 202), fill="black", width=2)
+    image.save(path, "JPEG", quality=quality)
+    return path
+
+
+def test_identical_frames_are_duplicates(tmp_path):
+    encoder = ScreenshotEncoder()
+    a = encoder.encode(form(tmp_path / "a.jpg", "hello"))
+    b = encoder.encode(form(tmp_path / "b.jpg", "hello", quality=85))
+    assert encoder.is_duplicate(a, b)
+
+
+@pytest.mark.parametrize(
+    "change", [{"text": "hello!"}, {"text": "hello", "checked": True}]
+)
+def test_small_changes_are_not_duplicates(tmp_path, change):
+    encoder = ScreenshotEncoder()
+    before = encoder.encode(form(tmp_path / "before.jpg", "hello"))
+    after = encoder.encode(form(tmp_path / "after.jpg", **change))
+    assert not encoder.is_duplicate(before, after)
+
+
+def test_encoding_downscales_and_is_cached(tmp_path):
+    encoder = ScreenshotEncoder(max_side=640)
+    path = form(tmp_path / "a.jpg", "hello")
+    encoded = encoder.encode(path)
+    assert encoded.data_url.startswith("data:image/jpeg;base64,")
+    assert encoded.encoded_bytes < encoded.original_bytes
+    assert encoder.encode(path) is encoded
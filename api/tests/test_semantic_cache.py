@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from semantic_cache import SemanticResultCache  # noqa: E402
+
+
+class FakeEmbeddings:
+    """Every query lands on the same vector, so any two queries look identical."""
+
+    async def aembed_query(self, text):
+        return [1.0, 0.0]
+
+
+def make_cache(tmp_path):
+    return SemanticResultCache(
+        db_path=str(tmp_path / "cache.db"),
+        embeddings=FakeEmbeddings(),
+        collection_directories={},
+        file_directory=str(tmp_path),
+    )
+
+
+def test_side_effecting_results_need_the_same_query(tmp_path):
+    report = tmp_path / "report.pdf"
+    report.write_text("report")
+    cache = make_cache(tmp_path)
+    result = {
+        "task_classification": "filesystem",
+        "retrieved_file_path": str(report),
+        "recipient": "anna@example.com",
+        "email_queued": True,
+    }
+    assert asyncio.run(cache.astore("把報告寄給 Anna", result))
+    assert asyncio.run(cache.alookup("把報告寄給 Bob", "filesystem")) is None
+    cached = asyncio.run(cache.alookup("把報告寄給  anna。", "filesystem"))
+    assert cached is not None and cached.result["recipient"] == "anna@example.com"
+
+
+def test_failed_sends_are_not_cached(tmp_path):
+    cache = make_cache(tmp_path)
+    result = {
+        "task_classification": "filesystem",
+        "retrieved_file_path": str(tmp_path / "report.pdf"),
+        "recipient": "anna@example.com",
+        "email_queued": False,
+    }
+    assert not asyncio.run(cache.astore("把報告寄給 Anna", result))
+
+
+def test_read_only_results_match_similar_queries_of_the_same_task(tmp_path):
+    cache = make_cache(tmp_path)
+    result = {
+        "task_classification": "web",
+        "browser_use_is_done": True,
+        "extracted_content": "晴天",
+    }
+    assert asyncio.run(cache.astore("今天天氣如何", result))
+    assert asyncio.run(cache.alookup("今天的天氣", "web")) is not None
+    assert asyncio.run(cache.alookup("今天的天氣", "filesystem")) is None
+
+
+def test_a_download_is_not_handed_to_another_query(tmp_path):
+    (tmp_path / "a.csv").write_text("a")
+    cache = make_cache(tmp_path)
+    result = {
+        "task_classification": "web",
+        "browser_use_is_done": True,
+        "file_name": "a.csv",
+    }
+    assert asyncio.run(cache.astore("下載 A 公司財報", result))
+    assert asyncio.run(cache.alookup("下載 B 公司財報", "web")) is None
+    assert asyncio.run(cache.alookup("下載 A 公司財報", "web")) is not None
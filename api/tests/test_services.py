@@ -0,0 +1,39 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("dotenv")
+
+from services import ServiceRegistry, service  # noqa: E402
+
+
+class CountingRegistry(ServiceRegistry):
+    builds = 0
+
+    @service
+    def slow_service(self):
+        CountingRegistry.builds += 1
+        time.sleep(0.05)
+        return object()
+
+
+def test_service_is_built_once_across_threads():
+    registry = CountingRegistry()
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(registry.slow_service))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert CountingRegistry.builds == 1
+    assert all(result is results[0] for result in results)
+
+
+def test_is_built_does_not_build():
+    registry = ServiceRegistry()
+    assert not registry.is_built("synchronizer")
+    assert "synchronizer" not in vars(registry)
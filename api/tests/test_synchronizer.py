@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+import pytest
+
+node = pytest.importorskip("node")
+from langchain_core.runnables import RunnableLambda  # noqa: E402
+
+
+class FakeCollection:
+    def __init__(self):
+        self.records = {}  # id -> (embedding, document, metadata)
+
+    @staticmethod
+    def _matches(metadata, where):
+        if where is None:
+            return True
+        ((key, condition),) = where.items()
+        if isinstance(condition, dict):
+            return metadata.get(key) in condition["$in"]
+        return metadata.get(key) == condition
+
+    def get(self, where=None, include=(), limit=None):
+        ids = [
+            id
+            for id, (_, _, meta) in self.records.items()
+            if self._matches(meta, where)
+        ]
+        ids = ids[:limit] if limit else ids
+        return {
+            "ids": ids,
+            "embeddings": [self.records[id][0] for id in ids],
+            "documents": [self.records[id][1] for id in ids],
+            "metadatas": [self.records[id][2] for id in ids],
+        }
+
+    def upsert(self, ids, embeddings, metadatas, documents):
+        for id, embedding, metadata, document in zip(
+            ids, embeddings, metadatas, documents
+        ):
+            self.records[id] = (embedding, document, metadata)
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [[float(len(text))] for text in texts]
+
+
+class FakeVectorStore:
+    def __init__(self):
+        self._collection = FakeCollection()
+        self.embeddings = FakeEmbeddings()
+
+    def get(self, include=()):
+        return self._collection.get()
+
+    def delete(self, ids=None, where=None):
+        if ids is None:
+            ids = self._collection.get(where=where)["ids"]
+        for id in ids:
+            self._collection.records.pop(id, None)
+
+    def descriptions(self, path):
+        return [
+            document
+            for _, document, meta in self._collection.records.values()
+            if meta["file_name"] == path
+        ]
+
+
+class FakeLLM:
+    def __init__(self):
+        self.fail = False
+
+    def with_structured_output(self, schema):
+        def describe(prompt):
+            if self.fail:
+                raise RuntimeError("model unavailable")
+            return schema(content=prompt.to_messages()[-1].content[-40:])
+
+        return RunnableLambda(describe)
+
+
+def test_failed_description_keeps_the_stale_record(tmp_path):
+    directory = tmp_path / "files"
+    directory.mkdir()
+    path = directory / "notes.txt"
+    path.write_text("first version")
+    vectorstore, llm = FakeVectorStore(), FakeLLM()
+    synchronizer = node.Synchronizer(
+        observed_directory=str(directory),
+        vectorstore=vectorstore,
+        llm=llm,
+        manifest_path=str(tmp_path / "manifest.db"),
+        description_cache_path=None,
+        extraction_processes=0,
+        max_retries=0,
+    )
+    asyncio.run(synchronizer.sync())
+    (old,) = vectorstore.descriptions(str(path))
+
+    time.sleep(0.01)
+    path.write_text("second version")
+    llm.fail = True
+    asyncio.run(synchronizer.sync())
+    assert vectorstore.descriptions(str(path)) == [old]
+
+    llm.fail = False
+    asyncio.run(synchronizer.sync())
+    (new,) = vectorstore.descriptions(str(path))
+    assert new != old and "second version" in new
@@ -8,6 +8,8 @@ from pathlib import Path
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
+from recording_screenshots import ScreenshotRecorder
 
 
 # 設置log
@@ -42,6 +44,106 @@ def driver_config():
 def inject_script(driver_task):
     driver_task.execute_script("""
         (function() {
+            // 喚醒 Python 端等待中的 execute_async_script（見 wait_for_user_interactions）
+            window.__wakeInteractionWaiter = function() {
+                const waiter = window.__interactionWaiter;
+                if (waiter) {
+                    window.__interactionWaiter = null;
+                    waiter(window.userInteractions || []);
+                }
+            };
+            window.__waitForInteractions = function(done) {
+                if ((window.userInteractions && window.userInteractions.length) || window.exitInteractionLoop === true) {
+                    done(window.userInteractions || []);
+                    return;
+                }
+                window.__interactionWaiter = done;
+            };
+
+            // 互動紀錄以 append-only 的分段存進 sessionStorage（userInteractions:<n>），
+            // head/tail 指出尚未被 Python 取走的分段，每次寫入只序列化新增的互動。
+            const STORE = 'userInteractions';
+            const state = window.__recorderState = window.__recorderState || {
+                unsaved: [],
+                flushScheduled: false,
+                scroll: null,
+                lastScrollY: window.scrollY
+            };
+
+            function readCounter(name) {
+                return parseInt(sessionStorage.getItem(`${STORE}:${name}`) || '0', 10);
+            }
+
+            function loadPersistedInteractions() {
+                let interactions = [];
+                for (let i = readCounter('head'); i < readCounter('tail'); i++) {
+                    interactions = interactions.concat(JSON.parse(sessionStorage.getItem(`${STORE}:${i}`) || '[]'));
+                }
+                return interactions;
+            }
+
+            function flushInteractions() {
+                state.flushScheduled = false;
+                if (!state.unsaved.length) return;
+                const tail = readCounter('tail');
+                try {
+                    sessionStorage.setItem(`${STORE}:${tail}`, JSON.stringify(state.unsaved));
+                    sessionStorage.setItem(`${STORE}:tail`, String(tail + 1));
+                    state.unsaved = [];
+                } catch (e) {
+                    // 儲存空間不足時留在記憶體，下次再寫
+                    console.log('[WARN] Failed to persist interactions:', e);
+                }
+            }
+
+            function scheduleFlush() {
+                if (state.flushScheduled) return;
+                state.flushScheduled = true;
+                if (window.requestIdleCallback) {
+                    window.requestIdleCallback(flushInteractions, { timeout: 1000 });
+                } else {
+                    setTimeout(flushInteractions, 200);
+                }
+            }
+
+            // 同一方向的連續捲動在頁面內合併，只在停止或換方向時記錄一次
+            function flushPendingScroll() {
+                const scroll = state.scroll;
+                if (!scroll) return;
+                clearTimeout(scroll.timer);
+                state.scroll = null;
+                recordInteraction({ type: 'scroll', scrollY: scroll.y });
+            }
+            window.__flushPendingScroll = flushPendingScroll;
+
+            function recordInteraction(interaction) {
+                // 先送出進行中的捲動，保持事件順序
+                if (interaction.type !== 'scroll') flushPendingScroll();
+                window.userInteractions.push(interaction);
+                state.unsaved.push(interaction);
+                scheduleFlush();
+                window.__wakeInteractionWaiter();
+            }
+
+            // Python 取走前 count 筆後呼叫；之後才記錄到的互動保留並重新寫入
+            window.__drainInteractions = function(count) {
+                const remaining = (window.userInteractions || []).slice(count);
+                const tail = readCounter('tail');
+                for (let i = readCounter('head'); i < tail; i++) {
+                    sessionStorage.removeItem(`${STORE}:${i}`);
+                }
+                sessionStorage.setItem(`${STORE}:head`, String(tail));
+                window.userInteractions = remaining;
+                state.unsaved = remaining.slice();
+                if (remaining.length) scheduleFlush();
+            };
+
+            window.__finishRecording = function() {
+                flushPendingScroll();
+                window.exitInteractionLoop = true;
+                window.__wakeInteractionWaiter();
+            };
+
             function setupUserInteractionListener() {
                 if (window.__userInteractionInjected__ && window.__lastInjectedBody__ === document.body) {
                     console.log('[INFO] Script already injected, skipping.');
@@ -65,11 +167,13 @@ def inject_script(driver_task):
                 window.__userInteractionInjected__ = true;
                 window.__lastInjectedBody__ = document.body;
 
-                window.userInteractions = JSON.parse(sessionStorage.getItem('userInteractions') || '[]');
+                // 同一頁面重新掛載監聽器時沿用記憶體中的紀錄，換頁後才從 sessionStorage 還原
+                if (!Array.isArray(window.userInteractions)) {
+                    window.userInteractions = loadPersistedInteractions();
+                }
                 let lastRecordedValue = '';
                 let lastClickTimestamp = 0;
                 window.__processingPopstate__ = false;
-                let lastScrollY = window.scrollY;
 
                 const clickListener = function(event) {
                     if (event.__processed__) return;
@@ -91,8 +195,7 @@ def inject_script(driver_task):
                                 x: event.clientX,
                                 y: event.clientY
                             };
-                            window.userInteractions.push(interaction);
-                            sessionStorage.setItem('userInteractions', JSON.stringify(window.userInteractions));
+                            recordInteraction(interaction);
                         }
                         return; // 不做任何處理，確保下拉選單正常展開
                     }
@@ -117,12 +220,10 @@ def inject_script(driver_task):
 
                     if (target.tagName.toLowerCase() === 'a' && target.href) {
                         if (currentUrl === targetUrl) {
-                            window.userInteractions.push(interaction);
-                            sessionStorage.setItem('userInteractions', JSON.stringify(window.userInteractions));
+                            recordInteraction(interaction);
                         } else {
                             event.preventDefault();
-                            window.userInteractions.push(interaction);
-                            sessionStorage.setItem('userInteractions', JSON.stringify(window.userInteractions));
+                            recordInteraction(interaction);
                             let clicks = JSON.parse(localStorage.getItem('navigationClicks') || '[]');
                             clicks.push(interaction);
                             localStorage.setItem('navigationClicks', JSON.stringify(clicks));
@@ -131,15 +232,13 @@ def inject_script(driver_task):
                             }, 300);
                         }
                     } else if (target.closest('form') && window.location.href.includes('google.com')) {
-                        window.userInteractions.push(interaction);
-                        sessionStorage.setItem('userInteractions', JSON.stringify(window.userInteractions));
+                        recordInteraction(interaction);
                         event.preventDefault();
                         setTimeout(() => {
                             target.closest('form').dispatchEvent(new Event('submit', { bubbles: true, cancelable: true }));
                         }, 300);
                     } else {
-                        window.userInteractions.push(interaction);
-                        sessionStorage.setItem('userInteractions', JSON.stringify(window.userInteractions));
+                        recordInteraction(interaction);
                     }
                 };
                 window.__clickListener = clickListener;
@@ -148,7 +247,7 @@ def inject_script(driver_task):
                 // 添加對綠框覆蓋層的點擊監聽
                 const okPromptListener = function(event) {
                     if (event.target.id === 'ok_prompt_overlay') {
-                        window.exitInteractionLoop = true;
+                        window.__finishRecording();
                         event.stopPropagation();
                     }
                 };
@@ -165,23 +264,33 @@ def inject_script(driver_task):
                             id: event.target.id,
                             class: event.target.className
                         };
-                        window.userInteractions.push(interaction);
-                        sessionStorage.setItem('userInteractions', JSON.stringify(window.userInteractions));
+                        recordInteraction(interaction);
                     }
                 };
                 window.__inputListener = inputListener;
                 document.addEventListener('input', inputListener, true);
 
                 const scrollListener = function() {
-                    if (window.scrollY !== lastScrollY) {
-                        let interaction = {
-                            type: 'scroll',
-                            scrollY: window.scrollY
-                        };
-                        window.userInteractions.push(interaction);
-                        sessionStorage.setItem('userInteractions', JSON.stringify(window.userInteractions));
-                        lastScrollY = window.scrollY;
+                    const y = window.scrollY;
+                    const scroll = state.scroll;
+                    if (scroll) {
+                        const direction = Math.sign(y - scroll.y);
+                        if (direction === 0) return;
+                        if (scroll.direction && direction !== scroll.direction) {
+                            // 換方向：轉折點記成一筆，從目前位置開始新的一段
+                            flushPendingScroll();
+                            state.scroll = { y: y, direction: direction, timer: null };
+                        } else {
+                            scroll.y = y;
+                            scroll.direction = direction;
+                        }
+                    } else {
+                        if (y === state.lastScrollY) return;
+                        state.scroll = { y: y, direction: Math.sign(y - state.lastScrollY), timer: null };
                     }
+                    clearTimeout(state.scroll.timer);
+                    state.scroll.timer = setTimeout(flushPendingScroll, 250);
+                    state.lastScrollY = y;
                 };
                 window.__scrollListener = scrollListener;
                 window.addEventListener('scroll', scrollListener);
@@ -196,8 +305,7 @@ def inject_script(driver_task):
                             value: event.target.value.slice(0, 100),
                             selectedText: (event.target.selectedOptions[0]?.text || '').slice(0, 100)
                         };
-                        window.userInteractions.push(interaction);
-                        sessionStorage.setItem('userInteractions', JSON.stringify(window.userInteractions));
+                        recordInteraction(interaction);
                     }
                 };
                 window.__changeListener = changeListener;
@@ -215,8 +323,7 @@ def inject_script(driver_task):
                         url: window.location.href
                     };
                     if (!window.userInteractions.some(i => i.type === 'navigation' && i.url === interaction.url && Math.abs(new Date(i.timestamp) - new Date(interaction.timestamp)) < 100)) {
-                        window.userInteractions.push(interaction);
-                        sessionStorage.setItem('userInteractions', JSON.stringify(window.userInteractions));
+                        recordInteraction(interaction);
                         localStorage.setItem('pendingPopstateInteraction', JSON.stringify(interaction));
                         console.log('[INFO] Popstate interaction stored:', interaction);
                     }
@@ -237,8 +344,7 @@ def inject_script(driver_task):
                             url: window.location.href
                         };
                         if (!window.userInteractions.some(i => i.type === 'navigation' && i.url === interaction.url && Math.abs(new Date(i.timestamp) - new Date(interaction.timestamp)) < 100)) {
-                            window.userInteractions.push(interaction);
-                            sessionStorage.setItem('userInteractions', JSON.stringify(window.userInteractions));
+                            recordInteraction(interaction);
                             localStorage.setItem('pendingPopstateInteraction', JSON.stringify(interaction));
                             console.log('[INFO] Pageshow interaction stored:', interaction);
                         }
@@ -252,7 +358,8 @@ def inject_script(driver_task):
                 window.addEventListener('pageshow', pageshowListener);
 
                 const beforeunloadListener = function() {
-                    sessionStorage.setItem('userInteractions', JSON.stringify(window.userInteractions));
+                    flushPendingScroll();
+                    flushInteractions();
                     localStorage.setItem('navigationClicks', JSON.stringify([]));
                 };
                 window.__beforeunloadListener = beforeunloadListener;
@@ -263,14 +370,12 @@ def inject_script(driver_task):
                     const pendingPopstate = JSON.parse(localStorage.getItem('pendingPopstateInteraction') || 'null');
                     const currentUrl = window.location.href;
                     if (pendingPopstate && pendingPopstate.url !== currentUrl) {
-                        window.userInteractions.push(pendingPopstate);
-                        sessionStorage.setItem('userInteractions', JSON.stringify(window.userInteractions));
+                        recordInteraction(pendingPopstate);
                         localStorage.removeItem('pendingPopstateInteraction');
                     }
                     if (navClicks.length > 0) {
                         const lastClick = navClicks.pop();
-                        window.userInteractions.push(lastClick);
-                        sessionStorage.setItem('userInteractions', JSON.stringify(window.userInteractions));
+                        recordInteraction(lastClick);
                         localStorage.setItem('navigationClicks', JSON.stringify(navClicks));
                     }
                 })();
@@ -341,14 +446,50 @@ def get_user_interactions(driver_task):
     return interactions
 
 
-def clear_userInteractions(driver_task):
+def wait_for_user_interactions(
+    driver_task, timeout: float = 30, retry_delay: float = 0.5
+):
+    """
+    阻塞直到頁面記錄到新的互動或使用者點擊綠框結束，取代不停輪詢 get_user_interactions。
+    注入的腳本在每次互動時呼叫 execute_async_script 的回呼，因此閒置時不佔 CPU，
+    事件也能在數毫秒內送回。逾時或頁面跳轉中斷等待時回傳目前的紀錄（可能為空）；
+    其他錯誤（如 alert 開啟中）先等 retry_delay 秒再回傳空紀錄，避免呼叫端空轉。
+    """
+    driver_task.set_script_timeout(timeout)
+    try:
+        interactions = driver_task.execute_async_script(
+            """
+            const done = arguments[arguments.length - 1];
+            if (window.__waitForInteractions) {
+                window.__waitForInteractions(done);
+            } else {
+                done(window.userInteractions || []);
+            }
+            """
+        )
+    except TimeoutException:
+        return get_user_interactions(driver_task)
+    except Exception as e:
+        # 頁面跳轉會中斷等待中的腳本，由呼叫端重新注入後再等
+        logging.info(f"Interaction wait interrupted: {e}")
+        time.sleep(retry_delay)
+        return []
+    return interactions or []
+
+
+def clear_userInteractions(driver_task, count=None):
+    """移除已處理的前 count 筆互動（None 為全部），等待期間新增的互動會保留。"""
     try:
         script = """
-        window.userInteractions = [];
-        sessionStorage.setItem('userInteractions', JSON.stringify(window.userInteractions));
+        const count = arguments[0] === null ? Infinity : arguments[0];
+        if (window.__drainInteractions) {
+            window.__drainInteractions(count);
+        } else {
+            window.userInteractions = (window.userInteractions || []).slice(count);
+        }
         localStorage.setItem('navigationClicks', JSON.stringify([]));
         """
-        driver_task.execute_script(script)
+        driver_task.execute_script(script, count)
     except Exception as e:
         logging.warning(f"Failed to reset user interactions: {e}")
 
@@ -414,7 +555,11 @@ def inject_ok_prompt(driver):
 
             // 點擊邊框時設置退出標誌
             overlay.addEventListener('click', function() {
-                window.exitInteractionLoop = true;
+                if (window.__finishRecording) {
+                    window.__finishRecording();
+                } else {
+                    window.exitInteractionLoop = true;
+                }
             });
 
             document.body.appendChild(overlay);
@@ -448,6 +593,11 @@ def userInteraction_to_json_preprocessing(
     elif interaction["type"] == "navigation":
         clear_record = f"Go back to {interaction['url']}"
 
+    elif interaction["type"] == "change":
+        clear_record = (
+            f'Select "{interaction["selectedText"]}" in {interaction["target"]}'
+        )
+
     else:
         clear_record = "unknown interaction"
 
@@ -456,14 +606,31 @@ def userInteraction_to_json_preprocessing(
             "Interaction_Step": it,
             "Actual_Interaction": clear_record,
             "Executed_On_URL": interaction_execution_url,
+            # 保留原始事件，讓錄製內容可以直接重播
+            "Raw_Interaction": interaction,
         }
     )
 
 
 def userInteractions_recording(start_web, json_recording, record_dir):
     screenshot_dir = os.path.join(record_dir, "screenshot_recording")
-    os.makedirs(screenshot_dir, exist_ok=True)
+    # 截圖由瀏覽器壓縮，去重與寫檔在背景執行緒完成
+    screenshots = ScreenshotRecorder(screenshot_dir)
+    try:
+        record_userInteractions(start_web, json_recording, screenshots)
+    finally:
+        # 錄製中斷時也等待背景寫入剩下的截圖並寫出索引
+        screenshots.close()
 
+    # 最終記錄到json中
+    print("Recording finished. Saving to JSON...")
+    with open(
+        os.path.join(record_dir, "Interactions_recording.json"), "w", encoding="utf-8"
+    ) as record_file:
+        json.dump(json_recording, record_file, indent=4, ensure_ascii=False)
+
+
+def record_userInteractions(start_web, json_recording, screenshots: ScreenshotRecorder):
     # 瀏覽器設定
     options = driver_config()
 
@@ -523,8 +690,7 @@ def userInteractions_recording(start_web, json_recording, record_dir):
                 time.sleep(0.5)
 
         # 擷取螢幕截圖
-        img_path = os.path.join(screenshot_dir, "screenshot_{}.png".format(it))
-        driver_task.save_screenshot(img_path)
+        screenshots.capture(driver_task, it)
 
         # 注入 JavaScript 監聽用戶行為
         inject_script(driver_task)
@@ -543,7 +709,7 @@ def userInteractions_recording(start_web, json_recording, record_dir):
         interactions = []
         while not interactions:
             safe_inject(driver_task)
-            interactions = get_user_interactions(driver_task)
+            interactions = wait_for_user_interactions(driver_task)
 
             # 檢查是否完成紀錄要退出迴圈
             try:
@@ -728,7 +894,7 @@ def userInteractions_recording(start_web, json_recording, record_dir):
 
             # 清空userInteractions
             if len(interactions) != 0:
-                clear_userInteractions(driver_task)
+                clear_userInteractions(driver_task, len(interactions))
 
             # 打字或滑動buffer處理
             if (not it_output) and (
@@ -741,10 +907,7 @@ def userInteractions_recording(start_web, json_recording, record_dir):
                     and scroll_interaction_count == len(interactions)
                 )
             ):
-                img_path = os.path.join(
-                    screenshot_dir, "screenshot_{}.png".format(it + 1)
-                )
-                driver_task.save_screenshot(img_path)
+                screenshots.capture(driver_task, it + 1)
                 interactions = []
 
             # 跳轉頁面
@@ -811,16 +974,9 @@ def userInteractions_recording(start_web, json_recording, record_dir):
                             )
                             it_output = True
                     # 清空userInteractions
-                    clear_userInteractions(driver_task)
+                    clear_userInteractions(driver_task, len(interactions))
                 break
 
-    # 最終記錄到json中
-    print("Recording finished. Saving to JSON...")
-    with open(
-        os.path.join(record_dir, "Interactions_recording.json"), "w", encoding="utf-8"
-    ) as record_file:
-        json.dump(json_recording, record_file, indent=4, ensure_ascii=False)
-
 
 # --------------------------------------------------------------------
 
@@ -1,17 +1,50 @@
 from pathlib import Path
 from typing import Optional
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.image import MIMEImage
-from email.mime.application import MIMEApplication
-import smtplib
 import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from pathlib import Path
 from langchain.tools import tool
 
 load_dotenv()
 
+# 阻塞工作（SMTP、Selenium 錄製）用的有界執行緒池，避免卡住 event loop
+_blocking_executors: dict[str, ThreadPoolExecutor] = {}
+BLOCKING_POOL_SIZES: dict[str, int] = {
+    "default": int(os.getenv("BLOCKING_WORKERS", "8")),
+    # each recording holds a browser window for minutes
+    "recorder": int(os.getenv("RECORDER_WORKERS", "2")),
+}
+
+
+def _get_blocking_executor(pool: str) -> ThreadPoolExecutor:
+    if pool not in _blocking_executors:
+        _blocking_executors[pool] = ThreadPoolExecutor(
+            max_workers=BLOCKING_POOL_SIZES.get(pool, BLOCKING_POOL_SIZES["default"]),
+            thread_name_prefix=f"blocking-{pool}",
+        )
+    return _blocking_executors[pool]
+
+
+async def run_blocking(func, *args, pool: str = "default", **kwargs):
+    """
+    Run a blocking function on a bounded thread pool and await its result.
+
+    Args:
+        func: The blocking callable.
+        pool (str): Name of the pool, long-running work gets its own pool so it
+            cannot starve short calls.
+
+    Returns:
+        The return value of func.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_blocking_executor(pool), functools.partial(func, *args, **kwargs)
+    )
+
 
 def is_in_extenstions(path: Path, extensions: list = None) -> bool:
     """
@@ -34,8 +67,12 @@ def is_in_extenstions(path: Path, extensions: list = None) -> bool:
     return path.suffix in extensions
 
 
+# send_email_with_attachment 失敗時回傳的訊息開頭
+EMAIL_ERROR_PREFIX = "An error occurred"
+
+
 @tool
-def send_email_with_attachment(recipient: str, file_path: str) -> None:
+def send_email_with_attachment(recipient: str, file_path: str) -> str:
     """
     Sends an email with an attachment using a Gmail account.
 
@@ -43,35 +80,13 @@ def send_email_with_attachment(recipient: str, file_path: str) -> None:
     - recipient (str): The recipient's email address.
     - file_path (str): The file path of the attachment to be sent.
     """
-    FROM_EMAIL = os.getenv("GMAIL_ACCOUNT")
-    APP_PASSWORD = os.getenv("GOOGLE_APP_PASSWORD")
-    try:
-        # Create the email content
-        msg = MIMEMultipart("mixed")
-        msg["Subject"] = "Test Email"
-        msg["From"] = FROM_EMAIL
-        msg["To"] = recipient
-
-        # Attach the file
-        with open(file_path, "rb") as f:
-            part = MIMEApplication(f.read())
-            part.add_header(
-                "Content-Disposition", "attachment", filename=Path(file_path).name
-            )
-            msg.attach(part)
-
-        # Connect to Gmail SMTP server and send the email
-        smtp = smtplib.SMTP("smtp.gmail.com", 587)
-        smtp.ehlo()
-        smtp.starttls()
-        smtp.login(FROM_EMAIL, APP_PASSWORD)
-        status = smtp.sendmail(FROM_EMAIL, recipient, msg.as_string())
-        smtp.quit()
-
-        if status == {}:
-            return "Email sent successfully!"
-        else:
-            return f"Email sending failed: {status}"
+    # 寫入持久化寄件佇列後立即返回，由背景執行緒透過共用的 SMTP 連線寄出
+    from mail_queue import get_mail_queue
 
+    try:
+        message_id: str = get_mail_queue().enqueue(
+            recipient=recipient, file_path=file_path
+        )
     except Exception as e:
-        return f"An error occurred while sending the email: {str(e)}"
+        return f"{EMAIL_ERROR_PREFIX} while queueing the email: {str(e)}"
+    return f"Email queued for delivery (id: {message_id})"
@@ -0,0 +1,100 @@
+import time
+import uuid
+from typing import List, Optional, Tuple
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+
+
+class BatchedVectorStoreWriter:
+    """
+    Summary:
+        Buffers documents and writes them to a Chroma collection in batches.
+        Each batch costs one `embed_documents` call and one `upsert` call.
+
+        A batch is flushed once it reaches `max_batch_size` documents or
+        `max_batch_chars` characters of page content. A failing batch is retried
+        and then split in half, so one bad document does not drop the others.
+
+    Args:
+        vectorstore (Chroma): the target vector store.
+        max_batch_size (int): maximum number of documents per batch.
+        max_batch_chars (int): maximum total characters of page content per batch.
+        max_retries (int): retries of a whole batch before it is split.
+        retry_delay (float): base delay in seconds, doubled on every retry.
+    """
+
+    def __init__(
+        self,
+        vectorstore: Chroma,
+        max_batch_size: int = 64,
+        max_batch_chars: int = 32_000,
+        max_retries: int = 3,
+        retry_delay: float = 1.0,
+    ):
+        self._vectorstore: Chroma = vectorstore
+        self._max_batch_size: int = max_batch_size
+        self._max_batch_chars: int = max_batch_chars
+        self._max_retries: int = max_retries
+        self._retry_delay: float = retry_delay
+        self._pending: List[Tuple[str, Document]] = []
+        self._pending_chars: int = 0
+        self.written: int = 0
+        self.failed: List[Tuple[str, Document]] = []
+
+    def add(self, document: Document, id: Optional[str] = None) -> None:
+        """Queue one document, flushing first if it would overflow the batch."""
+        size = len(document.page_content)
+        if self._pending and (
+            len(self._pending) >= self._max_batch_size
+            or self._pending_chars + size > self._max_batch_chars
+        ):
+            self.flush()
+        self._pending.append((id or str(uuid.uuid4()), document))
+        self._pending_chars += size
+
+    def add_documents(
+        self, documents: List[Document], ids: Optional[List[str]] = None
+    ) -> None:
+        for i, document in enumerate(documents):
+            self.add(document, ids[i] if ids else None)
+
+    def flush(self) -> int:
+        """Write all queued documents and return how many were written."""
+        batch, self._pending, self._pending_chars = self._pending, [], 0
+        if not batch:
+            return 0
+        written = self._write(batch)
+        self.written += written
+        return written
+
+    def _upsert(self, batch: List[Tuple[str, Document]]) -> None:
+        ids = [id for id, _ in batch]
+        texts = [document.page_content for _, document in batch]
+        metadatas = [document.metadata or None for _, document in batch]
+        embeddings = self._vectorstore.embeddings.embed_documents(texts)
+        self._vectorstore._collection.upsert(
+            ids=ids, embeddings=embeddings, metadatas=metadatas, documents=texts
+        )
+
+    def _write(
+        self, batch: List[Tuple[str, Document]], retries: Optional[int] = None
+    ) -> int:
+        retries = self._max_retries if retries is None else retries
+        for attempt in range(retries + 1):
+            try:
+                self._upsert(batch)
+                return len(batch)
+            except Exception as e:
+                error = e
+                if attempt < retries:
+                    time.sleep(self._retry_delay * 2**attempt)
+
+        if len(batch) == 1:
+            print(f"寫入向量資料庫失敗 ({batch[0][0]}): {error}")
+            self.failed.extend(batch)
+            return 0
+        # the batch kept failing, bisect it once per level to isolate bad documents
+        middle = len(batch) // 2
+        return self._write(batch[:middle], retries=0) + self._write(
+            batch[middle:], retries=0
+        )